@@ -0,0 +1,231 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import plistlib
+import re
+import shlex
+import shutil
+import subprocess
+import tempfile
+from collections import Counter
+from functools import lru_cache
+from xml.parsers.expat import ExpatError
+
+from compile_command_utils import iter_compile_commands, CompileCommandsWriter
+from lru_eviction import mark_used, evict_least_recently_used
+
+LOG = logging.getLogger("ANALYSIS_CACHE")
+
+DEFAULT_ANALYSIS_CACHE_DIR = os.getenv("SPACOMP_ANALYSIS_CACHE",
+                                       f"{pathlib.Path(__file__).parent.absolute()}/.analysis_cache")
+DEFAULT_ANALYSIS_CACHE_SIZE_BYTES = 4 * 1024 * 1024 * 1024
+CACHE_MISSES_DATABASE_NAME = "compile_commands_cache_misses.json"
+CACHE_HIT_SOURCES_NAME = "cache_hit_sources.json"
+# Written by CodeChecker analyze, maps its result plists to the source files they were produced for
+CODECHECKER_METADATA_NAME = "metadata.json"
+INCLUDE_DIRECTIVE = re.compile(rb'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE)
+INCLUDE_PATH_FLAGS = ("-I", "-iquote", "-isystem", "-idirafter")
+
+
+@lru_cache(maxsize=None)
+def get_tool_version(version_command):
+    """Output of e.g. (binary, '--version'), 'unknown' if it cannot be run"""
+    try:
+        res = subprocess.run(list(version_command), capture_output=True)
+    except OSError:
+        return "unknown"
+    return res.stdout.decode("utf-8", errors="replace").strip() or "unknown"
+
+
+def get_compile_arguments(entry):
+    return entry["arguments"] if "arguments" in entry else shlex.split(entry["command"])
+
+
+def get_source_path(entry):
+    return os.path.normpath(os.path.join(entry["directory"], entry["file"]))
+
+
+def get_include_dirs(entry):
+    include_dirs = []
+    arguments = get_compile_arguments(entry)
+    for i, argument in enumerate(arguments):
+        for flag in INCLUDE_PATH_FLAGS:
+            if argument == flag and i + 1 < len(arguments):
+                include_dirs.append(arguments[i + 1])
+            elif argument.startswith(flag) and len(argument) > len(flag):
+                include_dirs.append(argument[len(flag):])
+    return [os.path.normpath(os.path.join(entry["directory"], d)) for d in include_dirs]
+
+
+class _FileHasher:
+    """Content hashes and include lists of source files, each file read only once per analysis"""
+    def __init__(self):
+        self.hashes = {}
+        self.includes = {}
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+        except OSError:
+            content = None
+        self.hashes[path] = hashlib.sha1(content).hexdigest() if content is not None else "missing"
+        self.includes[path] = INCLUDE_DIRECTIVE.findall(content) if content else []
+
+    def file_hash(self, path):
+        if path not in self.hashes:
+            self._read(path)
+        return self.hashes[path]
+
+    def get_dependencies(self, source_path, include_dirs):
+        """
+        The source file and the headers it includes, transitively, as far as they can be found.
+        Conditional includes are followed regardless of their condition, which can only make the key stricter
+        """
+        dependencies = {source_path}
+        stack = [source_path]
+        while stack:
+            path = stack.pop()
+            self.file_hash(path)
+            for include in self.includes[path]:
+                include = include.decode("utf-8", errors="replace")
+                for directory in [os.path.dirname(path), *include_dirs]:
+                    candidate = os.path.normpath(os.path.join(directory, include))
+                    if os.path.isfile(candidate):
+                        if candidate not in dependencies:
+                            dependencies.add(candidate)
+                            stack.append(candidate)
+                        break
+        return sorted(dependencies)
+
+
+def get_codechecker_result_sources(result_folder):
+    """Source file per result plist name, from the metadata.json CodeChecker writes. Empty for other analyzers"""
+    try:
+        with open(os.path.join(result_folder, CODECHECKER_METADATA_NAME), "r") as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    tools = metadata.get("tools", []) if isinstance(metadata, dict) else []
+    return {os.path.basename(plist): os.path.normpath(source)
+            for tool in tools for plist, source in tool.get("result_source_files", {}).items()}
+
+
+def get_plist_sources(result_folder, plist_names, sources):
+    """
+    The one of sources every result plist was produced for, going by CodeChecker's metadata.json where it has the
+    plist, else by the files the plist refers to. Plists referring to none or several of sources are left out
+    """
+    result_sources = get_codechecker_result_sources(result_folder)
+    plist_sources = {}
+    for plist_name in plist_names:
+        source = result_sources.get(plist_name)
+        if source is None:
+            try:
+                with open(os.path.join(result_folder, plist_name), "rb") as f:
+                    files = plistlib.load(f).get("files", [])
+            except (OSError, ValueError, ExpatError) as e:
+                LOG.warning(f"Cannot read result file {plist_name}: {e}")
+                continue
+            matches = set(os.path.normpath(f) for f in files) & sources
+            source = matches.pop() if len(matches) == 1 else None
+        if source in sources:
+            plist_sources[plist_name] = source
+    return plist_sources
+
+
+class AnalysisCache:
+    """
+    Results of analyzing single translation units, keyed on the compile command entry,
+    the content of the source file and of the headers it includes, and the analyzer name, version and flags.
+    Only analyzers whose results for a TU do not depend on other TUs (so no CTU) can be cached this way.
+    Result files are attributed to a TU by the source files they refer to, see get_plist_sources
+    """
+    def __init__(self, cache_dir=DEFAULT_ANALYSIS_CACHE_DIR, max_size_bytes=DEFAULT_ANALYSIS_CACHE_SIZE_BYTES):
+        self.cache_dir = str(pathlib.Path(cache_dir).absolute())
+        self.max_size_bytes = max_size_bytes
+        pathlib.Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def iter_entry_keys(compile_commands, analyzer_key):
+        """Yields every compile command entry together with its cache key"""
+        hasher = _FileHasher()
+        for entry in compile_commands:
+            canonical_entry = json.dumps({"directory": entry["directory"], "file": entry["file"],
+                                          "arguments": get_compile_arguments(entry)}, sort_keys=True)
+            digest = hashlib.sha1(f"{analyzer_key}\0{canonical_entry}".encode("utf-8"))
+            for dependency in hasher.get_dependencies(get_source_path(entry), get_include_dirs(entry)):
+                digest.update(f"\0{dependency}\0{hasher.file_hash(dependency)}".encode("utf-8"))
+            yield entry, digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def restore_results(self, compile_command_database, analyzer_key, result_folder):
+        """
+        Copies the cached results of all unchanged TUs into result_folder and writes the entries that still need
+        analysis into a compile command database there. Returns its path, or None if every TU was cached
+        """
+        os.makedirs(result_folder, exist_ok=True)
+        misses_database = os.path.join(result_folder, CACHE_MISSES_DATABASE_NAME)
+        hit_sources = []
+        with CompileCommandsWriter(misses_database) as misses:
+            for entry, key in self.iter_entry_keys(iter_compile_commands(compile_command_database), analyzer_key):
+                cached = self._entry_path(key)
+                if not os.path.isdir(cached):
+                    misses.write(entry)
+                    continue
+                hit_sources.append(get_source_path(entry))
+                for result_file in os.listdir(cached):
+                    shutil.copy2(os.path.join(cached, result_file), result_folder)
+                mark_used(cached)
+        LOG.info(f"{len(hit_sources)} of {len(hit_sources) + misses.count} translation units "
+                 f"of {compile_command_database} cached")
+        with open(os.path.join(result_folder, CACHE_HIT_SOURCES_NAME), "w") as f:
+            json.dump(hit_sources, f)
+        if not misses.count:
+            os.remove(misses_database)
+            return None
+        return misses_database
+
+    def store_results(self, result_folder, analyzer_key):
+        """Caches the results of the TUs that were analysed into result_folder"""
+        misses_database = os.path.join(result_folder, CACHE_MISSES_DATABASE_NAME)
+        if not os.path.exists(misses_database):
+            return
+        with open(os.path.join(result_folder, CACHE_HIT_SOURCES_NAME), "r") as f:
+            hit_sources = json.load(f)
+        # Results restored from the cache are in result_folder as well, so their sources are matched too
+        source_counts = Counter(hit_sources)
+        source_counts.update(get_source_path(entry) for entry in iter_compile_commands(misses_database))
+        result_files = [f for f in os.listdir(result_folder) if f.endswith(".plist")]
+        source_result_files = {}
+        for result_file, source in get_plist_sources(result_folder, result_files, set(source_counts)).items():
+            source_result_files.setdefault(source, []).append(result_file)
+        for entry, key in self.iter_entry_keys(iter_compile_commands(misses_database), analyzer_key):
+            source = get_source_path(entry)
+            tu_result_files = source_result_files.get(source)
+            if source_counts[source] > 1 or not tu_result_files:
+                # Results of a file compiled more than once cannot be told apart, and a TU without results that
+                # can be attributed to it might have some that could not. Either way it is analysed again next time
+                continue
+            tmp_entry = tempfile.mkdtemp(dir=self.cache_dir, suffix=".tmp")
+            for result_file in tu_result_files:
+                shutil.copy2(os.path.join(result_folder, result_file), tmp_entry)
+            cached = self._entry_path(key)
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            shutil.rmtree(cached, ignore_errors=True)
+            os.replace(tmp_entry, cached)
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits into max_size_bytes"""
+        entries = []
+        for prefix in os.scandir(self.cache_dir):
+            if not prefix.is_dir() or prefix.name.endswith(".tmp"):
+                continue
+            for entry in os.scandir(prefix.path):
+                entries.append((entry.path, sum(f.stat().st_size for f in os.scandir(entry.path))))
+        evict_least_recently_used(entries, self.max_size_bytes, lambda path: shutil.rmtree(path, ignore_errors=True))
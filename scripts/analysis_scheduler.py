@@ -0,0 +1,242 @@
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import resource
+import signal
+import time
+import traceback
+from multiprocessing.connection import wait
+
+from proc_stat import iter_process_stats
+
+SCRIPT_PATH = pathlib.Path(__file__).parent.absolute()
+DEFAULT_HISTORY_FILE = os.getenv("SPACOMP_JOB_HISTORY", f"{SCRIPT_PATH}/.job_durations.json")
+# Weight of the latest run when updating the historical duration of a job
+HISTORY_SMOOTHING = 0.5
+# How often the CPU time and memory of the process trees of jobs with limits are checked
+LIMIT_CHECK_INTERVAL_SECONDS = 1.0
+
+LOG = logging.getLogger("SCHEDULER")
+
+
+class AnalysisJob:
+    """
+    One analyzer run on one project.
+    func is called with no arguments in a fresh process. The job process and everything it spawns may together
+    use at most memory_limit_bytes of resident memory and cpu_time_limit_seconds of CPU time, else the whole tree is
+    killed. cpus is the number of cores the job is expected to keep busy
+    """
+    def __init__(self, project, analyzer, func, cpus=1, memory_limit_bytes=None, cpu_time_limit_seconds=None):
+        self.project = project
+        self.analyzer = analyzer
+        self.func = func
+        self.cpus = cpus
+        self.memory_limit_bytes = memory_limit_bytes
+        self.cpu_time_limit_seconds = cpu_time_limit_seconds
+
+    @property
+    def key(self):
+        return f"{self.project}:{self.analyzer}"
+
+    def __str__(self):
+        return f"{self.analyzer} on {self.project}"
+
+
+class JobResult:
+    def __init__(self, job, result=None, error=None, duration=0.0, exitcode=0):
+        self.job = job
+        self.result = result
+        self.error = error
+        self.duration = duration
+        self.exitcode = exitcode
+
+    @property
+    def succeeded(self):
+        return self.error is None and self.exitcode == 0
+
+
+def _set_soft_limit(limit, value):
+    _, hard = resource.getrlimit(limit)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(limit, (value, hard))
+
+
+def _run_job(job, connection):
+    """
+    Entry point of the job process. The rlimits only stop a single process of the job that runs away on its own
+    between two checks of the scheduler, which enforces the limits on the job's process tree as a whole
+    """
+    if job.memory_limit_bytes:
+        _set_soft_limit(resource.RLIMIT_AS, job.memory_limit_bytes)
+    if job.cpu_time_limit_seconds:
+        _set_soft_limit(resource.RLIMIT_CPU, job.cpu_time_limit_seconds)
+    try:
+        connection.send((job.func(), None))
+    except BaseException:
+        connection.send((None, traceback.format_exc()))
+    finally:
+        connection.close()
+
+
+def read_process_table():
+    """(parent pid, CPU seconds, resident bytes) per pid of every live process"""
+    return {stat.pid: (stat.parent_pid, stat.cpu_seconds, stat.rss_bytes) for stat in iter_process_stats()}
+
+
+def get_process_tree(processes, root_pid):
+    """root_pid and all of its live descendants in a read_process_table result"""
+    children = {}
+    for pid, (parent, _, _) in processes.items():
+        children.setdefault(parent, []).append(pid)
+    tree = []
+    stack = [root_pid] if root_pid in processes else []
+    while stack:
+        pid = stack.pop()
+        tree.append(pid)
+        stack.extend(children.get(pid, ()))
+    return tree
+
+
+def get_exceeded_limit(job, processes, root_pid):
+    """Description of the limit the process tree of job exceeds, None if it stays within all of them"""
+    tree = get_process_tree(processes, root_pid)
+    cpu_seconds = sum(processes[pid][1] for pid in tree)
+    rss_bytes = sum(processes[pid][2] for pid in tree)
+    if job.cpu_time_limit_seconds and cpu_seconds > job.cpu_time_limit_seconds:
+        return f"CPU time limit of {job.cpu_time_limit_seconds}s exceeded ({cpu_seconds:.0f}s)"
+    if job.memory_limit_bytes and rss_bytes > job.memory_limit_bytes:
+        return f"memory limit of {job.memory_limit_bytes // 2 ** 20} MiB exceeded ({rss_bytes // 2 ** 20} MiB)"
+    return None
+
+
+def kill_process_tree(processes, root_pid):
+    # Tools may run in sessions of their own, so they are killed one by one rather than by process group
+    for pid in get_process_tree(processes, root_pid):
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def load_job_history(history_file):
+    if not history_file or not os.path.exists(history_file):
+        return {}
+    try:
+        with open(history_file, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        LOG.warning("Ignoring unreadable job history " + history_file)
+        return {}
+
+
+def save_job_history(history_file, history):
+    tmp_history_file = f"{history_file}.tmp"
+    with open(tmp_history_file, "w") as f:
+        json.dump(history, f, indent=1, sort_keys=True)
+    os.replace(tmp_history_file, history_file)
+
+
+class AnalysisScheduler:
+    """
+    Runs analysis jobs in parallel, each in its own process.
+    At most max_jobs jobs run at the same time, and together they may not claim more than cpu_capacity cores.
+    Jobs are started longest first, going by how long they took in earlier runs (kept in history_file)
+    """
+    def __init__(self, max_jobs=None, cpu_capacity=None, history_file=DEFAULT_HISTORY_FILE):
+        self.cpu_capacity = cpu_capacity or os.cpu_count()
+        self.max_jobs = max_jobs or self.cpu_capacity
+        self.history_file = history_file
+        self.history = load_job_history(history_file)
+
+    def expected_duration(self, job):
+        """Historical duration of a job. Jobs never seen before are assumed to be as long as the longest known one"""
+        if job.key in self.history:
+            return self.history[job.key]
+        return max(self.history.values(), default=0.0)
+
+    def record_duration(self, job, duration):
+        previous = self.history.get(job.key)
+        self.history[job.key] = duration if previous is None else \
+            HISTORY_SMOOTHING * duration + (1 - HISTORY_SMOOTHING) * previous
+
+    def run(self, jobs, on_complete=None):
+        """
+        Runs all jobs and returns their JobResults in order of completion.
+        on_complete is called with every JobResult as soon as its job finished
+        """
+        context = multiprocessing.get_context("fork")
+        # Longest first, ties keep the order the jobs were given in
+        pending = [(-self.expected_duration(job), i, job) for i, job in enumerate(jobs)]
+        heapq.heapify(pending)
+        running = {}
+        limit_errors = {}
+        free_cpus = self.cpu_capacity
+        results = []
+        while pending or running:
+            # Start the longest jobs that fit into the free cores, the others stay queued
+            deferred = []
+            while pending and len(running) < self.max_jobs:
+                entry = heapq.heappop(pending)
+                job = entry[2]
+                cpus = min(job.cpus, self.cpu_capacity)
+                if cpus > free_cpus:
+                    deferred.append(entry)
+                    continue
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(target=_run_job, args=(job, sender), name=str(job))
+                process.start()
+                sender.close()
+                free_cpus -= cpus
+                running[receiver] = (job, process, cpus, time.monotonic())
+                LOG.info(f"Started {job}")
+            for entry in deferred:
+                heapq.heappush(pending, entry)
+
+            # Waiting on the pipes rather than the processes, so a job is never stuck sending a large result
+            limited = [r for r, (job, *_) in running.items()
+                       if (job.memory_limit_bytes or job.cpu_time_limit_seconds) and r not in limit_errors]
+            ready = wait(list(running), timeout=LIMIT_CHECK_INTERVAL_SECONDS if limited else None)
+            if limited:
+                # One scan of /proc per check, shared by all running jobs
+                processes = read_process_table()
+                for receiver in limited:
+                    job, process = running[receiver][:2]
+                    exceeded = get_exceeded_limit(job, processes, process.pid)
+                    if exceeded:
+                        LOG.error(f"Killing {job}: {exceeded}")
+                        limit_errors[receiver] = exceeded
+                        kill_process_tree(processes, process.pid)
+            for receiver in ready:
+                job, process, cpus, start = running.pop(receiver)
+                try:
+                    result, error = receiver.recv()
+                except EOFError:
+                    result, error = None, limit_errors.get(receiver, "Job process died without a result")
+                limit_errors.pop(receiver, None)
+                receiver.close()
+                process.join()
+                duration = time.monotonic() - start
+                free_cpus += cpus
+                job_result = JobResult(job, result, error, duration, process.exitcode)
+                if job_result.succeeded:
+                    LOG.info(f"Finished {job} in {duration:.1f}s")
+                    self.record_duration(job, duration)
+                else:
+                    LOG.error(f"{job} failed after {duration:.1f}s: {error}")
+                results.append(job_result)
+                if on_complete:
+                    on_complete(job_result)
+        if self.history_file:
+            save_job_history(self.history_file, self.history)
+        return results
+
+
+def make_job(args, project, analyzer, func):
+    """Creates an AnalysisJob with the budgets given on the command line"""
+    return AnalysisJob(project, analyzer, func, cpus=args.job_cpus,
+                       memory_limit_bytes=args.job_memory_limit * 1024 * 1024 or None,
+                       cpu_time_limit_seconds=args.job_cpu_time_limit or None)
@@ -1,6 +1,13 @@
+import asyncio
+import copy
+import time
 from datetime import datetime
 import os
 from codechecker_interface import gen_convert_to_codechecker_command
+from framework_utils import time_invocation_log, time_invocation_log_async, ExecutionContext
+from invocation_runner import run_invocations_concurrently
+from compile_db_sharding import write_shards, merge_result_folders, record_shard_durations, load_tu_history, \
+    DEFAULT_TU_HISTORY_FILE
 
 
 class Analyzer:
@@ -9,22 +16,116 @@ class Analyzer:
         self.has_ctu = has_ctu
         self.conversion_required = conversion_required
         self.languages = languages
+        # Set to an analysis_cache.AnalysisCache to only analyse translation units that changed since the last run
+        self.analysis_cache = None
 
     def gen_analysis_commands(self, project_dir, project_name):
         """Method for getting a general analysis command, e.g. when running it on a target folder"""
         raise NotImplemented
 
-    def gen_analysis_commands_from_compile_commands_file(self, project_dir, project_name, compile_command_database):
+    def gen_analysis_commands_from_compile_commands_file(self, project_dir, project_name, compile_command_database,
+                                                          result_folder=None):
         """Method for running specifically on compile command file"""
         raise NotImplemented
 
-    def gen_analysis_command_wrapper(self, target_path, project_name):
+    def get_version(self):
+        return "unknown"
+
+    def get_analysis_flags(self):
+        """Flags that influence the results, part of the analysis cache key"""
+        return []
+
+    @property
+    def per_tu_cacheable(self):
+        """Whether the results for a translation unit only depend on that translation unit"""
+        return not self.has_ctu
+
+    def get_analysis_cache_key(self):
+        return f"{self.name}{self.ctu_suffix}\0{self.get_version()}\0{' '.join(self.get_analysis_flags())}"
+
+    def restore_cached_results(self, compile_command_database, result_folder):
+        """
+        Puts the cached results of unchanged translation units into result_folder, and returns the compile command
+        database the analyzer still has to run on, None if there is nothing left to analyse
+        """
+        if self.analysis_cache is None or not self.per_tu_cacheable:
+            return compile_command_database
+        return self.analysis_cache.restore_results(compile_command_database, self.get_analysis_cache_key(),
+                                                   result_folder)
+
+    def gen_analysis_command_wrapper(self, target_path, project_name, result_folder=None):
         if os.path.isfile(target_path):
             project_dir = os.path.split(target_path)[0]
-            return self.gen_analysis_commands_from_compile_commands_file(project_dir, project_name, target_path)
+            return self.gen_analysis_commands_from_compile_commands_file(project_dir, project_name, target_path,
+                                                                          result_folder)
         else:
             return self.gen_analysis_commands(target_path, project_name)
 
+    def run_analysis(self, target_path, project_name, language=None, timeout=None, result_folder=None):
+        """
+        Runs the analysis commands for target_path one after the other, each recorded in the metrics database.
+        Results of compile command databases go to result_folder, by default a new folder next to the database.
+        Returns the result folder (None if the analyzer does not report it), or False if a command failed
+        """
+        commands = self.gen_analysis_command_wrapper(target_path, project_name, result_folder)
+        commands, result_folder = commands if isinstance(commands, tuple) else (commands, None)
+        project_dir = os.path.split(target_path)[0] if os.path.isfile(target_path) else target_path
+        language = language or self.languages[0]
+        with ExecutionContext(project_dir) as context:
+            for command in commands:
+                res = time_invocation_log(language, f"{self.name}{self.ctu_suffix}", command, context,
+                                          timeout, project_dir)
+                if res.returncode != 0:
+                    return False
+        if self.analysis_cache is not None and self.per_tu_cacheable and result_folder:
+            self.analysis_cache.store_results(result_folder, self.get_analysis_cache_key())
+        return result_folder
+
+    def run_analysis_sharded(self, compile_command_database, project_name, shard_count, language=None,
+                             timeout=None, history_file=DEFAULT_TU_HISTORY_FILE, result_folder=None):
+        """
+        Same as run_analysis on a compile command database, but split into shard_count shards of about equal cost,
+        each analysed by its own tool process at the same time. The results of the shards are merged into one
+        result folder. Analyzers whose results for a translation unit depend on other ones are run unsharded
+        """
+        if shard_count <= 1 or not self.per_tu_cacheable:
+            return self.run_analysis(compile_command_database, project_name, language, timeout, result_folder)
+        project_dir = os.path.split(compile_command_database)[0]
+        result_folder = result_folder or self.get_analysis_output_folderpath(project_dir)
+        remaining_database = self.restore_cached_results(compile_command_database, result_folder)
+        if remaining_database is None:
+            return result_folder
+        tool = f"{self.name}{self.ctu_suffix}"
+        shard_databases = write_shards(remaining_database, shard_count, result_folder,
+                                       load_tu_history(history_file, tool))
+        shard_result_folders = [os.path.join(os.path.dirname(d), "results") for d in shard_databases]
+        # Cached results were restored for the whole database already
+        shard_analyzer = copy.copy(self)
+        shard_analyzer.analysis_cache = None
+        shard_commands = [shard_analyzer.gen_analysis_commands_from_compile_commands_file(
+            project_dir, project_name, shard_database, shard_result_folder)[0]
+            for shard_database, shard_result_folder in zip(shard_databases, shard_result_folders)]
+        language = language or self.languages[0]
+
+        async def run_shard(commands, context):
+            start = time.monotonic()
+            for command in commands:
+                res = await time_invocation_log_async(language, tool, command, context, timeout, project_dir)
+                if res.returncode != 0:
+                    return None
+            return time.monotonic() - start
+
+        with ExecutionContext(project_dir) as context:
+            shard_durations = asyncio.run(run_invocations_concurrently(
+                [run_shard(commands, context) for commands in shard_commands], len(shard_commands)))
+        if any(d is None or isinstance(d, BaseException) for d in shard_durations):
+            return False
+        record_shard_durations(history_file, tool, shard_databases, shard_durations)
+        merge_result_folders(shard_result_folders, result_folder)
+        if self.analysis_cache is not None:
+            self.analysis_cache.store_results(result_folder, self.get_analysis_cache_key())
+        return result_folder
+
     def get_conversion_commands(self, original_path):
         """Returns the list of commands to run to convert analysis run from original path to the output directory"""
         if not self.conversion_required:
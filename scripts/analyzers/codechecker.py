@@ -1,23 +1,34 @@
 import os
 import shutil
 from codechecker_interface import gen_convert_to_codechecker_command
-from analyzer_parent import Analyzer
+from analyzers.analyzer_parent import Analyzer
+from analysis_cache import get_tool_version
 
 CODECHECKER_PATH = os.getenv("CODECHECKER_PATH", "CodeChecker")     # This one should hopefully be sourced through venv
 
 
-class CppCheck(Analyzer):
-    def __init__(self, run_ctu):
+class CodeChecker(Analyzer):
+    def __init__(self, run_ctu, binary=CODECHECKER_PATH):
         super().__init__("codechecker", run_ctu, False, ["C", "C++"])
+        self.binary = binary
 
     def gen_analysis_commands(self, project_dir, project_name):
         """Method for getting a general analysis command, e.g. when running it on a target folder"""
         raise NotImplemented
 
-    def gen_analysis_commands_from_compile_commands_file(self, project_dir, project_name, compile_command_database):
-        result_folder = self.get_analysis_output_folderpath(project_dir)
-        command = [CODECHECKER_PATH, "analyze", "-o", result_folder]
-        if self.run_ctu:
-            command.append("--ctu-all")
+    def get_version(self):
+        return get_tool_version((self.binary, "version"))
+
+    def get_analysis_flags(self):
+        return ["--ctu-all"] if self.has_ctu else []
+
+    def gen_analysis_commands_from_compile_commands_file(self, project_dir, project_name, compile_command_database,
+                                                          result_folder=None):
+        result_folder = result_folder or self.get_analysis_output_folderpath(project_dir)
+        compile_command_database = self.restore_cached_results(compile_command_database, result_folder)
+        if compile_command_database is None:
+            return [], result_folder
+        command = [self.binary, "analyze", "-o", result_folder]
+        command.extend(self.get_analysis_flags())
         command.append(compile_command_database)
         return [command], result_folder
\ No newline at end of file
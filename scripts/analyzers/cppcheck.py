@@ -3,9 +3,11 @@ import shutil
 import subprocess
 import xml.etree.ElementTree as ET
 from codechecker_interface import gen_convert_to_codechecker_command
+from analysis_cache import get_tool_version
 from .analyzer_parent import Analyzer
 
 CPPCHECK_PATH = os.getenv("CPPCHECK_PATH", shutil.which("cppcheck"))
+CPPCHECK_ANALYSIS_FLAGS = ["--enable=all", "--inconclusive"]
 
 
 def cppcheck_to_codechecker_warning_mapping():
@@ -49,11 +51,21 @@ class CppCheck(Analyzer):
         """Method for getting a general analysis command, e.g. when running it on a target folder"""
         raise NotImplemented
 
-    def gen_analysis_commands_from_compile_commands_file(self, project_dir, project_name, compile_command_database):
-        result_folder = self.get_analysis_output_folderpath(project_dir)
+    def get_version(self):
+        return get_tool_version((CPPCHECK_PATH, "--version"))
+
+    def get_analysis_flags(self):
+        return CPPCHECK_ANALYSIS_FLAGS
+
+    def gen_analysis_commands_from_compile_commands_file(self, project_dir, project_name, compile_command_database,
+                                                          result_folder=None):
+        result_folder = result_folder or self.get_analysis_output_folderpath(project_dir)
+        compile_command_database = self.restore_cached_results(compile_command_database, result_folder)
+        if compile_command_database is None:
+            return [], result_folder
         # Since CppCheck does not create output folders automatically, we must make sure it exists
         return [["mkdir", "-p", result_folder],
-                [CPPCHECK_PATH, "--enable=all", "--inconclusive",
+                [CPPCHECK_PATH, *CPPCHECK_ANALYSIS_FLAGS,
                  f"--project={compile_command_database}",  # compile commands to use
                  f"--plist-output={result_folder}"]
                 ], result_folder
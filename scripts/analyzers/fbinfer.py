@@ -39,6 +39,11 @@ class FBInfer(Analyzer):
     def __init__(self):
         super().__init__("fbinfer", False, True, ["C", "C++", "Java"])
 
+    @property
+    def per_tu_cacheable(self):
+        # Infer analyses procedures with the summaries of their callees, which may live in any translation unit
+        return False
+
     def gen_analysis_commands(self, project_dir, project_name):
         def fbinfer_command_on_dir(resultdir, targetdir):
             LOG.info(f"FB Infer running on {targetdir}")
@@ -56,12 +61,11 @@ class FBInfer(Analyzer):
                     pathlib.Path(cmake_build_dir).joinpath(CMAKE_COMPILE_COMMAND_DEFAULT):
                     LOG.debug("CMake folder or compilation database not found, rerunning basic cmake config")
                     subprocess.run(["mkdir", "-p", cmake_build_dir])
-                    os.chdir(cmake_build_dir)
-                    cmake_result = subprocess.run(["cmake", "-DCMAKE_EXPORT_COMPILE_COMMANDS=ON", ".."])
+                    cmake_result = subprocess.run(["cmake", "-DCMAKE_EXPORT_COMPILE_COMMANDS=ON", ".."],
+                                                  cwd=cmake_build_dir)
                     if cmake_result.returncode != 0:
                         LOG.error("Something went wrong during CMake run. Skipping Infer invocation ...")
                         return []
-                    os.chdir("..")
                 return [["infer", "run", "--compilation-database",
                          f"{cmake_build_dir}/{CMAKE_COMPILE_COMMAND_DEFAULT}"]]
             else:
@@ -77,8 +81,9 @@ class FBInfer(Analyzer):
         result_folder = self.get_analysis_output_folderpath(project_dir)
         return fbinfer_command_on_dir(result_folder, project_dir)
 
-    def gen_analysis_commands_from_compile_commands_file(self, project_dir, project_name, compile_command_database):
-        result_folder = self.get_analysis_output_folderpath(project_dir)
+    def gen_analysis_commands_from_compile_commands_file(self, project_dir, project_name, compile_command_database,
+                                                          result_folder=None):
+        result_folder = result_folder or self.get_analysis_output_folderpath(project_dir)
         return [[INFER_PATH, "run",
                "-o", result_folder,  # output folder
                "--compilation-database", compile_command_database]
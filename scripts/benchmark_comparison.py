@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import pathlib
+import plistlib
+import random
+import resource
+import multiprocessing
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from compact_report import CompactReport
+from my_plist_parser import get_plist_reports_tool_pair, get_duplicate_unique_list_pairs, \
+    collapse_reports_toolpair_list, group_reports_by_main_file
+
+SCRIPT_PATH = pathlib.Path(__file__).parent.absolute()
+FIXTURE_PATH = SCRIPT_PATH.joinpath("tests/plist")
+DEFAULT_SYNTHETIC_SIZES = [10 ** 4, 10 ** 5, 10 ** 6]
+SYNTHETIC_REPORTS_PER_FILE = 50
+SYNTHETIC_REPORTS_PER_PLIST = 50
+SYNTHETIC_CHECKS = [f"synthetic-check-{i}" for i in range(40)]
+
+
+# How often the RSS of the benchmark process is sampled while a stage runs
+RSS_SAMPLE_INTERVAL_SECONDS = 0.01
+
+
+def get_current_rss_kb():
+    """Current resident set size of this process in KiB"""
+    with open("/proc/self/statm", "r") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def get_children_peak_rss_kb():
+    """Peak resident set size of the largest (waited for) child of this process, in KiB"""
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+
+class RssSampler:
+    """
+    Samples the RSS of this process from a background thread while in the with block.
+    Unlike ru_maxrss, which only ever grows over the process lifetime, peak_kb is the peak of the block alone
+    """
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while True:
+            self.peak_kb = max(self.peak_kb, get_current_rss_kb())
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self.peak_kb = get_current_rss_kb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self._stop.set()
+        self._thread.join()
+        self.peak_kb = max(self.peak_kb, get_current_rss_kb())
+
+
+def get_version():
+    res = subprocess.run(["git", "-C", str(SCRIPT_PATH), "describe", "--always", "--dirty"], capture_output=True)
+    return res.stdout.decode("utf-8").strip() if res.returncode == 0 else "unknown"
+
+
+def generate_synthetic_reports(report_count, tool_count, seed=0):
+    """
+    Generates (report, tool) pairs spread over report_count / SYNTHETIC_REPORTS_PER_FILE source files.
+    About a third of the reports are found again by another tool on the same position,
+    so the duplicate detection has something to group
+    """
+    rng = random.Random(seed)
+    tools = [f"tool{i}" for i in range(tool_count)]
+    file_count = max(1, report_count // SYNTHETIC_REPORTS_PER_FILE)
+    report_tool_list = []
+    while len(report_tool_list) < report_count:
+        report = CompactReport(f"/synthetic/src/file_{rng.randrange(file_count)}.cpp",
+                               rng.randint(1, 2000), rng.randint(0, 80),
+                               rng.choice(SYNTHETIC_CHECKS), "synthetic report")
+        report_tool_list.append((report, rng.choice(tools)))
+        if rng.random() < 0.33:
+            duplicate = CompactReport(report.file_path, report.line, report.col,
+                                      rng.choice(SYNTHETIC_CHECKS), "synthetic report")
+            report_tool_list.append((duplicate, rng.choice(tools)))
+    return report_tool_list[:report_count]
+
+
+def write_synthetic_result_dirs(report_tool_list, output_dir):
+    """Writes the reports as one {tool}_results directory of plist files per tool"""
+    reports_per_tool = {}
+    for report, tool in report_tool_list:
+        reports_per_tool.setdefault(tool, []).append(report)
+    for tool, reports in reports_per_tool.items():
+        result_dir = os.path.join(output_dir, f"{tool}_results_synthetic")
+        os.makedirs(result_dir, exist_ok=True)
+        for start in range(0, len(reports), SYNTHETIC_REPORTS_PER_PLIST):
+            chunk = reports[start:start + SYNTHETIC_REPORTS_PER_PLIST]
+            files = sorted(set(r.file_path for r in chunk))
+            file_index = {f: i for i, f in enumerate(files)}
+            location = [{'line': r.line, 'col': r.col, 'file': file_index[r.file_path]} for r in chunk]
+            diagnostics = [{'category': 'synthetic', 'check_name': r.check_name, 'description': r.description,
+                            'location': loc, 'path': [{'kind': 'event', 'location': loc, 'message': r.description}]}
+                           for r, loc in zip(chunk, location)]
+            with open(os.path.join(result_dir, f"synthetic_{start}.plist"), "wb") as f:
+                plistlib.dump({'diagnostics': diagnostics, 'files': files}, f)
+
+
+def time_stage(func):
+    """Runs func, returning its result, the seconds it took and the peak RSS (KiB) of this process meanwhile"""
+    with RssSampler() as sampler:
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+    return result, elapsed, sampler.peak_kb
+
+
+def benchmark_result_dirs(result_dirs, compact, workers):
+    """
+    Times parsing, duplicate detection and tool grouping separately, returning
+    (stage, seconds, peak RSS, peak RSS of parsing workers) tuples
+    """
+    measurements = []
+    plist_reports_tool_map, elapsed, peak_rss_kb = time_stage(
+        lambda: [get_plist_reports_tool_pair(d, workers=workers, compact=compact) for d in result_dirs])
+    measurements.append(("get_plist_reports_tool_pair", elapsed, peak_rss_kb, get_children_peak_rss_kb()))
+    filename_reports_key_val = group_reports_by_main_file(plist_reports_tool_map)
+    measurements.extend(benchmark_comparison(filename_reports_key_val))
+    return measurements
+
+
+def benchmark_comparison(filename_reports_key_val):
+    measurements = []
+    _, elapsed, peak_rss_kb = time_stage(lambda: [get_duplicate_unique_list_pairs(reports)
+                                                  for reports in filename_reports_key_val.values()])
+    measurements.append(("get_duplicate_unique_list_pairs", elapsed, peak_rss_kb, None))
+    _, elapsed, peak_rss_kb = time_stage(lambda: [collapse_reports_toolpair_list(reports)
+                                                  for reports in filename_reports_key_val.values()])
+    measurements.append(("collapse_reports_toolpair_list", elapsed, peak_rss_kb, None))
+    return measurements
+
+
+def benchmark_synthetic(size, tool_count, compact, workers, synthetic_plists):
+    """
+    Full reports only come from parsing plists, so without compact the synthetic reports
+    always go through plist files
+    """
+    report_tool_list = generate_synthetic_reports(size, tool_count)
+    if synthetic_plists or not compact:
+        with tempfile.TemporaryDirectory(prefix="synthetic_results_") as tmp_dir:
+            write_synthetic_result_dirs(report_tool_list, tmp_dir)
+            del report_tool_list
+            result_dirs = sorted(pathlib.Path(tmp_dir).glob("./*results*"))
+            return benchmark_result_dirs(result_dirs, compact, workers)
+    filename_reports_key_val = {}
+    for report, tool in report_tool_list:
+        filename_reports_key_val.setdefault(report.file_path, set()).add((report, tool))
+    del report_tool_list
+    return benchmark_comparison(filename_reports_key_val)
+
+
+def run_isolated(func, *args):
+    """
+    Runs func in a freshly spawned process, so its memory use is not mixed up with that of earlier benchmarks
+    (a forked process would start out with the memory of this one)
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(func, *args).result()
+
+
+def run_benchmarks(sizes, tool_count, compact, workers, synthetic_plists, output):
+    common = {"version": get_version(), "timestamp": datetime.now().isoformat(timespec="seconds"),
+              "python": sys.version.split()[0], "compact": compact, "workers": workers}
+
+    def emit(benchmark, report_count, tools, measurements):
+        for stage, seconds, peak_rss_kb, workers_peak_rss_kb in measurements:
+            record = dict(common, benchmark=benchmark, reports=report_count, tools=tools, stage=stage,
+                          seconds=round(seconds, 6), peak_rss_kb=peak_rss_kb,
+                          workers_peak_rss_kb=workers_peak_rss_kb)
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+
+    fixture_dirs = sorted(FIXTURE_PATH.glob("./*results*"))
+    if fixture_dirs:
+        emit("tests/plist", None, len(fixture_dirs),
+             run_isolated(benchmark_result_dirs, fixture_dirs, compact, workers))
+
+    for size in sizes:
+        emit("synthetic", size, tool_count,
+             run_isolated(benchmark_synthetic, size, tool_count, compact, workers, synthetic_plists))
+
+
+def get_benchmark_args():
+    parser = argparse.ArgumentParser(description='Benchmark the plist report comparison pipeline. '
+                                                 'Results are written as one JSON record per line')
+    parser.add_argument('--sizes', '-s', type=int, nargs='*', default=DEFAULT_SYNTHETIC_SIZES,
+                        help='Number of synthetic reports per benchmark run')
+    parser.add_argument('--tools', '-t', type=int, default=3, help='Number of synthetic tools')
+    parser.add_argument('--full-reports', action='store_true',
+                        help='Parse into full CodeChecker reports instead of compact ones '
+                             '(synthetic reports then always go through plist files)')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='Plist parsing workers')
+    parser.add_argument('--synthetic-plists', action='store_true',
+                        help='Write synthetic reports to plist files, so parsing is benchmarked as well')
+    parser.add_argument('--output', '-o', default='-', help='File to append results to, - for stdout')
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_benchmark_args().parse_args()
+    if args.output == '-':
+        run_benchmarks(args.sizes, args.tools, not args.full_reports, args.workers, args.synthetic_plists,
+                       sys.stdout)
+    else:
+        with open(args.output, 'a') as out:
+            run_benchmarks(args.sizes, args.tools, not args.full_reports, args.workers, args.synthetic_plists, out)
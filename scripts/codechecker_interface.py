@@ -1,9 +1,11 @@
+import logging
 import os
 import subprocess
 import sys
 from datetime import datetime
 from dotenv import load_dotenv
 import pathlib
+from report_conversion import can_convert, convert_analyzer_output, get_codechecker_report_hash_function
 SCRIPT_PATH = pathlib.Path(__file__).parent.absolute()
 env_conf = pathlib.Path(f"{SCRIPT_PATH}/.env")
 if env_conf.exists() and env_conf.is_file():
@@ -15,42 +17,87 @@ CODECHECKER_PATH = f"{USER}/codechecker"
 CODECHECKER_SCRIPTS_DIR = f"{CODECHECKER_PATH}/codechecker-common"
 CODECHECKER_BIN_PATH = f"{CODECHECKER_PATH}/build/CodeChecker/bin"
 CODECHECKER_RESULTCONVERTER_PATH = f"{CODECHECKER_BIN_PATH}/report-converter"
-CODECHECKER_MAINSCRIPT_PATH = f"{CODECHECKER_BIN_PATH}/CodeChecker"
+# Python packages of the CodeChecker build, report-converter's among them
+CODECHECKER_LIB_PATH = f"{CODECHECKER_PATH}/build/CodeChecker/lib/python3"
+# Can point to a stand-in script, e.g. to test storing without a CodeChecker server
+CODECHECKER_MAINSCRIPT_PATH = os.getenv("CODECHECKER_MAINSCRIPT_PATH", f"{CODECHECKER_BIN_PATH}/CodeChecker")
 # CODECHECKER_SKIPFILE_PATH = f"{USER}/spa_comparison/C_Cpp/codechecker_skipfile"
 sys.path.extend(CODECHECKER_SCRIPTS_DIR)
+sys.path.append(CODECHECKER_LIB_PATH)
+
+LOG = logging.getLogger("CODECHECKER_INTERFACE")
 
 CODECHECKER_SERVER_ADDRESS = os.getenv("CODECHECKER_SERVER_ADDRESS", "localhost:8001")
 
+# When set (see set_store_queue), results are handed to this queue instead of being stored right away
+_store_queue = None
+
+
+def set_store_queue(store_queue):
+    """Makes store_to_codechecker submit to store_queue (a store_queue.StoreQueue), None to store synchronously"""
+    global _store_queue
+    _store_queue = store_queue
+
+
+def gen_store_command(result_paths, store_project_name, store_server_product="Default",
+                      server_address=CODECHECKER_SERVER_ADDRESS):
+    return [CODECHECKER_MAINSCRIPT_PATH, "store", *result_paths,
+            "--name", store_project_name,
+            "--url", f'{server_address}/{store_server_product}']
+
 
 def store_to_codechecker(result_path, store_project_name, store_server_product="Default"):
     """Simple wrapper around CodeChecker store command,
     allowing to set name of the run (project name)
-    and which product on the server to store results to."""
-    return subprocess.run([CODECHECKER_MAINSCRIPT_PATH, "store", result_path,
-                           "--name", store_project_name,
-                           "--url", f'{CODECHECKER_SERVER_ADDRESS}/{store_server_product}']).returncode == 0
+    and which product on the server to store results to.
+    Returns whether storing succeeded. With a store queue set, the result is only queued and a future of
+    whether storing it succeeded is returned instead, failures are reported when the queue is drained"""
+    if _store_queue is not None:
+        return _store_queue.submit(result_path, store_project_name, store_server_product)
+    return subprocess.run(gen_store_command([result_path], store_project_name,
+                                            store_server_product)).returncode == 0
 
 def gen_convert_to_codechecker_command(analysis_output, analyzer_name, converted_output):
     return [CODECHECKER_RESULTCONVERTER_PATH, "-t",
             analyzer_name, "-o", converted_output, analysis_output]
 
 
-def convert_and_store_to_codechecker(analysis_outputpath, conversion_output,
-                                     analyzer, project_name, store_name_suffix="", server_product_name="Default"):
+def convert_to_codechecker(analysis_outputpath, analyzer, conversion_output, source_root=None):
+    """
+    Writes the results of analyzer as CodeChecker plists to conversion_output.
+    Formats report_conversion knows are converted in-process when CodeChecker's report hash can be imported,
+    so the stored reports are identical to report-converter ones. Everything else goes through the
+    report-converter binary, as does output the in-process conversion fails on
+    """
+    report_hash = get_codechecker_report_hash_function() if can_convert(analyzer) else None
+    if report_hash:
+        try:
+            convert_analyzer_output(analysis_outputpath, analyzer, source_root).write_plists(conversion_output,
+                                                                                             report_hash)
+            return True
+        except Exception:
+            LOG.exception(f"In-process conversion of {analysis_outputpath} failed, using report-converter")
     res = subprocess.run(gen_convert_to_codechecker_command(analysis_outputpath, analyzer, conversion_output))
-    if res.returncode != 0:
+    return res.returncode == 0
+
+
+def convert_and_store_to_codechecker(analysis_outputpath, conversion_output,
+                                     analyzer, project_name, store_name_suffix="", server_product_name="Default",
+                                     source_root=None):
+    if not convert_to_codechecker(analysis_outputpath, analyzer, conversion_output, source_root):
         return False
     return store_to_codechecker(conversion_output,
                                 f'{project_name}_{analyzer}{store_name_suffix}',
                                 server_product_name)
 
 
-def analysis_post_process(result_folder, tool_name, project_name, server_product_name="Default"):
+def analysis_post_process(result_folder, tool_name, project_name, server_product_name="Default", source_root=None):
     """For tools that need to do post-processing on results before submitting to the framework"""
 
     converted_result_folder = os.path.join(result_folder, tool_name + '_results_converted')
     return convert_and_store_to_codechecker(result_folder, converted_result_folder, tool_name,
-                                            project_name, server_product_name)
+                                            project_name, server_product_name=server_product_name,
+                                            source_root=source_root)
 
 
 def generate_analysis_output_folderpath(base_path, tool_name, generate_folder=True):
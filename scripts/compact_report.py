@@ -0,0 +1,72 @@
+from functools import lru_cache
+
+
+def _parse_plist_file(plist_file):
+    # Imported here, so compact reports can be created and compared without CodeChecker being available
+    from codechecker_common.plist_parser import parse_plist_file
+    return parse_plist_file(plist_file)
+
+
+# Loading several reports of the same plist should only parse it once
+_load_source_plist = lru_cache(maxsize=8)(_parse_plist_file)
+
+
+class CompactReport:
+    """
+    Light-weight stand-in for codechecker_common.report.Report, holding only what report comparison needs.
+    The full report (bug path, notes, macro expansions) is parsed again from its source plist on first access,
+    which should only happen for reports that actually end up in some output
+    """
+    __slots__ = ('file_path', 'line', 'col', 'check_name', 'description', 'source', 'index', '_report')
+
+    def __init__(self, file_path, line, col, check_name, description, source=None, index=-1):
+        self.file_path = file_path
+        self.line = line
+        self.col = col
+        self.check_name = check_name
+        self.description = description
+        self.source = source
+        self.index = index
+        self._report = None
+
+    @staticmethod
+    def from_report(report, source, index):
+        return CompactReport(report.file_path, report.line, report.col, report.check_name, report.description,
+                             str(source), index)
+
+    def __getstate__(self):
+        # A loaded full report is not worth shipping between processes or into caches
+        return self.file_path, self.line, self.col, self.check_name, self.description, self.source, self.index
+
+    def __setstate__(self, state):
+        self.file_path, self.line, self.col, self.check_name, self.description, self.source, self.index = state
+        self._report = None
+
+    def load(self):
+        """Returns the full report this record was extracted from"""
+        if self._report is None:
+            if self.source is None:
+                raise ValueError(f"{self} was not extracted from a plist file and cannot be loaded")
+            self._report = _load_source_plist(self.source)[1][self.index]
+        return self._report
+
+    @property
+    def bug_path(self):
+        return self.load().bug_path
+
+    @property
+    def notes(self):
+        return self.load().notes
+
+    @property
+    def macro_expansions(self):
+        return self.load().macro_expansions
+
+    def __repr__(self):
+        return f"CompactReport({self.file_path}:{self.line}:{self.col}, {self.check_name}, {self.description!r})"
+
+
+def parse_plist_file_compact(plist_file):
+    """Same as parse_plist_file, but returns compact reports"""
+    files, reports = _parse_plist_file(plist_file)
+    return files, [CompactReport.from_report(report, plist_file, index) for index, report in enumerate(reports)]
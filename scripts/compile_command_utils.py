@@ -6,7 +6,9 @@ import sys
 import glob
 import argparse
 from line_of_code_counter import LoCData, CLOC_BIN
+from loc_cache import LoCCache
 COMPILE_COMMAND_DEFAULT = "compile_commands.json"
+COMPILE_COMMANDS_READ_CHUNK_SIZE = 1024 * 1024
 import argh
 
 def find_compilation_databases(rootdir):
@@ -23,14 +25,95 @@ def is_testware_translation_unit(compile_command_entry):
             "test" in str(compile_command_entry["file"]).lower())
 
 
+def iter_compile_commands(compile_command_path, chunk_size=COMPILE_COMMANDS_READ_CHUNK_SIZE):
+    """
+    Yields the entries of a compile command database one at a time.
+    The file is decoded incrementally, chunk_size characters at a time, so memory use does not grow with its size
+    """
+    decoder = json.JSONDecoder()
+    with open(compile_command_path, "r") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+        started = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            entry = None
+            if pos < len(buffer):
+                if not started:
+                    if buffer[pos] != "[":
+                        raise ValueError(f"{compile_command_path} is not a compile command database")
+                    started = True
+                    pos += 1
+                    continue
+                if buffer[pos] == "]":
+                    return
+                try:
+                    entry, pos = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # Most likely the entry continues in the next chunk
+                    if eof:
+                        raise
+            elif eof:
+                raise ValueError(f"Unexpected end of compile command database {compile_command_path}")
+            if entry is None:
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+            else:
+                yield entry
+
+
+class CompileCommandsWriter:
+    """Writes a compile command database entry by entry"""
+    def __init__(self, compile_command_path):
+        self.file = open(compile_command_path, "w")
+        self.file.write("[")
+        self.count = 0
+
+    def write(self, entry):
+        self.file.write(("," if self.count else "") + "\n" + json.dumps(entry))
+        self.count += 1
+
+    def close(self):
+        self.file.write("\n]\n")
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def partition_compile_commands(compile_command_path, filter_func, matching_path, non_matching_path=None):
+    """
+    Writes the entries of a compile command database that filter_func accepts to matching_path,
+    and the others to non_matching_path if given, in a single pass. Returns the number of entries of both
+    """
+    non_matching = 0
+    with CompileCommandsWriter(matching_path) as matching_writer:
+        non_matching_writer = CompileCommandsWriter(non_matching_path) if non_matching_path else None
+        try:
+            for entry in iter_compile_commands(compile_command_path):
+                if filter_func(entry):
+                    matching_writer.write(entry)
+                else:
+                    non_matching += 1
+                    if non_matching_writer:
+                        non_matching_writer.write(entry)
+        finally:
+            if non_matching_writer:
+                non_matching_writer.close()
+    return matching_writer.count, non_matching
+
+
 def filter_compile_command(compile_command_path,
                            filter_func=is_testware_translation_unit,
                            stripped_compile_commands_path="compile_commands_filtered.json"):
-    with open(compile_command_path, "r") as data:
-        ccom = json.load(data)
-        ccom_filtered = list(filter(filter_func, ccom))
-        with open(stripped_compile_commands_path, "w+") as outfile:
-            outfile.write(json.dumps(ccom_filtered))
+    partition_compile_commands(compile_command_path, filter_func, stripped_compile_commands_path)
 
 def get_files_for_counting(compile_command_filepath, filter=None):
     """
@@ -41,12 +124,11 @@ def get_files_for_counting(compile_command_filepath, filter=None):
     """
     filter_true = []
     filter_false = []
-    comp_commands = json.load(open(compile_command_filepath, "r"))
-    if filter:
-        filter_true = [(cc['directory'], cc['file']) for cc in comp_commands if filter(cc)]
-        filter_false = [(cc['directory'], cc['file']) for cc in comp_commands if not filter(cc)]
-    else:
-        filter_true = [(cc['directory'], cc['file']) for cc in comp_commands]
+    for cc in iter_compile_commands(compile_command_filepath):
+        if filter is None or filter(cc):
+            filter_true.append((cc['directory'], cc['file']))
+        else:
+            filter_false.append((cc['directory'], cc['file']))
     return filter_true, filter_false
 
 def generate_clocscript_from_comp_command(comp_command, script_output_dir):
@@ -68,8 +150,26 @@ def generate_clocscript_from_comp_command(comp_command, script_output_dir):
         f.write("\tDUMMY.html > testware_LoC.txt")
 
 
+def count_loc_from_comp_command(comp_command, output_dir, workers=None):
+    """
+    Counts production and testware LoC of a compile command database in-process, written in cloc's xml format
+    to the production_LoC.txt and testware_LoC.txt the script of generate_clocscript_from_comp_command writes.
+    Both are summed from the LoC cache, so only files that changed since the last count are read
+    """
+    loc_cache = LoCCache()
+    testware, productioncode = get_files_for_counting(comp_command, is_testware_translation_unit)
+    pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+    for file_name, entries in [("production_LoC.txt", productioncode), ("testware_LoC.txt", testware)]:
+        files = sorted(set(f if pathlib.Path(f).exists() else f'{d}/{f}' for d, f in entries))
+        counts = loc_cache.count_files([f for f in files if pathlib.Path(f).exists()], workers,
+                                       str(pathlib.Path(comp_command).absolute().parent))
+        loc_data = LoCData.make_from_counts(counts, comp_command) or LoCData({}, 0, comp_command)
+        with open(f"{output_dir}/{file_name}", "w") as f:
+            f.write(loc_data.to_cloc_xml())
+
+
 parser = argh.ArghParser()
-parser.add_commands([generate_clocscript_from_comp_command, find_compilation_databases])
+parser.add_commands([generate_clocscript_from_comp_command, count_loc_from_comp_command, find_compilation_databases])
 
 if __name__ == "__main__":
     argh.dispatch(parser)
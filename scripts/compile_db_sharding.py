@@ -0,0 +1,186 @@
+import heapq
+import json
+import logging
+import os
+import pathlib
+import shutil
+
+from analysis_scheduler import load_job_history, save_job_history, HISTORY_SMOOTHING
+from analysis_cache import get_source_path
+from line_of_code_counter import cloc_by_file
+from compile_command_utils import iter_compile_commands, CompileCommandsWriter
+
+LOG = logging.getLogger("SHARDING")
+
+SCRIPT_PATH = pathlib.Path(__file__).parent.absolute()
+DEFAULT_TU_HISTORY_FILE = os.getenv("SPACOMP_TU_HISTORY", f"{SCRIPT_PATH}/.tu_durations.json")
+SHARD_DIRECTORY_NAME = "shards"
+# Written by CodeChecker analyze next to its results, see merge_codechecker_metadata
+CODECHECKER_METADATA_NAME = "metadata.json"
+
+
+def get_tu_weights(sources, history=None):
+    """
+    Expected analysis cost of every source file. Historical durations are used where known; the other files are
+    weighted by their LoC, scaled to seconds by the LoC/s seen for the known ones
+    """
+    history = history or {}
+    loc = cloc_by_file(sources)
+    known = [s for s in sources if s in history]
+    known_loc = sum(loc[s] for s in known)
+    seconds_per_loc = sum(history[s] for s in known) / known_loc if known and known_loc else 1.0
+    return [history[s] if s in history else max(loc[s], 1) * seconds_per_loc for s in sources]
+
+
+def split_balanced(weights, shard_count):
+    """Indices per shard, greedily giving the heaviest remaining entry to the lightest shard"""
+    shard_count = max(1, min(shard_count, len(weights)))
+    shards = [(0.0, i, []) for i in range(shard_count)]
+    for index in sorted(range(len(weights)), key=lambda i: weights[i], reverse=True):
+        load, i, members = heapq.heappop(shards)
+        members.append(index)
+        heapq.heappush(shards, (load + weights[index], i, members))
+    return [members for _, _, members in sorted(shards, key=lambda shard: shard[1])]
+
+
+def write_shards(compile_command_database, shard_count, output_dir, history=None):
+    """Splits a compile command database into shard_count balanced ones below output_dir, returns their paths"""
+    # Two passes over the database, so only the weights are ever held in memory, not the entries
+    weights = get_tu_weights([get_source_path(entry) for entry in iter_compile_commands(compile_command_database)],
+                             history)
+    shards = split_balanced(weights, shard_count)
+    shard_of_entry = {}
+    shard_paths = []
+    for i, members in enumerate(shards):
+        shard_dir = os.path.join(output_dir, SHARD_DIRECTORY_NAME, f"shard_{i}")
+        os.makedirs(shard_dir, exist_ok=True)
+        shard_paths.append(os.path.join(shard_dir, "compile_commands.json"))
+        shard_of_entry.update((m, i) for m in members)
+        LOG.info(f"Shard {i}: {len(members)} translation units, expected cost {sum(weights[m] for m in members):.1f}")
+    writers = [CompileCommandsWriter(shard_path) for shard_path in shard_paths]
+    try:
+        for index, entry in enumerate(iter_compile_commands(compile_command_database)):
+            writers[shard_of_entry[index]].write(entry)
+    finally:
+        for writer in writers:
+            writer.close()
+    return shard_paths
+
+
+def _merge_analyzer_statistics(merged, statistics):
+    for key, value in statistics.items():
+        if key in merged and isinstance(value, (int, list)) and not isinstance(value, bool):
+            merged[key] = merged[key] + value
+        else:
+            merged.setdefault(key, value)
+
+
+def merge_codechecker_metadata(metadatas, result_folder, plist_names):
+    """
+    Merges the CodeChecker metadata.json contents of the shards into that of a single run writing to result_folder.
+    Counts and source lists are summed up, the analysis spans from the first begin to the last end.
+    plist_names maps (shard index, plist name) to the name the plist got in result_folder.
+    Only the (version 2) metadata with a list of tools is merged, of others the first one is kept
+    """
+    merged = None
+    for i, metadata in metadatas:
+        if not isinstance(metadata, dict) or not isinstance(metadata.get("tools"), list) or not metadata["tools"]:
+            merged = merged or metadata
+            continue
+        tool = metadata["tools"][0]
+        result_source_files = {os.path.join(result_folder, plist_names.get((i, os.path.basename(plist)),
+                                                                             os.path.basename(plist))): source
+                               for plist, source in tool.get("result_source_files", {}).items()}
+        if merged is None or not isinstance(merged.get("tools"), list):
+            merged = dict(metadata, tools=[dict(tool, output_path=result_folder,
+                                                result_source_files=result_source_files)])
+            continue
+        merged_tool = merged["tools"][0]
+        merged_tool["result_source_files"].update(result_source_files)
+        for key in ("action_num", "skipped"):
+            if key in tool:
+                merged_tool[key] = merged_tool.get(key, 0) + tool[key]
+        timestamps = tool.get("timestamps", {})
+        merged_timestamps = merged_tool.setdefault("timestamps", dict(timestamps))
+        if "begin" in timestamps:
+            merged_timestamps["begin"] = min(merged_timestamps.get("begin", timestamps["begin"]), timestamps["begin"])
+        if "end" in timestamps:
+            merged_timestamps["end"] = max(merged_timestamps.get("end", timestamps["end"]), timestamps["end"])
+        merged_analyzers = merged_tool.setdefault("analyzers", {})
+        for analyzer, analyzer_info in tool.get("analyzers", {}).items():
+            merged_analyzer = merged_analyzers.setdefault(analyzer, {})
+            for key, value in analyzer_info.items():
+                if key == "analyzer_statistics":
+                    _merge_analyzer_statistics(merged_analyzer.setdefault(key, {}), value)
+                else:
+                    merged_analyzer.setdefault(key, value)
+    return merged
+
+
+def _move_into(source, target_dir, name, shard_index, plist_names):
+    """
+    Moves source into target_dir as name. The entries of directories both sides have (like CodeChecker's failed/)
+    are moved over one by one, same named files are kept apart by a shard prefix. Of same named files directly in
+    the result folder, other than plists, the first one is kept
+    """
+    target = os.path.join(target_dir, name)
+    if os.path.isdir(source) and os.path.isdir(target):
+        for entry in os.listdir(source):
+            _move_into(os.path.join(source, entry), target, entry, shard_index, None)
+        return
+    if os.path.exists(target):
+        if plist_names is not None and not name.endswith(".plist"):
+            return
+        target = os.path.join(target_dir, f"shard{shard_index}_{name}")
+    if plist_names is not None and name.endswith(".plist"):
+        plist_names[(shard_index, name)] = os.path.basename(target)
+    shutil.move(source, target)
+
+
+def merge_result_folders(shard_result_folders, result_folder):
+    """
+    Moves the results of all shards into result_folder, so they look like the results of a single run.
+    Same named plists of different shards are kept apart by a shard prefix, of other files the first one is kept,
+    except for the entries of subdirectories like failed/, which are all kept, and CodeChecker's metadata.json,
+    which is merged
+    """
+    os.makedirs(result_folder, exist_ok=True)
+    metadatas = []
+    plist_names = {}
+    # Results restored from the analysis cache are there already, and have no metadata of their own
+    for i, shard_result_folder in enumerate(shard_result_folders):
+        if not os.path.isdir(shard_result_folder):
+            continue
+        for name in os.listdir(shard_result_folder):
+            source = os.path.join(shard_result_folder, name)
+            if name == CODECHECKER_METADATA_NAME:
+                try:
+                    with open(source, "r") as f:
+                        metadatas.append((i, json.load(f)))
+                except (OSError, ValueError) as e:
+                    LOG.warning(f"Ignoring unreadable {source}: {e}")
+                continue
+            _move_into(source, result_folder, name, i, plist_names)
+    if metadatas:
+        with open(os.path.join(result_folder, CODECHECKER_METADATA_NAME), "w") as f:
+            json.dump(merge_codechecker_metadata(metadatas, result_folder, plist_names), f, indent=2)
+
+
+def record_shard_durations(history_file, analyzer_key, shard_databases, shard_durations):
+    """Spreads the duration of every shard over its entries by LoC, and smooths it into the per-TU history"""
+    history = load_job_history(history_file)
+    tool_history = history.setdefault(analyzer_key, {})
+    for shard_database, duration in zip(shard_databases, shard_durations):
+        sources = [get_source_path(entry) for entry in iter_compile_commands(shard_database)]
+        loc = cloc_by_file(sources)
+        total_loc = sum(loc.values()) or 1
+        for source in sources:
+            seconds = duration * loc[source] / total_loc
+            previous = tool_history.get(source)
+            tool_history[source] = seconds if previous is None else \
+                HISTORY_SMOOTHING * seconds + (1 - HISTORY_SMOOTHING) * previous
+    save_job_history(history_file, history)
+
+
+def load_tu_history(history_file, analyzer_key):
+    return load_job_history(history_file).get(analyzer_key, {})
@@ -1,6 +1,18 @@
 import argparse
+import asyncio
 import logging
+import os
+import pathlib
+import shutil
 import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from invocation_runner import run_invocation, get_output_logger
+from metrics_store import MetricsStore, DEFAULT_METRICS_DB
+
+# Where the output of tool invocations is logged, unless their ExecutionContext says otherwise
+DEFAULT_LOG_DIR = os.getenv("SPACOMP_LOG_DIR", f"{pathlib.Path(__file__).parent.absolute()}/logs")
 
 
 def get_time_logger(language, tool):
@@ -11,20 +23,91 @@ def get_time_logger(language, tool):
     return logging.getLogger(f'{language}_{tool}_time')
 
 
-def time_invocation_log(language, tool, invocation):
+class ExecutionContext:
     """
-    Some boilerplate for coarse end-to-end timing logging of a tool invocation
-    Returns the result for processing by the caller
+    Working directory, environment and temporary space of a tool invocation.
+    Invocations get these handed to their subprocess instead of changing the state of the whole process,
+    so several analyses can run side by side in one interpreter.
+    Used as a context manager, the context gets its own temporary directory (exported as TMPDIR),
+    which is removed again on exit. The output of the tools is logged to log_dir
+    """
+    def __init__(self, cwd=".", env=None, log_dir=DEFAULT_LOG_DIR):
+        self.cwd = os.path.abspath(str(cwd))
+        self.env = dict(os.environ if env is None else env)
+        self.log_dir = os.path.abspath(str(log_dir))
+        self.temp_dir = None
+
+    def __enter__(self):
+        self.temp_dir = tempfile.mkdtemp(prefix="spacomp_")
+        self.env["TMPDIR"] = self.temp_dir
+        return self
+
+    def __exit__(self, *_):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        self.env.pop("TMPDIR", None)
+        self.temp_dir = None
+
+    def path(self, *parts):
+        """Resolves a path relative to the working directory of the context"""
+        return os.path.join(self.cwd, *parts)
+
+    def subcontext(self, relative_cwd):
+        """Context for a subdirectory, sharing environment and temporary space"""
+        context = ExecutionContext(self.path(relative_cwd), self.env, self.log_dir)
+        context.temp_dir = self.temp_dir
+        return context
+
+    def run(self, invocation, **kwargs):
+        return subprocess.run(invocation, cwd=self.cwd, env=self.env, **kwargs)
+
+
+def record_invocation_metrics(language, tool, project, invocation, returncode, resource_usage,
+                              metrics_db=DEFAULT_METRICS_DB):
+    """Stores the resource usage of one tool invocation in the metrics database"""
+    MetricsStore(metrics_db).record_invocation(language, tool, project, invocation, returncode, resource_usage)
+
+
+async def time_invocation_log_async(language, tool, invocation, context=None, timeout=None, project=None):
+    """
+    Some boilerplate for timing and resource logging of a tool invocation.
+    The output of the tool is streamed to {language}_{tool}_output.log in the log directory of context while it runs,
+    its resource usage is recorded with record_invocation_metrics (project defaults to the working directory)
+    Returns the result for processing by the caller, see run_invocation
     """
     log = get_time_logger(language, tool)
-    timing_injected_invocation = ['time', '-v']
-    timing_injected_invocation.extend(invocation)
-    log.info(f'{tool} run {invocation}: STARTED')
-    res = subprocess.run(invocation, capture_output=True)
-    log.info(f'{tool} run {invocation}: ENDED')
+    context = context or ExecutionContext()
+    project = project or context.cwd
+    log.info(f'{tool} run {invocation} in {context.cwd}: STARTED')
+    try:
+        res = await run_invocation(invocation, cwd=context.cwd, env=context.env, timeout=timeout,
+                                   output_log=get_output_logger(language, tool, context.log_dir))
+    except subprocess.TimeoutExpired as e:
+        log.info(f'{tool} run {invocation} in {context.cwd}: TIMED OUT after {timeout}s')
+        if hasattr(e, "resource_usage"):
+            record_invocation_metrics(language, tool, project, invocation, None, e.resource_usage)
+        raise
+    except asyncio.CancelledError:
+        log.info(f'{tool} run {invocation} in {context.cwd}: CANCELLED')
+        raise
+    usage = res.resource_usage
+    log.info(f'{tool} run {invocation} in {context.cwd}: ENDED after {usage.wall_seconds:.1f}s '
+             f'(user {usage.user_seconds:.1f}s, sys {usage.sys_seconds:.1f}s, peak RSS {usage.peak_tree_rss_kb} KiB)')
+    record_invocation_metrics(language, tool, project, invocation, res.returncode, usage)
     return res
 
 
+def time_invocation_log(language, tool, invocation, context=None, timeout=None, project=None):
+    """Blocking version of time_invocation_log_async, which can be called whether an event loop is running or not"""
+    coroutine = time_invocation_log_async(language, tool, invocation, context, timeout, project)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    # asyncio.run cannot be nested, so the invocation gets an event loop on a thread of its own
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
 def str2bool(v):
     if isinstance(v, bool):
         return v
@@ -68,5 +151,14 @@ def get_framework_args(language):
                         help='A semicolon-separated list of the following analysis tools to run: ' +
                              f'{";".join(tools_list)}',
                              required=False, default='all')
+    parser.add_argument('--jobs', '-j', type=int, required=False, default=1,
+                        help='Number of analyses (project, tool pairs) to run in parallel, 0 for one per core')
+    parser.add_argument('--job-cpus', type=int, required=False, default=1,
+                        help='Number of cores each analysis is expected to keep busy')
+    parser.add_argument('--job-memory-limit', type=int, required=False, default=0,
+                        help='Memory limit per analysis in MB, for all the processes it runs together, 0 for no limit')
+    parser.add_argument('--job-cpu-time-limit', type=int, required=False, default=0,
+                        help='CPU time limit per analysis in seconds, for all the processes it runs together, '
+                             '0 for no limit')
     return parser
 
@@ -0,0 +1,128 @@
+import logging
+import os
+import re
+import subprocess
+import threading
+
+from native_loc_counter import get_language, count_content, sum_file_counts
+
+LOG = logging.getLogger("GIT_OBJECT_LOC")
+
+GIT_OBJECTS_DIRECTORY_NAME = ".git_objects"
+
+
+def get_bare_clone_path(work_dir, full_name):
+    """Where clone_without_checkout puts a repository, apart from full checkouts in work_dir"""
+    return os.path.join(work_dir, GIT_OBJECTS_DIRECTORY_NAME, f"{full_name}.git")
+
+
+def clone_without_checkout(clone_url, target_dir):
+    """
+    Bare, shallow clone of the default branch without any file content (--filter=blob:none), the blobs are fetched
+    later on only for the files that get counted. Returns whether target_dir holds the clone, as reused if it exists
+    """
+    if os.path.isdir(target_dir):
+        return True
+    os.makedirs(os.path.dirname(target_dir), exist_ok=True)
+    res = subprocess.run(["git", "clone", "--bare", "--filter=blob:none", "--depth", "1", "--no-tags", "--quiet",
+                          clone_url, target_dir], capture_output=True)
+    if res.returncode != 0:
+        LOG.error(f"Cloning {clone_url} failed: {res.stderr.decode('utf-8', errors='replace')}")
+    return res.returncode == 0
+
+
+def list_tree(repository_dir, revision="HEAD"):
+    """(path, blob SHA) of every file of revision, only the trees are needed for this, not the blobs"""
+    res = subprocess.run(["git", "-C", repository_dir, "ls-tree", "-r", "-z", "--full-tree", revision],
+                         capture_output=True, check=True)
+    files = []
+    for line in res.stdout.decode("utf-8", errors="surrogateescape").split("\0"):
+        if not line:
+            continue
+        info, path = line.split("\t", 1)
+        mode, object_type, digest = info.split(" ")
+        # Symbolic links are blobs as well, but their content is the link target
+        if object_type == "blob" and mode != "120000":
+            files.append((path, digest))
+    return files
+
+
+def prefetch_blobs(repository_dir, digests):
+    """
+    Fetches the given blobs of a partial clone with a single request, the way git does it for checkouts.
+    Without it, every blob cat-file reads would be fetched on its own
+    """
+    if not digests:
+        return
+    res = subprocess.run(["git", "-C", repository_dir, "-c", "fetch.negotiationAlgorithm=noop", "fetch", "origin",
+                          "--no-tags", "--no-write-fetch-head", "--recurse-submodules=no", "--filter=blob:none",
+                          "--stdin"], input="\n".join(digests).encode("utf-8"), capture_output=True)
+    if res.returncode != 0:
+        LOG.warning(f"Batched blob fetch for {repository_dir} failed, falling back to fetching blobs one by one: "
+                    f"{res.stderr.decode('utf-8', errors='replace')}")
+
+
+def iter_blobs(repository_dir, digests):
+    """Yields (digest, content) of the blobs, read through a single git cat-file --batch"""
+    process = subprocess.Popen(["git", "-C", repository_dir, "cat-file", "--batch"],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    # Written from another thread, so neither side blocks on a full pipe
+    def write_requests():
+        try:
+            for digest in digests:
+                process.stdin.write(f"{digest}\n".encode("utf-8"))
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+    writer = threading.Thread(target=write_requests, daemon=True)
+    writer.start()
+    try:
+        for _ in digests:
+            header = process.stdout.readline().split()
+            if len(header) != 3:
+                LOG.warning(f"Blob {header[0].decode('utf-8') if header else ''} missing from {repository_dir}")
+                continue
+            content = process.stdout.read(int(header[2]))
+            process.stdout.read(1)
+            yield header[0].decode("utf-8"), content
+    finally:
+        writer.join()
+        process.stdout.close()
+        process.wait()
+
+
+def count_git_tree(repository_dir, languages, dir_filter="", file_filter="", revision="HEAD", loc_cache=None):
+    """
+    Per language [files, blank, comment, code] of revision of a (bare, partial) clone, counted from the git
+    objects without a working tree. The filters are applied to the paths the files would have in a checkout at
+    repository_dir, like cloc's. Blobs whose counts are in loc_cache are not fetched at all
+    """
+    languages = set(languages)
+    dir_regex = re.compile(dir_filter) if dir_filter else None
+    file_regex = re.compile(file_filter) if file_filter else None
+    files = []
+    for path, digest in list_tree(repository_dir, revision):
+        language = get_language(path)
+        # Absolute like the directories find_source_files matches dir_filter against
+        directory, name = os.path.split(os.path.join(os.path.abspath(repository_dir), path))
+        if language in languages and (not dir_regex or dir_regex.search(directory)) \
+                and (not file_regex or file_regex.search(name)):
+            files.append((language, digest))
+    cached = loc_cache.get_cached_counts(digest for _, digest in files) if loc_cache else {}
+    missing = sorted(set(digest for language, digest in files if (digest, language) not in cached))
+    LOG.info(f"Counting {len(missing)} blobs of {len(files)} files in {repository_dir}")
+    prefetch_blobs(repository_dir, missing)
+    blob_languages = {}
+    for language, digest in files:
+        if (digest, language) not in cached:
+            blob_languages.setdefault(digest, set()).add(language)
+    new_counts = []
+    for digest, content in iter_blobs(repository_dir, missing):
+        for language in blob_languages[digest]:
+            cached[(digest, language)] = count_content(content, language)
+            new_counts.append((language, *cached[(digest, language)], digest))
+    if loc_cache:
+        loc_cache.add_counts(new_counts)
+    return sum_file_counts((language, *cached[(digest, language)], digest)
+                           for language, digest in files if (digest, language) in cached)
@@ -7,25 +7,76 @@ import pathlib
 import xml.etree.ElementTree as ET
 import argparse
 import copy
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from functools import partial
-from line_of_code_counter import ProjectSize, cloc_invocation
+from line_of_code_counter import ProjectSize, cloc_invocation, git_object_cloc
+from git_object_loc import clone_without_checkout, get_bare_clone_path
+from analysis_scheduler import load_job_history, save_job_history, HISTORY_SMOOTHING
 from dotenv import load_dotenv
 
 load_dotenv(".env")
 token = os.getenv('GITHUB_TOKEN', '...')
-PY_GIT = Github(token)
+# Can point to a local stand-in for the GitHub API, e.g. for testing the filters
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', "https://api.github.com")
+PY_GIT = Github(token, base_url=GITHUB_API_URL)
 CLOC_BIN = os.getenv("CLOC_BIN", '/usr/bin/cloc')
+# Count the LoC of candidate repositories from blobless bare clones instead of full checkouts
+COUNT_FROM_GIT_OBJECTS = os.getenv("SPACOMP_COUNT_FROM_GIT_OBJECTS", "1") == "1"
+# Repositories filtered at once, by filters calling the GitHub API and by filters cloning and counting
+FILTER_API_WORKERS = int(os.getenv("SPACOMP_FILTER_API_WORKERS", 8))
+FILTER_CLONE_WORKERS = int(os.getenv("SPACOMP_FILTER_CLONE_WORKERS", os.cpu_count() or 1))
+# Seconds per repository and fraction of repositories passing of every filter, measured in earlier runs
+DEFAULT_FILTER_STATS_FILE = os.getenv("SPACOMP_FILTER_STATS",
+                                      f"{pathlib.Path(__file__).parent.absolute()}/.filter_stats.json")
 
 logging.basicConfig(filename="GITHUB_LOG.log", format='%(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p', level=logging.INFO)
 LOG = logging.getLogger("GITHUB")
 
 
+_thread_local = threading.local()
+
+
+def get_thread_github_client():
+    """
+    Github client of the calling thread. The filter threads each get their own, as a client and the objects it
+    returns share one connection and request throttling, which are not meant to be used from several threads
+    """
+    client = getattr(_thread_local, "github_client", None)
+    if client is None:
+        client = _thread_local.github_client = Github(token, base_url=GITHUB_API_URL)
+    return client
+
+
+def get_thread_repository(repository):
+    """Repository for making API calls from the calling thread, without fetching it again"""
+    return get_thread_github_client().get_repo(repository.full_name, lazy=True)
+
+
 class APIException(BaseException):
     def __init__(self, message):
         self.message = message
 
 
+class RepositorySnapshot:
+    """
+    The attributes of a PyGithub Repository the clone and count filters use. Unlike the Repository, which holds
+    on to its API connection, it can be sent to the processes these filters run in
+    """
+    def __init__(self, full_name, clone_url, default_branch, pushed_at=None):
+        self.full_name = full_name
+        self.clone_url = clone_url
+        self.default_branch = default_branch
+        self.pushed_at = pushed_at
+
+    @staticmethod
+    def from_repository(repository):
+        return RepositorySnapshot(repository.full_name, repository.clone_url, repository.default_branch,
+                                  repository.pushed_at)
+
+
 class SearchParameter:
     value = 0
     operator = "op"
@@ -128,7 +179,7 @@ def filter_on_activity(max_days_since_update_allowed, repository):
 def filter_on_languages(language_size_dict, repository):
     """Filter based on the overall languages used, in number of bytes"""
     #request = requests.get(repository.languages_url, headers={'Authentication': "token " + token})
-    language_lookup = repository.get_languages()
+    language_lookup = get_thread_repository(repository).get_languages()
     err = language_lookup.get("message")
     if err:
         LOG.error("Request failed for " + repository.full_name + "\n")
@@ -145,9 +196,33 @@ def filter_on_languages(language_size_dict, repository):
     return False
 
 
-def filter_on_testware_language(languages, repository):
+def clone_repository(repository, work_dir="."):
+    """Checkout of the repository in work_dir, returns git's return code (128 if it already exists)"""
+    cmd = ["git", "clone"]
+    if repository.default_branch == 'main':
+        cmd.extend(["--depth", "1"])
+    else:
+        LOG.debug(f"Potential issue: following repository does not default to main - {repository.full_name}. Pulling everything ...")
+    cmd.extend([repository.clone_url, repository.full_name])
+    return subprocess.run(cmd, cwd=work_dir).returncode
+
+
+def get_repository_loc(languages, repository, work_dir=".", perl_dir_filter=""):
+    """
+    LoCData of the repository. With COUNT_FROM_GIT_OBJECTS it is counted from a bare clone without file content,
+    fetching only the blobs of the counted files, otherwise from the checkout in work_dir
+    """
+    if COUNT_FROM_GIT_OBJECTS:
+        bare_clone = get_bare_clone_path(work_dir, repository.full_name)
+        if not clone_without_checkout(repository.clone_url, bare_clone):
+            return None
+        return git_object_cloc(languages, bare_clone, perl_dir_filter)
+    return cloc_invocation(languages, os.path.join(work_dir, repository.full_name), perl_dir_filter)
+
+
+def filter_on_testware_language(languages, repository, work_dir="."):
     """Filter based on what languages are used to implement test code"""
-    cloc = cloc_invocation(languages, repository.full_name, '.*[tT]est.*')
+    cloc = get_repository_loc(languages, repository, work_dir, '.*[tT]est.*')
     if cloc:
         for l in languages:
             size = cloc.classify(l)
@@ -157,19 +232,12 @@ def filter_on_testware_language(languages, repository):
     return False
 
 
-def filter_on_project_language_loc_size(languages, size_classes_to_keep, repository):
+def filter_on_project_language_loc_size(languages, size_classes_to_keep, repository, work_dir="."):
     """Filtering based on LoC"""
-    cmd = ["git", "clone"]
-    if repository.default_branch == 'main':
-        cmd.extend(["--depth", "1"])
-    else:
-        LOG.debug(f"Potential issue: following repository does not default to main - {repository.full_name}. Pulling everything ...")
-    cmd.extend([repository.clone_url, repository.full_name])
-    res = subprocess.run(cmd)
-    if res.returncode == 128:
+    if not COUNT_FROM_GIT_OBJECTS and clone_repository(repository, work_dir) == 128:
         # Return code for "destination already exists"
         return True  # We assume this has already been filtered once
-    cloc = cloc_invocation(languages, repository.full_name)
+    cloc = get_repository_loc(languages, repository, work_dir)
     if cloc:
         repo_size_classes = [e[1] for e in cloc.get_project_sizes_sorted(languages)]
         for s in size_classes_to_keep:
@@ -179,21 +247,14 @@ def filter_on_project_language_loc_size(languages, size_classes_to_keep, reposit
         return False
 
 
-def filter_on_project_loc_size(languages, size_classes_to_keep, repository):
+def filter_on_project_loc_size(languages, size_classes_to_keep, repository, work_dir="."):
     """Filtering based on LoC"""
     """Based on
     https://stackoverflow.com/questions/26881441/can-you-get-the-number-of-lines-of-code-from-a-github-repository
     the simplest way seems to be to shallow clone it, run e.g. cloc and then parse results"""
-    cmd = ["git", "clone"]
-    if repository.default_branch == 'main':
-        cmd.extend(["--depth", "1"])
-    else:
-        LOG.debug(f"Potential issue: following repository does not default to main - {repository}. Pulling everything ...")
-    cmd.extend([repository.clone_url, repository.full_name])
-    #if res.returncode == 128:
-        # Return code for "destination already exists"
-    #    return True  # We assume this has already been filtered once
-    cloc = cloc_invocation(languages, repository.full_name)
+    if not COUNT_FROM_GIT_OBJECTS:
+        clone_repository(repository, work_dir)
+    cloc = get_repository_loc(languages, repository, work_dir)
     if cloc:
         total_size_class = cloc.classify_total_size()
         if total_size_class in size_classes_to_keep:
@@ -202,32 +263,191 @@ def filter_on_project_loc_size(languages, size_classes_to_keep, repository):
         return False
 
 
-def apply_filters_log_filtering(repo_list, repository_filters_explanation, log_filename, filters_base_path="."):
+PROCESS_BOUND_FILTERS = {filter_on_testware_language, filter_on_project_language_loc_size, filter_on_project_loc_size}
+# Filters cloning the checkout that others count in, when not counting from git objects
+CHECKOUT_FILTERS = {filter_on_project_language_loc_size, filter_on_project_loc_size}
+# Seconds per repository assumed for filters without recorded stats. Activity only looks at fetched metadata
+FILTER_COST_PRIORS = {filter_on_activity: 0.001, filter_on_languages: 1.0,
+                      **{f: 60.0 for f in PROCESS_BOUND_FILTERS}}
+
+
+def get_filter_data_path(filters_base_path="."):
+    """Directory the filter log is written to, and which filters needing a checkout should clone into"""
+    return Path(filters_base_path).absolute().joinpath(".FILTERDATA")
+
+
+def is_process_bound_filter(filter_function):
+    """Filters cloning and counting run in processes, on RepositorySnapshots, the others in threads"""
+    return getattr(filter_function, "func", filter_function) in PROCESS_BOUND_FILTERS
+
+
+def get_filter_dependencies(filter_function):
+    """
+    Filters that have to run before filter_function when both are applied. Without COUNT_FROM_GIT_OBJECTS,
+    the testware filter counts in the checkout the LoC size filters clone
+    """
+    func = getattr(filter_function, "func", filter_function)
+    if func is filter_on_testware_language and not COUNT_FROM_GIT_OBJECTS:
+        return CHECKOUT_FILTERS
+    return set()
+
+
+def get_filter_key(filter_function):
+    """Identifies a filter and its configuration (but not where it works) across runs"""
+    func = getattr(filter_function, "func", filter_function)
+    args = getattr(filter_function, "args", ())
+    return f"{func.__name__}{args!r}"
+
+
+def get_filter_rank(filter_function, filter_stats):
+    """
+    Expected cost of the filter per repository it rejects, filters with the lowest one go first.
+    Filters never run before are assumed to pass half of the repositories at their FILTER_COST_PRIORS cost
+    """
+    stats = filter_stats.get(get_filter_key(filter_function), {})
+    cost = stats.get("seconds", FILTER_COST_PRIORS.get(getattr(filter_function, "func", filter_function), 1.0))
+    selectivity = stats.get("selectivity", 0.5)
+    return cost / max(1 - selectivity, 1e-6)
+
+
+def order_filters(filter_functions, filter_stats):
+    """
+    Indices of the filters in the order to run them, cheapest per rejected repository first,
+    but never before a filter it depends on (see get_filter_dependencies)
+    """
+    remaining = sorted(range(len(filter_functions)),
+                       key=lambda i: (get_filter_rank(filter_functions[i], filter_stats), i))
+    order = []
+    while remaining:
+        for i in remaining:
+            dependencies = get_filter_dependencies(filter_functions[i])
+            if not any(getattr(filter_functions[j], "func", filter_functions[j]) in dependencies
+                       for j in remaining if j != i):
+                break
+        remaining.remove(i)
+        order.append(i)
+    return order
+
+
+def _timed_filter(filter_function, repository):
+    start = time.perf_counter()
+    passed = filter_function(repository)
+    return passed, time.perf_counter() - start
+
+
+class FilterStageStats:
+    """Repositories a filter was run on and passed, and the time it took on them altogether"""
+    def __init__(self):
+        self.evaluated = 0
+        self.passed = 0
+        self.seconds = 0.0
+
+
+def run_filter_pipeline(repo_list, filter_functions, api_workers=FILTER_API_WORKERS,
+                        clone_workers=FILTER_CLONE_WORKERS):
+    """
+    Applies the filters as stages of a pipeline: a repository goes on to the next filter as soon as it passed
+    the previous one, so network, disk and CPU bound filters work at the same time. Every stage runs at most
+    api_workers (threads) or clone_workers (processes) repositories at once.
+    Returns the indices in repo_list of the repositories passing each filter, in the order of repo_list,
+    and the FilterStageStats of every filter. An error in a filter stops the pipeline and is raised
+    """
+    survivors = [[] for _ in filter_functions]
+    stage_stats = [FilterStageStats() for _ in filter_functions]
+    if not filter_functions:
+        return survivors, stage_stats
+    thread_pool = ThreadPoolExecutor(max_workers=api_workers, thread_name_prefix="filter")
+    process_pool = ProcessPoolExecutor(max_workers=clone_workers) \
+        if any(is_process_bound_filter(f) for f in filter_functions) else None
+    snapshots = {}
+    pending = {}
+
+    def submit(stage, index):
+        filter_function = filter_functions[stage]
+        if is_process_bound_filter(filter_function):
+            if index not in snapshots:
+                snapshots[index] = RepositorySnapshot.from_repository(repo_list[index])
+            future = process_pool.submit(_timed_filter, filter_function, snapshots[index])
+        else:
+            future = thread_pool.submit(_timed_filter, filter_function, repo_list[index])
+        pending[future] = (stage, index)
+
+    try:
+        for index in range(len(repo_list)):
+            submit(0, index)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, index = pending.pop(future)
+                try:
+                    passed, seconds = future.result()
+                except Exception as e:
+                    # Not a rejection: an API or network error would otherwise quietly empty the selection
+                    LOG.error(f"Filter {stage} failed for {repo_list[index].full_name}: {e}")
+                    raise
+                stage_stats[stage].evaluated += 1
+                stage_stats[stage].seconds += seconds
+                if passed:
+                    stage_stats[stage].passed += 1
+                    survivors[stage].append(index)
+                    if stage + 1 < len(filter_functions):
+                        submit(stage + 1, index)
+    finally:
+        thread_pool.shutdown(cancel_futures=True)
+        if process_pool:
+            process_pool.shutdown(cancel_futures=True)
+    return [sorted(indices) for indices in survivors], stage_stats
+
+
+def record_filter_stats(stats_file, filter_functions, stage_stats):
+    """Smooths the cost per repository and the fraction passing of this run into the stats of earlier runs"""
+    filter_stats = load_job_history(stats_file)
+    for filter_function, stats in zip(filter_functions, stage_stats):
+        if not stats.evaluated:
+            continue
+        previous = filter_stats.get(get_filter_key(filter_function))
+        latest = {"seconds": stats.seconds / stats.evaluated, "selectivity": stats.passed / stats.evaluated}
+        filter_stats[get_filter_key(filter_function)] = latest if previous is None else \
+            {k: HISTORY_SMOOTHING * v + (1 - HISTORY_SMOOTHING) * previous.get(k, v) for k, v in latest.items()}
+    save_job_history(stats_file, filter_stats)
+
+
+def apply_filters_log_filtering(repo_list, repository_filters_explanation, log_filename, filters_base_path=".",
+                                reorder=True, stats_file=DEFAULT_FILTER_STATS_FILE):
     """Given a list of repositories, we filter (with logging) based on the set of filters supplied.
-    Result will be a list of the list of projects that were left after each filter step"""
-    base_path = Path.absolute(filters_base_path).join("/.FILTERDATA")
+    Result will be a list of the list of projects that were left after each filter step.
+    With reorder, the filters run cheapest per rejected repository first, going by the cost and selectivity
+    recorded in stats_file. The log and the result follow the order the filters ran in, every step listing
+    the repositories the filter was run on and passed.
+    """
+    base_path = get_filter_data_path(filters_base_path)
     base_path.mkdir(parents=True, exist_ok=True)
-    os.chdir(base_path)
+    repo_list = list(repo_list)
+    filter_functions = [f for f, _ in repository_filters_explanation]
+    order = order_filters(filter_functions, load_job_history(stats_file)) if reorder \
+        else list(range(len(filter_functions)))
+    for i in order:
+        print(f"Filtering with filter: {repository_filters_explanation[i][1]}\n")
+    survivors, stage_stats = run_filter_pipeline(repo_list, [filter_functions[i] for i in order])
+    record_filter_stats(stats_file, [filter_functions[i] for i in order], stage_stats)
+
     acc = []
-    repos = repo_list
-    with open(log_filename, "w") as xml_log:
+    with open(base_path.joinpath(log_filename), "w") as xml_log:
         xml_log.write('<?xml version="1.0"?>\n')
         xml_log.write('<Filterings>\n')
-        for f_head in repository_filters_explanation:
-            if not repos:
+        for filter_index, stage_survivors, stats in zip(order, survivors, stage_stats):
+            if not (acc[-1] if acc else repo_list):
                 LOG.debug("No more repositories. Exiting ...")
                 break
-            filter_function, explanation_text = f_head
-            print(f"Filtering with filter: {explanation_text}\n")
-            filtered_repositories = [r for r in repos if filter_function(r)]
-            xml_log.write(f'\t<Filter note="{explanation_text}" amount="{len(filtered_repositories)}">\n')
-            for r in filtered_repositories:
+            explanation_text = repository_filters_explanation[filter_index][1]
+            xml_log.write(f'\t<Filter note="{explanation_text}" amount="{len(stage_survivors)}" '
+                          f'evaluated="{stats.evaluated}">\n')
+            for i in stage_survivors:
+                r = repo_list[i]
                 xml_log.write(f'\t\t<Repository name="{r.full_name}" url="{r.clone_url}" />\n')
             xml_log.write(f'\t</Filter>\n')
-            acc.append(filtered_repositories)
-            repos = filtered_repositories
+            acc.append([repo_list[i] for i in stage_survivors])
         xml_log.write('</Filterings>\n')
-    os.chdir("..")
     return acc
 
 
@@ -264,10 +484,13 @@ def eval_example(github_user, working_directory=os.getcwd()):
     recently_active_filter = (partial(filter_on_activity, max_time_since_update),
                               "Filtering based on time since last activity: <= " + str(max_time_since_update) + " days")
 
+    filter_data_path = str(get_filter_data_path())
     project_total_size_filter = (partial(filter_on_project_loc_size, ["C", "C++", 'C/C++ Header', "Python", "Java"],
-                                [ProjectSize.Medium]), "Filtering based on LoC count overall (50000 <= LoC" +
-                                               " < 100000 when summing all C/C++/Java/Python code)")
-    testware_min_size_filter = (partial(filter_on_testware_language, ["C", "C++", "Python", "Java"]),
+                                [ProjectSize.Medium], work_dir=filter_data_path),
+                                 "Filtering based on LoC count overall (50000 <= LoC" +
+                                 " < 100000 when summing all C/C++/Java/Python code)")
+    testware_min_size_filter = (partial(filter_on_testware_language, ["C", "C++", "Python", "Java"],
+                                        work_dir=filter_data_path),
                                 "Filtering based on Testware LoC (>1000 Lines of tests, >1-2% of total size)")
     filters = [language_size_in_byte_filter,
                recently_active_filter,
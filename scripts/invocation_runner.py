@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+import weakref
+from logging.handlers import RotatingFileHandler
+
+from proc_stat import iter_process_stats
+
+# Only the end of the output is kept in memory and handed back to the caller, the rest goes to the output log
+OUTPUT_TAIL_BYTES = 64 * 1024
+OUTPUT_LOG_MAX_BYTES = 64 * 1024 * 1024
+OUTPUT_LOG_BACKUP_COUNT = 5
+READ_CHUNK_BYTES = 64 * 1024
+# How often the memory use of a running process tree is sampled
+RSS_SAMPLE_INTERVAL_SECONDS = 1.0
+# How long the output pipes may stay open after the invocation exited, e.g. held by a daemon it started
+OUTPUT_DRAIN_SECONDS = 5.0
+# rusage counts block I/O in units of 512 bytes
+RUSAGE_BLOCK_BYTES = 512
+
+
+def get_output_logger(language, tool, log_dir):
+    """Logger writing the output of tool invocations to a rotating {language}_{tool}_output.log in log_dir"""
+    log_path = os.path.join(os.path.abspath(log_dir), f'{language}_{tool}_output.log')
+    log = logging.getLogger(f'output:{log_path}')
+    if not log.handlers:
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        handler = RotatingFileHandler(log_path, maxBytes=OUTPUT_LOG_MAX_BYTES, backupCount=OUTPUT_LOG_BACKUP_COUNT)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p'))
+        log.addHandler(handler)
+        log.setLevel(logging.INFO)
+        # Tool output should not end up in the timing or framework logs as well
+        log.propagate = False
+    return log
+
+
+class OutputTail:
+    """Keeps the last max_bytes of a stream, and logs it line by line"""
+    def __init__(self, name, output_log=None, max_bytes=OUTPUT_TAIL_BYTES):
+        self.name = name
+        self.output_log = output_log
+        self.max_bytes = max_bytes
+        self.tail = bytearray()
+        self.partial_line = b""
+
+    def feed(self, data):
+        self.tail += data
+        if len(self.tail) > self.max_bytes:
+            del self.tail[:len(self.tail) - self.max_bytes]
+        if self.output_log:
+            lines = (self.partial_line + data).split(b"\n")
+            self.partial_line = lines.pop()
+            for line in lines:
+                self.output_log.info(f"[{self.name}] {line.decode('utf-8', errors='replace')}")
+
+    def close(self):
+        if self.output_log and self.partial_line:
+            self.output_log.info(f"[{self.name}] {self.partial_line.decode('utf-8', errors='replace')}")
+        self.partial_line = b""
+        return bytes(self.tail)
+
+
+async def _stream_pipe(pipe, output_tail):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=READ_CHUNK_BYTES)
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    try:
+        while True:
+            data = await reader.read(READ_CHUNK_BYTES)
+            if not data:
+                break
+            output_tail.feed(data)
+    finally:
+        transport.close()
+
+
+async def _drain_streams(streams, output_tails, process):
+    """
+    The output tails once the pipe readers are done. Processes the invocation left behind may hold the pipes open,
+    so after OUTPUT_DRAIN_SECONDS its process group is killed, and after another OUTPUT_DRAIN_SECONDS the readers
+    are cancelled, as processes that left the session cannot be killed that way
+    """
+    done, _ = await asyncio.wait([streams], timeout=OUTPUT_DRAIN_SECONDS)
+    if not done:
+        _kill_process_group(process)
+        done, _ = await asyncio.wait([streams], timeout=OUTPUT_DRAIN_SECONDS)
+    if not done:
+        streams.cancel()
+        await asyncio.wait([streams])
+    elif streams.exception() is not None:
+        raise streams.exception()
+    return tuple(output_tail.close() for output_tail in output_tails)
+
+
+class ResourceUsage:
+    """
+    Resources used by an invocation and everything it spawned.
+    CPU times, max_rss_kb (largest single process) and I/O come from the rusage of the reaped process tree,
+    peak_tree_rss_kb is the largest sampled sum of the resident memory of all processes of the tree at once.
+    Read and written bytes count block device I/O only, data served from or left in the page cache is not included
+    """
+    def __init__(self, wall_seconds, rusage, peak_tree_rss_kb):
+        self.wall_seconds = wall_seconds
+        self.user_seconds = rusage.ru_utime
+        self.sys_seconds = rusage.ru_stime
+        self.max_rss_kb = rusage.ru_maxrss
+        self.peak_tree_rss_kb = max(peak_tree_rss_kb, rusage.ru_maxrss)
+        self.read_bytes = rusage.ru_inblock * RUSAGE_BLOCK_BYTES
+        self.write_bytes = rusage.ru_oublock * RUSAGE_BLOCK_BYTES
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def get_sessions_rss_kb(session_ids):
+    """Sum of the resident memory of all live processes per session, for the given sessions"""
+    total_bytes = dict.fromkeys(session_ids, 0)
+    for stat in iter_process_stats():
+        if stat.session_id in total_bytes:
+            total_bytes[stat.session_id] += stat.rss_bytes
+    return {session_id: rss_bytes // 1024 for session_id, rss_bytes in total_bytes.items()}
+
+
+def get_session_rss_kb(session_id):
+    """Sum of the resident memory of all live processes in the given session"""
+    return get_sessions_rss_kb([session_id])[session_id]
+
+
+class TreeRssSampler:
+    """
+    Keeps the peak memory use of the sessions of all running invocations of an event loop, with a single scan
+    of /proc per tick for all of them. The scan runs on the default executor, so the event loop is not blocked
+    """
+    _samplers = weakref.WeakKeyDictionary()
+
+    def __init__(self):
+        self.peaks = {}
+        self.task = None
+
+    @classmethod
+    def for_running_loop(cls):
+        loop = asyncio.get_running_loop()
+        if loop not in cls._samplers:
+            cls._samplers[loop] = cls()
+        return cls._samplers[loop]
+
+    def register(self, session_id):
+        """Starts sampling session_id, returns the list whose only item is kept at its peak memory use in kB"""
+        peak = self.peaks[session_id] = [0]
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._sample())
+        return peak
+
+    def unregister(self, session_id):
+        self.peaks.pop(session_id, None)
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while self.peaks:
+            try:
+                usage = await loop.run_in_executor(None, get_sessions_rss_kb, list(self.peaks))
+            except OSError:
+                usage = {}
+            for session_id, rss_kb in usage.items():
+                peak = self.peaks.get(session_id)
+                if peak is not None:
+                    peak[0] = max(peak[0], rss_kb)
+            await asyncio.sleep(RSS_SAMPLE_INTERVAL_SECONDS)
+
+
+def _wait_in_thread(process):
+    """
+    Future for the exit code and rusage of process. Waiting happens on a thread of its own,
+    so long running invocations do not take up the (bounded) default executor
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def wait():
+        try:
+            # wait4 rather than Popen.wait, as it is the only way to get the rusage of this child alone
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        except BaseException as e:
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_exception(e))
+        else:
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result((process.returncode, rusage)))
+
+    threading.Thread(target=wait, name=f"wait-{process.pid}", daemon=True).start()
+    return future
+
+
+def _kill_process_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def run_invocation(invocation, cwd=None, env=None, timeout=None, output_log=None):
+    """
+    Runs invocation, streaming its output to output_log as it is produced.
+    Returns a subprocess.CompletedProcess like subprocess.run(..., capture_output=True),
+    except that stdout and stderr only hold the last OUTPUT_TAIL_BYTES of each stream,
+    and that it has the ResourceUsage of the invocation as resource_usage.
+    On timeout or cancellation the invocation is killed together with everything it spawned,
+    and subprocess.TimeoutExpired (with resource_usage as well) or asyncio.CancelledError is raised
+    """
+    start = time.monotonic()
+    # A session of its own, so the whole process tree can be killed and measured at once
+    process = subprocess.Popen(invocation, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               start_new_session=True)
+    sampler = TreeRssSampler.for_running_loop()
+    peak_tree_rss_kb = sampler.register(process.pid)
+    output_tails = (OutputTail("stdout", output_log), OutputTail("stderr", output_log))
+    streams = asyncio.gather(_stream_pipe(process.stdout, output_tails[0]),
+                             _stream_pipe(process.stderr, output_tails[1]))
+    exited = _wait_in_thread(process)
+    try:
+        returncode, rusage = await asyncio.wait_for(asyncio.shield(exited), timeout)
+        stdout, stderr = await _drain_streams(streams, output_tails, process)
+    except asyncio.TimeoutError:
+        _kill_process_group(process)
+        exit_result, _ = await asyncio.gather(exited, _drain_streams(streams, output_tails, process),
+                                              return_exceptions=True)
+        error = subprocess.TimeoutExpired(invocation, timeout)
+        if not isinstance(exit_result, BaseException):
+            error.resource_usage = ResourceUsage(time.monotonic() - start, exit_result[1], peak_tree_rss_kb[0])
+        raise error
+    except BaseException:
+        _kill_process_group(process)
+        await asyncio.gather(exited, _drain_streams(streams, output_tails, process), return_exceptions=True)
+        raise
+    finally:
+        sampler.unregister(process.pid)
+    result = subprocess.CompletedProcess(invocation, returncode, stdout, stderr)
+    result.resource_usage = ResourceUsage(time.monotonic() - start, rusage, peak_tree_rss_kb[0])
+    return result
+
+
+async def run_invocations_concurrently(invocation_coroutines, max_concurrent=None):
+    """
+    Awaits the given invocations with at most max_concurrent of them running at a time.
+    Results are returned in the order of the invocations, with exceptions in place of the failed ones
+    """
+    semaphore = asyncio.Semaphore(max_concurrent or os.cpu_count())
+
+    async def bounded(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(bounded(c) for c in invocation_coroutines), return_exceptions=True)
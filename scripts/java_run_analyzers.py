@@ -8,6 +8,9 @@ from framework_utils import *
 from analyzers.fbinfer import INFER_ALL_JAVA_FLAGS
 from codechecker_interface import *
 from build_system_handler import *
+from analysis_scheduler import AnalysisScheduler, make_job
+from store_queue import StoreQueue
+from functools import partial
 SCRIPT_PATH = pathlib.Path(__file__).parent.absolute()
 load_dotenv(f"{SCRIPT_PATH}/.env")
 USER = os.getenv("HOME")
@@ -17,7 +20,6 @@ SPOTBUGS_INSTALL_PATH = os.getenv("SPOTBUGS_PATH")
 
 logging.basicConfig(filename='spa_javaInvocation.log', level=logging.DEBUG, format='%(asctime)s %(message)s\n')
 LOG = logging.getLogger("SPA_JAVA")
-TIMELOG = get_time_logger('java')
 
 parser = get_framework_args("java")
 args = None
@@ -28,7 +30,8 @@ def run_spotbugs_on_target(target_dir):
 
     spotbugs_invocation = [f"{SPOTBUGS_INSTALL_PATH}/spotbugs", "-xml:withMessages", "-output",
                           spotbugs_result_file, "text-ui", target_dir]
-    res = time_invocation_log('Java', 'spotbugs', spotbugs_invocation)
+    with ExecutionContext(target_dir) as context:
+        res = time_invocation_log('Java', 'spotbugs', spotbugs_invocation, context)
     if res.returncode != 0:
         LOG.error("Spotbugs run failed on " + target_dir)
         LOG.error(res.stderr.decode('utf-8'))
@@ -36,20 +39,23 @@ def run_spotbugs_on_target(target_dir):
     else:
         return convert_and_store_to_codechecker(spotbugs_result_file,
                                             result_dir + "/spotbugs_results",
-                                            "spotbugs", os.path.dirname(target_dir), "_spotbugs", args.server_product)
+                                            "spotbugs", os.path.dirname(target_dir), "_spotbugs", args.server_product,
+                                            source_root=target_dir)
 
 
 def add_task_to_ant_build(build_xml, property_string, target_strings):
+    """Writes a copy of build_xml with the given tasks added next to it, and returns its path"""
     tree = ET.parse(build_xml)
     root = tree.getroot()
     prop = ET.fromstring(property_string)
     root.append(prop)
     for target in target_strings:
         root.append(ET.fromstring(target))
-    with open("mybuild.xml", "w") as f:
+    new_build_xml = os.path.join(os.path.dirname(build_xml), "mybuild.xml")
+    with open(new_build_xml, "w") as f:
         mydata = str(ET.tostring(root))
         f.write(mydata)
-    return "mybuild.xml"
+    return new_build_xml
 
 
 ANT_BUILD_FILE = "build.xml"
@@ -58,11 +64,17 @@ ANT_BUILD_FILE = "build.xml"
 def run_pmd_on_target(target_dir):
     result_dir = generate_analysis_output_folderpath(target_dir, 'pmd', True)
     pmd_result_file = f"{result_dir}/pmd_res.xml"
-    os.chdir(os.path.join(target_dir))
+    with ExecutionContext(target_dir) as context:
+        run_pmd_in_context(context, target_dir, result_dir, pmd_result_file)
+
+
+def run_pmd_in_context(context, target_dir, result_dir, pmd_result_file):
     build_system = determine_build_system(target_dir)
     if build_system == BuildSystem.Ant:
         # Ant build
-        new_build = add_task_to_ant_build(f"./{ANT_BUILD_FILE}",
+        ant_build_file = context.path(ANT_BUILD_FILE)
+        original_build_file = context.path("original_build.xml")
+        new_build = add_task_to_ant_build(ant_build_file,
                                           '<taskdef name="pmd" classname="net.sourceforge.pmd.ant.PMDTask"/>',
                                           [f'''
         <taskdef name="pmd" classname="net.sourceforge.pmd.ant.PMDTask">
@@ -84,11 +96,11 @@ def run_pmd_on_target(target_dir):
                 </fileset>
             </pmd>
         </target>'''])
-        shutil.move(ANT_BUILD_FILE, "original_build.xml")
-        shutil.move(new_build, ANT_BUILD_FILE)
+        shutil.move(ant_build_file, original_build_file)
+        shutil.move(new_build, ant_build_file)
 
         # Run new ant build
-        res = time_invocation_log('Java', 'pmd', ['ant', 'pmd'])
+        res = time_invocation_log('Java', 'pmd', ['ant', 'pmd'], context)
         if res.returncode != 0:
             LOG.error("Modified Ant build failed on " + target_dir)
             LOG.error(res.stderr.decode('utf-8'))
@@ -98,41 +110,45 @@ def run_pmd_on_target(target_dir):
                 f"{pmd_result_file}",
                 f"{result_dir}/pmd_results",
                 "pmd",
-                os.path.dirname(target_dir))
+                os.path.dirname(target_dir),
+                source_root=target_dir)
         # clean up, replace modified build with original (backed up)
-        os.remove(ANT_BUILD_FILE)
-        shutil.move("original_build.xml", ANT_BUILD_FILE)
+        os.remove(ant_build_file)
+        shutil.move(original_build_file, ant_build_file)
     else:
         # Just try to run it on targetdir
         pmd_invocation = [f"{PMD_INSTALL_PATH}/bin/run.sh", "pmd", "-d", target_dir,
                               "-f", "xml", "-R", "rulesets/internal/all-java.xml",
                               "-reportfile", pmd_result_file]
-        res = time_invocation_log('java', 'pmd', pmd_invocation)
+        res = time_invocation_log('java', 'pmd', pmd_invocation, context)
         pmd_violations_found_errorcode = 4
         if res.returncode == pmd_violations_found_errorcode:
             convert_and_store_to_codechecker(
                 f"{pmd_result_file}",
                 f"{result_dir}/pmd_results",
                 "pmd",
-                os.path.dirname(target_dir))
+                os.path.dirname(target_dir),
+                source_root=target_dir)
 
 
 def run_fbinfer_on_target(target_dir):
+    with ExecutionContext(target_dir) as context:
+        return run_fbinfer_in_context(context, target_dir)
+
+
+def run_fbinfer_in_context(context, target_dir):
     build_system = determine_build_system(target_dir)
     result_dir = generate_analysis_output_folderpath(target_dir, 'infer')
     infer_invocation_command = [f"{INFER_INSTALL_PATH}/infer", "run"]
     infer_invocation_command.extend(INFER_ALL_JAVA_FLAGS)
     infer_invocation_command.extend(["-o", result_dir, "--"])
-    os.chdir(target_dir)
     if build_system == BuildSystem.UNSUPPORTED:
         LOG.warning("No supported build system found to build " + target_dir)
     elif build_system == BuildSystem.Ant:
         infer_invocation_command.extend(["ant", "test"])
     elif build_system == BuildSystem.CMake:
-        subprocess.run(["mkdir", "-p", CMAKE_BUILD_DIRECTORY_NAME])
-        os.chdir(CMAKE_BUILD_DIRECTORY_NAME)
-        subprocess.run(["spacomp_cmake", ".."])
-        os.chdir("..")
+        os.makedirs(context.path(CMAKE_BUILD_DIRECTORY_NAME), exist_ok=True)
+        context.subcontext(CMAKE_BUILD_DIRECTORY_NAME).run(["spacomp_cmake", ".."])
         infer_invocation_command = [f"{INFER_INSTALL_PATH}/infer", "run", "-o", result_dir, "--compilation-database",
                                     "cmakebuild_compilecommand/compile_commands.json"]
     elif build_system == BuildSystem.Gradle:
@@ -144,7 +160,7 @@ def run_fbinfer_on_target(target_dir):
     else:
         LOG.warning("Build system is not supported by Infer")
     LOG.info(f"FB Infer running on {target_dir}")
-    infer_run = time_invocation_log('java', 'infer', infer_invocation_command)
+    infer_run = time_invocation_log('java', 'infer', infer_invocation_command, context)
     if infer_run.returncode != 0:
         # log error to some file
         # for now, will print stdout and stderr
@@ -153,8 +169,10 @@ def run_fbinfer_on_target(target_dir):
         LOG.error(str(infer_run.stderr.decode('utf-8')))
         return False
     else:
-        return convert_and_store_to_codechecker(f"{result_dir}/infer-out", f"{result_dir}/infer_results",
-                                                "fbinfer", f'"{os.path.dirname(target_dir)}_infer"', args.server_product)
+        # Infer was run with -o result_dir, so its report.json is right there, with paths relative to target_dir
+        return convert_and_store_to_codechecker(result_dir, f"{result_dir}/infer_results", "fbinfer",
+                                                f'"{os.path.dirname(target_dir)}_infer"', args.server_product,
+                                                source_root=target_dir)
 
 
 java_analyzer_mapping = {
@@ -164,22 +182,38 @@ java_analyzer_mapping = {
 }
 
 def get_analyzer_funcs(toolnames):
-    def inner(tool):
-        return java_analyzer_mapping.get(tool, None)
+    """Returns (tool name, runner) pairs for the requested tools"""
     if 'all' in toolnames:
-        return [t for t in java_analyzer_mapping.items()]
+        return list(java_analyzer_mapping.items())
     else:
-        return [inner(t) for t in toolnames if t is not None]
+        return [(t, java_analyzer_mapping[t]) for t in toolnames if t in java_analyzer_mapping]
 
 
 def run_analyzers_on_project(project_base_path, funcs):
     project_abs_path = str(pathlib.Path(project_base_path).absolute())
     LOG.info("Running on project " + str(project_abs_path) + "\n")
 
-    for runner in funcs:
+    for _, runner in funcs:
         runner(project_abs_path)
 
 
+def log_job_result(job_result):
+    if job_result.succeeded:
+        LOG.info(f"{job_result.job} finished in {job_result.duration:.1f}s")
+    else:
+        LOG.error(f"{job_result.job} failed: {job_result.error}")
+
+
+def run_analyzers_in_parallel(dirs, funcs, options):
+    """
+    Runs every (project, tool) pair as its own job, as many in parallel as options.jobs allows,
+    with the per job budgets of options
+    """
+    jobs = [make_job(options, d, tool, partial(runner, str(pathlib.Path(d).absolute())))
+            for d in dirs for tool, runner in funcs]
+    return AnalysisScheduler(max_jobs=options.jobs or None).run(jobs, on_complete=log_job_result)
+
+
 if __name__ == "__main__":
     args = parser.parse_args()
     if not os.path.isdir(args.path):
@@ -189,7 +223,18 @@ if __name__ == "__main__":
     analyzer_funcs = get_analyzer_funcs(tools_list)
     dirs = [os.path.abspath(args.path)]
     if args.recursive:
-        dirs = [os.path.abspath(d) for d in next(os.walk(args.path))[1]]
-    for d in dirs:
-        print("Running analyzers on " + d)
-        run_analyzers_on_project(d, analyzer_funcs)
+        dirs = [os.path.abspath(os.path.join(args.path, d)) for d in next(os.walk(args.path))[1]]
+    if args.jobs == 1:
+        # Results are stored in the background while the next analyses run
+        with StoreQueue() as store_queue:
+            set_store_queue(store_queue)
+            for d in dirs:
+                print("Running analyzers on " + d)
+                run_analyzers_on_project(d, analyzer_funcs)
+        set_store_queue(None)
+        failed_runs = store_queue.get_failed_runs()
+        if failed_runs:
+            print(f"Storing results failed for {', '.join(failed_runs)}")
+            exit(1)
+    else:
+        run_analyzers_in_parallel(dirs, analyzer_funcs, args)
@@ -4,14 +4,23 @@ import xml.etree.ElementTree as ET
 from collections import namedtuple
 import subprocess
 import os
+import re
 import logging
 from dotenv import load_dotenv
 import argh
 import pickle
+import tempfile
+import time
+from metrics_store import MetricsStore
+import native_loc_counter
+from loc_cache import LoCCache
+import git_object_loc
 script_path = os.path.abspath(os.path.dirname(__file__))
 
 load_dotenv(f"{script_path}/.env")
 CLOC_BIN = os.getenv("CLOC_BIN", '/usr/bin/cloc')
+# "native" counts in-process with native_loc_counter, "cloc" runs the cloc binary
+LOC_COUNTER = os.getenv("SPACOMP_LOC_COUNTER", "native")
 
 logging.basicConfig(filename="CLOC.log", format='%(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p', level=logging.DEBUG)
 LOG = logging.getLogger("CLOC")
@@ -34,6 +43,8 @@ class ProjectSize(IntEnum):
             return ProjectSize.Large
 
 
+LangData = namedtuple("LangData", ["files", "blank", "commented", "code"])
+
 
 class LoCData:
     project_path = ''
@@ -78,12 +89,31 @@ class LoCData:
         for l in langs:
             if l.tag == "language":
                 attr = l.attrib
-                LangData = namedtuple("LangData", ["files", "blank", "commented", "code"])
                 lang_data_dict[attr["name"]] = LangData(int(attr["files_count"]), int(attr["blank"]),
                                                         int(attr["comment"]), int(attr["code"]))
                 size += int(attr["code"])
         return LoCData(lang_data_dict, size, run_path)
 
+    @staticmethod
+    def make_from_counts(counts, run_path):
+        """From the per language [files, blank, comment, code] counts of native_loc_counter"""
+        if not counts:
+            return None
+        lang_data_dict = {language: LangData(*c) for language, c in counts.items()}
+        return LoCData(lang_data_dict, sum(d.code for d in lang_data_dict.values()), run_path)
+
+    def to_cloc_xml(self):
+        """The counts in the format of cloc --xml, so they can be written where cloc output is expected"""
+        results = ET.Element("results")
+        languages = ET.SubElement(results, "languages")
+        for name, data in self.lang_data.items():
+            ET.SubElement(languages, "language", name=name, files_count=str(data.files), blank=str(data.blank),
+                          comment=str(data.commented), code=str(data.code))
+        ET.SubElement(languages, "total", sum_files=str(sum(d.files for d in self.lang_data.values())),
+                      blank=str(sum(d.blank for d in self.lang_data.values())),
+                      comment=str(sum(d.commented for d in self.lang_data.values())), code=str(self.total_code_size))
+        return '<?xml version="1.0" encoding="UTF-8"?>' + ET.tostring(results, encoding="unicode")
+
     def classify(self, language="C++"):
         """Return Small, Medium, or large-scale based on #LoC for language of interest"""
         # Small = <10k LoC
@@ -111,6 +141,8 @@ def run_cloc_on_file(directory, file):
     if not os.path.isabs(file):
         print("ERROR: file path is not absolute. Perhaps try with " + directory + file + " instead")
         return None
+    if LOC_COUNTER == "native":
+        return LoCData.make_from_counts(native_loc_counter.count_files([file], workers=1), file)
     cloc_res = subprocess.run([f"{CLOC_BIN}/cloc", '--xml', '--quiet', file], capture_output=True)
     if cloc_res.stderr:
         LOG.error("CLOC error for repo: " + str(cloc_res.stderr))
@@ -120,7 +152,71 @@ def run_cloc_on_file(directory, file):
         return LoCData.make_from_string(output, file)
 
 
+def count_code_lines(file):
+    """Non-blank lines of a file, for when cloc is not available"""
+    try:
+        with open(file, "rb") as f:
+            return sum(1 for line in f if line.strip())
+    except OSError:
+        return 0
+
+
+def cloc_by_file(files):
+    """Code lines per file (by absolute path), counted with a single cloc invocation where possible"""
+    files = [os.path.abspath(f) for f in files]
+    if LOC_COUNTER == "native":
+        native_counts = LoCCache().get_file_counts(files, workers=1)
+        return {f: c[3] if c else count_code_lines(f) for f, c in zip(files, native_counts)}
+    counts = {}
+    with tempfile.NamedTemporaryFile("w", suffix=".txt") as list_file:
+        list_file.write("\n".join(files))
+        list_file.flush()
+        try:
+            cloc_res = subprocess.run([f"{CLOC_BIN}/cloc", '--by-file', '--xml', '--quiet',
+                                       f'--list-file={list_file.name}'], capture_output=True)
+        except OSError as e:
+            LOG.error("CLOC could not be run: " + str(e))
+            cloc_res = None
+    if cloc_res is not None and cloc_res.returncode == 0 and cloc_res.stdout.strip():
+        root = ET.fromstring(cloc_res.stdout.decode("utf-8").strip())
+        for file_element in root.iter("file"):
+            counts[os.path.abspath(file_element.attrib["name"])] = int(file_element.attrib["code"])
+    for file in files:
+        if file not in counts:
+            counts[file] = count_code_lines(file)
+    return counts
+
+
+def native_cloc(languages, top_folder=".", perl_dir_filter="", perl_file_filter='', workers=None, use_cache=True):
+    """
+    Same counts as cloc_invocation, counted in-process on workers processes (None for one per core).
+    With use_cache, only files whose content is not in the LoC cache yet are counted
+    """
+    counter = LoCCache() if use_cache else native_loc_counter
+    try:
+        counts = counter.count_tree(top_folder, languages, perl_dir_filter, perl_file_filter, workers)
+    except re.error as e:
+        LOG.error("Invalid filter for repo: " + top_folder + ": " + str(e))
+        return None
+    LOG.debug("Native LoC count for repo: " + top_folder + ": " + str(counts))
+    return LoCData.make_from_counts(counts, top_folder)
+
+
+def git_object_cloc(languages, repository_dir, perl_dir_filter="", perl_file_filter='', revision="HEAD"):
+    """Same counts as cloc_invocation, but of a revision of a bare clone, read from its git objects"""
+    try:
+        counts = git_object_loc.count_git_tree(repository_dir, languages, perl_dir_filter, perl_file_filter, revision,
+                                               LoCCache())
+    except (re.error, subprocess.CalledProcessError) as e:
+        LOG.error("Counting git objects failed for repo: " + repository_dir + ": " + str(e))
+        return None
+    LOG.debug("Git object LoC count for repo: " + repository_dir + ": " + str(counts))
+    return LoCData.make_from_counts(counts, repository_dir)
+
+
 def cloc_invocation(languages, top_folder=".", perl_dir_filter="", perl_file_filter='', disable_timeout=False):
+    if LOC_COUNTER == "native":
+        return native_cloc(languages, top_folder, perl_dir_filter, perl_file_filter)
     directory_filter = "--match-d=" + perl_dir_filter if perl_dir_filter != "" else ""
     file_filter = '--match-f=' + perl_file_filter if perl_file_filter != '' else ''
     invocation = [f"{CLOC_BIN}/cloc", f'--include-lang={",".join(languages)}', '--xml', '--quiet']
@@ -147,6 +243,11 @@ def get_cloc_store_csv(basepath, result_directory='.',
                        reject_projects='', clear_cache=False,
                        disable_timeout=False, perl_folder_filter='',
                        perl_file_filter='', append_log_name=''):
+    """
+    Counts C/C++ LoC of every project in basepath, stored as csv files and in the metrics database.
+    Existing csv files are only kept with the cloc counter, the native one recounts just the changed files anyway
+    """
+    metrics_store = MetricsStore()
     proj_list = glob.glob(f"{basepath}/**/", recursive=False)
     rejected = reject_projects.split(';')
     proj_list_names = [(os.path.basename(os.path.dirname(t)), os.path.dirname(t)) for t in proj_list]
@@ -155,16 +256,47 @@ def get_cloc_store_csv(basepath, result_directory='.',
 
     for name, path in proj_list_names:
         result_file_name = f"{result_directory}/{name}_LoCData{append_log_name}.csv"
-        if not os.path.exists(result_file_name) or clear_cache:
+        if not os.path.exists(result_file_name) or clear_cache or LOC_COUNTER == "native":
             cloc_result = cloc_invocation(["C", "C++", 'C/C++ Header'], path, perl_folder_filter, perl_file_filter)
             if cloc_result is not None:
                 cloc_result.project_name = name
+                metrics_store.record_loc(path, cloc_result)
                 with open(result_file_name, 'w') as fp:
                     fp.write(f'name,language,files,code\n')
                     fp.write(cloc_result.save_to_string())
 
 
+def benchmark_loc_counters(top_folder, languages="C;C++;C/C++ Header;Java;Python", repeat=3):
+    """
+    Times the native counter against cloc on top_folder and prints where their counts differ.
+    The native counter does not use the LoC cache here, so every repetition counts all files
+    """
+    global LOC_COUNTER
+    languages = languages.split(";")
+    counters = {"native": lambda: native_cloc(languages, top_folder, use_cache=False),
+                "cloc": lambda: cloc_invocation(languages, top_folder, disable_timeout=True)}
+    results = {}
+    previous_counter = LOC_COUNTER
+    try:
+        for counter, count in counters.items():
+            LOC_COUNTER = counter
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results[counter] = count()
+                timings.append(time.perf_counter() - start)
+            print(f"{counter}: best {min(timings):.2f}s of {repeat}, "
+                  f"{results[counter].total_code_size if results[counter] else 'no'} code lines")
+    finally:
+        LOC_COUNTER = previous_counter
+    if results["native"] and results["cloc"]:
+        for language in sorted(set(results["native"].lang_data) | set(results["cloc"].lang_data)):
+            native, cloc = results["native"].lang_data.get(language), results["cloc"].lang_data.get(language)
+            if native != cloc:
+                print(f"{language}: native {native}, cloc {cloc}")
+
+
 parser = argh.ArghParser()
-parser.add_commands([get_cloc_store_csv])
+parser.add_commands([get_cloc_store_csv, benchmark_loc_counters])
 if __name__ == '__main__':
     parser.dispatch()
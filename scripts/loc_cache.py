@@ -0,0 +1,169 @@
+import logging
+import os
+import pathlib
+import subprocess
+
+from native_loc_counter import get_language, iter_file_counts, sum_file_counts, find_source_files
+from sqlite_utils import connect_database
+
+LOG = logging.getLogger("LOC_CACHE")
+
+SCRIPT_PATH = pathlib.Path(__file__).parent.absolute()
+DEFAULT_LOC_CACHE_DB = os.getenv("SPACOMP_LOC_CACHE", f"{SCRIPT_PATH}/.loc_cache.db")
+# Stays below SQLite's limit of host parameters in a statement
+QUERY_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_loc (
+    digest TEXT NOT NULL,
+    language TEXT NOT NULL,
+    blank INTEGER,
+    comment INTEGER,
+    code INTEGER,
+    PRIMARY KEY (digest, language)
+);
+CREATE TABLE IF NOT EXISTS file_stat (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    digest TEXT NOT NULL
+);
+"""
+
+
+def _batches(items):
+    items = list(items)
+    for i in range(0, len(items), QUERY_BATCH_SIZE):
+        yield items[i:i + QUERY_BATCH_SIZE]
+
+
+def get_git_blob_digests(top_folder):
+    """
+    Blob SHA per absolute path of the files of the git checkout top_folder is in, leaving out files that differ
+    from the index. Empty if top_folder is not in a git checkout
+    """
+    try:
+        toplevel = subprocess.run(["git", "-C", top_folder, "rev-parse", "--show-toplevel"], capture_output=True)
+        if toplevel.returncode != 0:
+            return {}
+        toplevel = toplevel.stdout.decode("utf-8").strip()
+        index = subprocess.run(["git", "-C", toplevel, "ls-files", "-s", "-z"], capture_output=True, check=True)
+        modified = subprocess.run(["git", "-C", toplevel, "diff-files", "--name-only", "-z"],
+                                  capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        LOG.warning(f"Could not read the git index of {top_folder}: {e}")
+        return {}
+    modified = set(modified.stdout.decode("utf-8", errors="surrogateescape").split("\0"))
+    digests = {}
+    for line in index.stdout.decode("utf-8", errors="surrogateescape").split("\0"):
+        if not line:
+            continue
+        info, path = line.split("\t", 1)
+        mode, digest, stage = info.split(" ")
+        # Submodules are commits, not blobs, and conflicted files have no single content
+        if mode == "160000" or stage != "0" or path in modified:
+            continue
+        digests[os.path.join(toplevel, path)] = digest
+    return digests
+
+
+class LoCCache:
+    """
+    Per file LoC counts keyed on the content of the file, the git blob SHA of it. In git checkouts the digests of
+    unmodified files come from the index, of other files from their size and modification time when these did not
+    change since they were last counted. Only new content is read and counted, totals are summed from the cache
+    """
+    def __init__(self, db_path=DEFAULT_LOC_CACHE_DB):
+        self.db_path = str(db_path)
+        with connect_database(self.db_path) as connection:
+            connection.executescript(SCHEMA)
+
+    def _get_known_digests(self, connection, paths, git_digests):
+        digests = {p: git_digests[p] for p in paths if p in git_digests}
+        stats = {}
+        for path in paths:
+            if path in digests:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stats[path] = (stat.st_size, stat.st_mtime_ns)
+        for batch in _batches(stats):
+            for path, size, mtime_ns, digest in connection.execute(
+                    f"SELECT path, size, mtime_ns, digest FROM file_stat WHERE path IN ({','.join('?' * len(batch))})",
+                    batch):
+                if stats[path] == (size, mtime_ns):
+                    digests[path] = digest
+        return digests, stats
+
+    def _get_cached_counts(self, connection, digests):
+        cached = {}
+        for batch in _batches(set(digests)):
+            for digest, language, blank, comment, code in connection.execute(
+                    f"SELECT digest, language, blank, comment, code FROM file_loc "
+                    f"WHERE digest IN ({','.join('?' * len(batch))})", batch):
+                cached[(digest, language)] = (blank, comment, code)
+        return cached
+
+    @staticmethod
+    def _add_counts(connection, file_counts):
+        connection.executemany("INSERT OR REPLACE INTO file_loc (digest, language, blank, comment, code) "
+                               "VALUES (?, ?, ?, ?, ?)", [(c[4], *c[:4]) for c in file_counts])
+
+    def get_cached_counts(self, digests):
+        """(blank, comment, code) per (digest, language) in the cache, for content that was counted before"""
+        with connect_database(self.db_path) as connection:
+            return self._get_cached_counts(connection, digests)
+
+    def add_counts(self, file_counts):
+        """Caches count_file results, (language, blank, comment, code, digest)"""
+        with connect_database(self.db_path) as connection:
+            self._add_counts(connection, file_counts)
+
+    def get_file_counts(self, paths, workers=None, top_folder=None):
+        """
+        count_file results of paths, from the cache where the content is known and counted on workers processes
+        (None for one per core) otherwise. top_folder is where to look for a git checkout, if any
+        """
+        paths = [os.path.abspath(p) for p in paths]
+        git_digests = get_git_blob_digests(top_folder) if top_folder and os.path.isdir(top_folder) else {}
+        with connect_database(self.db_path) as connection:
+            digests, stats = self._get_known_digests(connection, paths, git_digests)
+            cached = self._get_cached_counts(connection, digests.values())
+            results = {}
+            misses = []
+            for path in paths:
+                language = get_language(path)
+                counts = cached.get((digests.get(path), language))
+                if counts is None:
+                    misses.append(path)
+                else:
+                    results[path] = (language, *counts, digests[path])
+            LOG.info(f"{len(paths) - len(misses)} of {len(paths)} files counted from the LoC cache")
+            new_counts = []
+            new_stats = []
+            for path, result in zip(misses, iter_file_counts(misses, workers)):
+                results[path] = result
+                if result is None:
+                    continue
+                new_counts.append(result)
+                if path in stats:
+                    new_stats.append((path, *stats[path], result[4]))
+            self._add_counts(connection, new_counts)
+            connection.executemany("INSERT OR REPLACE INTO file_stat (path, size, mtime_ns, digest) "
+                                   "VALUES (?, ?, ?, ?)", new_stats)
+        return [results[path] for path in paths]
+
+    def count_files(self, paths, workers=None, top_folder=None):
+        """Per language [files, blank, comment, code] of paths"""
+        return sum_file_counts(self.get_file_counts(paths, workers, top_folder))
+
+    def count_tree(self, top_folder, languages, dir_filter="", file_filter="", workers=None):
+        return self.count_files(find_source_files(top_folder, languages, dir_filter, file_filter), workers,
+                                top_folder)
+
+    def clear(self):
+        with connect_database(self.db_path) as connection:
+            connection.execute("DELETE FROM file_loc")
+            connection.execute("DELETE FROM file_stat")
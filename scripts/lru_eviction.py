@@ -0,0 +1,26 @@
+import os
+
+
+def mark_used(path):
+    # Modification time of the entry doubles as its last use, for LRU eviction
+    os.utime(path)
+
+
+def evict_least_recently_used(entries, max_size_bytes, remove):
+    """
+    Calls remove on the least recently used of the (path, size) entries until the rest fit into max_size_bytes.
+    Entries are ordered by their modification time, see mark_used
+    """
+    last_used_entries = []
+    for path, size in entries:
+        try:
+            last_used_entries.append((os.stat(path).st_mtime_ns, size, path))
+        except FileNotFoundError:
+            continue
+    total_size = sum(size for _, size, _ in last_used_entries)
+    last_used_entries.sort()
+    for _, size, path in last_used_entries:
+        if total_size <= max_size_bytes:
+            break
+        remove(path)
+        total_size -= size
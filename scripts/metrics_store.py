@@ -0,0 +1,239 @@
+import os
+import pathlib
+from datetime import datetime
+
+from sqlite_utils import connect_database
+
+SCRIPT_PATH = pathlib.Path(__file__).parent.absolute()
+DEFAULT_METRICS_DB = os.getenv("SPACOMP_METRICS_DB", f"{SCRIPT_PATH}/spacomp_metrics.db")
+# Identifies the framework run invocations belong to, processes forked off by a run share it
+RUN_ID = os.getenv("SPACOMP_RUN_ID", f"{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}_{os.getpid()}")
+DEFAULT_REGRESSION_THRESHOLD = 1.25
+C_FAMILY_LANGUAGES = ("C", "C++", "C/C++ Header")
+# LoC languages covered by the invocations of a language, analyses of C or C++ projects cover all of the C family
+INVOCATION_LOC_LANGUAGES = {"c": C_FAMILY_LANGUAGES, "c++": C_FAMILY_LANGUAGES, "c_cpp": C_FAMILY_LANGUAGES,
+                            "java": ("Java",), "python": ("Python",)}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invocations (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    language TEXT NOT NULL,
+    tool TEXT NOT NULL,
+    project TEXT NOT NULL,
+    invocation TEXT NOT NULL,
+    returncode INTEGER,
+    wall_seconds REAL,
+    user_seconds REAL,
+    sys_seconds REAL,
+    max_rss_kb INTEGER,
+    peak_tree_rss_kb INTEGER,
+    read_bytes INTEGER,
+    write_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS invocations_tool_project ON invocations (tool, project);
+CREATE TABLE IF NOT EXISTS project_loc (
+    project TEXT NOT NULL,
+    language TEXT NOT NULL,
+    files INTEGER,
+    code INTEGER,
+    timestamp TEXT NOT NULL,
+    PRIMARY KEY (project, language)
+);
+"""
+
+
+def get_project_key(project):
+    """Projects are identified by their absolute path, so projects with the same directory name are kept apart"""
+    return os.path.normpath(os.path.abspath(str(project)))
+
+
+def find_loc_project(project_loc, project):
+    """
+    Key of the project with LoC data that the invocation project path is in. Invocations may run in a subdirectory
+    of the project, like its build directory. None if there is no LoC data for it
+    """
+    path = get_project_key(project)
+    while True:
+        if path in project_loc:
+            return path
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def get_invocation_loc(language_loc, language):
+    """LoC of the languages the invocations of language analyse, None if none of them were counted"""
+    loc_languages = INVOCATION_LOC_LANGUAGES.get(language, language_loc.keys())
+    counts = [language_loc[loc_language] for loc_language in loc_languages if loc_language in language_loc]
+    return sum(counts) if counts else None
+
+
+def percentile(values, p):
+    """p-th percentile (0-100) of values, interpolating linearly between the closest ranks"""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+class MetricsStore:
+    """
+    SQLite database of the resource usage of analyzer invocations across framework runs,
+    together with the size of the analysed projects, so the cost of the analyzers can be compared
+    """
+    def __init__(self, db_path=DEFAULT_METRICS_DB):
+        self.db_path = str(db_path)
+        with connect_database(self.db_path) as connection:
+            connection.executescript(SCHEMA)
+
+    def record_invocation(self, language, tool, project, invocation, returncode, resource_usage, run_id=RUN_ID):
+        usage = resource_usage.as_dict()
+        with connect_database(self.db_path) as connection:
+            connection.execute(
+                "INSERT INTO invocations (run_id, timestamp, language, tool, project, invocation, returncode, "
+                "wall_seconds, user_seconds, sys_seconds, max_rss_kb, peak_tree_rss_kb, read_bytes, write_bytes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, datetime.now().isoformat(timespec="seconds"), language.lower(), tool, str(project),
+                 " ".join(str(i) for i in invocation), returncode, usage["wall_seconds"], usage["user_seconds"],
+                 usage["sys_seconds"], usage["max_rss_kb"], usage["peak_tree_rss_kb"], usage["read_bytes"],
+                 usage["write_bytes"]))
+
+    def record_loc(self, project, loc_data):
+        """Stores the per language LoC counts of a LoCData from line_of_code_counter for the project path"""
+        timestamp = datetime.now().isoformat(timespec="seconds")
+        with connect_database(self.db_path) as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO project_loc (project, language, files, code, timestamp) VALUES (?, ?, ?, ?, ?)",
+                [(get_project_key(project), language, data.files, data.code, timestamp)
+                 for language, data in loc_data.lang_data.items()])
+
+    def get_project_loc(self):
+        """LoC per language per project path"""
+        project_loc = {}
+        with connect_database(self.db_path) as connection:
+            for project, language, code in connection.execute("SELECT project, language, code FROM project_loc"):
+                project_loc.setdefault(project, {})[language] = code
+        return project_loc
+
+    def get_projects(self):
+        """Paths of all projects with recorded invocations"""
+        with connect_database(self.db_path) as connection:
+            return [project for (project,) in connection.execute("SELECT DISTINCT project FROM invocations")]
+
+    def get_run_totals(self, tool=None):
+        """
+        Summed wall time and largest peak memory per (tool, project, language, run), leaving out timed out
+        invocations.
+        Returned in order of the runs, oldest first
+        """
+        query = ("SELECT tool, project, language, run_id, SUM(wall_seconds), SUM(user_seconds + sys_seconds), "
+                 "MAX(peak_tree_rss_kb), MIN(timestamp) FROM invocations WHERE returncode IS NOT NULL")
+        parameters = ()
+        if tool:
+            query += " AND tool = ?"
+            parameters = (tool,)
+        query += " GROUP BY tool, project, language, run_id ORDER BY MIN(timestamp)"
+        with connect_database(self.db_path) as connection:
+            return connection.execute(query, parameters).fetchall()
+
+
+def get_tool_throughput(store):
+    """
+    Per tool, analysed language and project size class: number of analysed projects, wall time and LoC/s
+    percentiles and the largest peak memory use. Only the LoC of the languages a run analysed count towards its
+    throughput and size class. Projects without LoC data only count towards the wall time
+    """
+    from line_of_code_counter import ProjectSize
+    project_loc = store.get_project_loc()
+    groups = {}
+    for tool, project, language, _, wall_seconds, _, peak_rss_kb, _ in store.get_run_totals():
+        loc_project = find_loc_project(project_loc, project)
+        loc = get_invocation_loc(project_loc[loc_project], language) if loc_project else None
+        size_class = ProjectSize.get_size_from_loc_count(loc).name if loc is not None else "Unknown"
+        group = groups.setdefault((tool, language, size_class), {"walls": [], "throughputs": [], "peak_rss_kb": 0})
+        group["walls"].append(wall_seconds)
+        if loc is not None and wall_seconds:
+            group["throughputs"].append(loc / wall_seconds)
+        group["peak_rss_kb"] = max(group["peak_rss_kb"], peak_rss_kb or 0)
+    rows = []
+    for (tool, language, size_class), group in sorted(groups.items()):
+        rows.append({"tool": tool, "language": language, "size_class": size_class, "runs": len(group["walls"]),
+                     "wall_p50": percentile(group["walls"], 50), "wall_p90": percentile(group["walls"], 90),
+                     "loc_per_second_p10": percentile(group["throughputs"], 10),
+                     "loc_per_second_p50": percentile(group["throughputs"], 50),
+                     "peak_rss_kb": group["peak_rss_kb"]})
+    return rows
+
+
+def get_regressions(store, threshold=DEFAULT_REGRESSION_THRESHOLD, tool=None):
+    """
+    (tool, project, language) triples whose latest run took threshold times the wall time or memory of the run
+    before
+    """
+    previous_totals = {}
+    latest_totals = {}
+    for tool_name, project, language, run_id, wall_seconds, _, peak_rss_kb, _ in store.get_run_totals(tool):
+        key = (tool_name, project, language)
+        if key in latest_totals:
+            previous_totals[key] = latest_totals[key]
+        latest_totals[key] = (run_id, wall_seconds, peak_rss_kb)
+    regressions = []
+    for key, (previous_run, previous_wall, previous_rss) in previous_totals.items():
+        latest_run, latest_wall, latest_rss = latest_totals[key]
+        wall_ratio = latest_wall / previous_wall if previous_wall else None
+        rss_ratio = latest_rss / previous_rss if previous_rss else None
+        if (wall_ratio or 0) >= threshold or (rss_ratio or 0) >= threshold:
+            regressions.append({"tool": key[0], "project": key[1], "language": key[2], "previous_run": previous_run,
+                                "latest_run": latest_run, "wall_ratio": wall_ratio, "peak_rss_ratio": rss_ratio})
+    return regressions
+
+
+def format_table(rows):
+    if not rows:
+        return "No data"
+    columns = list(rows[0])
+
+    def cell(value):
+        return f"{value:.2f}" if isinstance(value, float) else str(value)
+    widths = [max(len(c), *(len(cell(r[c])) for r in rows)) for c in columns]
+    lines = ["  ".join(c.ljust(w) for c, w in zip(columns, widths))]
+    lines.extend("  ".join(cell(r[c]).ljust(w) for c, w in zip(columns, widths)) for r in rows)
+    return "\n".join(lines)
+
+
+def throughput(db=DEFAULT_METRICS_DB):
+    """Print LoC/s and wall time percentiles per analyzer, analysed language and project size class"""
+    return format_table(get_tool_throughput(MetricsStore(db)))
+
+
+def regressions(db=DEFAULT_METRICS_DB, threshold=DEFAULT_REGRESSION_THRESHOLD, tool=None):
+    """Print (tool, project, language) triples that got slower or bigger since their previous run"""
+    return format_table(get_regressions(MetricsStore(db), threshold, tool))
+
+
+def count_loc(db=DEFAULT_METRICS_DB, languages="C;C++;C/C++ Header;Java;Python"):
+    """Count LoC of all recorded projects that have no LoC data yet"""
+    from line_of_code_counter import cloc_invocation
+    store = MetricsStore(db)
+    known_projects = store.get_project_loc()
+    for project in store.get_projects():
+        if find_loc_project(known_projects, project) is None and os.path.isdir(project):
+            loc_data = cloc_invocation(languages.split(";"), project)
+            if loc_data is not None:
+                store.record_loc(project, loc_data)
+                known_projects[get_project_key(project)] = {language: data.code
+                                                            for language, data in loc_data.lang_data.items()}
+
+
+if __name__ == "__main__":
+    # Imported here, so runners recording metrics do not need the CLI dependencies
+    import argh
+    parser = argh.ArghParser()
+    parser.add_commands([throughput, regressions, count_loc])
+    parser.dispatch()
@@ -1,14 +1,32 @@
+import base64
+import bisect
+import hashlib
+import heapq
 import itertools
+import pickle
+import tempfile
+import time
+from xml.parsers import expat
 
 from codechecker_interface import *
 from codechecker_common.plist_parser import parse_plist_file
 import os
 import pathlib
 import re
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Iterator, Iterable, Set
 from codechecker_common.report import Report
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
 from functools import partial
+from operator import attrgetter, itemgetter
+from report_cache import ReportCache, DEFAULT_CACHE_SIZE_BYTES
+from compact_report import CompactReport, parse_plist_file_compact
+
+try:
+    import numpy as np
+except ImportError:
+    # Optional, duplicate matching falls back to the pure Python sweep
+    np = None
 
 import logging
 logging.basicConfig(filename='SPA_Comparison.log', filemode='w', format='%(asctime)s %(message)s')
@@ -50,85 +68,363 @@ def prettify(dir_name):
     return "Unrecognized"
 
 
-def get_plist_reports_tool_pair(plist_result_dir: str) -> Tuple[List[Tuple[Dict[int, str], List[Report]]], str]:
+# Sections of a diagnostic the comparison never looks at, and which make up most of a plist
+PLIST_SKIPPED_KEYS = frozenset(['path', 'notes', 'macro_expansions', 'executed_lines'])
+_PLIST_LEAF_CONVERTERS = {
+    'string': lambda text: text,
+    'integer': int,
+    'real': float,
+    'date': lambda text: text,
+    'data': base64.b64decode,
+}
+
+
+class _PlistReader:
+    """expat handlers building plist values, dropping everything stored under one of skipped_keys"""
+    # Stands in for the key of array containers
+    _ARRAY = object()
+
+    def __init__(self, skipped_keys):
+        self.skipped_keys = skipped_keys
+        self.root = None
+        # Containers being built, each with the key the next value in it is stored under
+        self.stack = []
+        self.text = []
+        self.skip_depth = 0
+
+    def add_value(self, value):
+        if not self.stack:
+            self.root = value
+            return
+        container, key = self.stack[-1]
+        if key is self._ARRAY:
+            container.append(value)
+        else:
+            container[key] = value
+
+    def start_element(self, tag, _attributes):
+        if self.skip_depth:
+            self.skip_depth += 1
+        elif tag != 'key' and self.stack and self.stack[-1][1] in self.skipped_keys:
+            self.skip_depth = 1
+        elif tag == 'dict':
+            self.stack.append([{}, None])
+        elif tag == 'array':
+            self.stack.append([[], self._ARRAY])
+        self.text.clear()
+
+    def end_element(self, tag):
+        if self.skip_depth:
+            self.skip_depth -= 1
+        elif tag in ('dict', 'array'):
+            self.add_value(self.stack.pop()[0])
+        elif tag == 'key':
+            self.stack[-1][1] = ''.join(self.text)
+        elif tag in ('true', 'false'):
+            self.add_value(tag == 'true')
+        elif tag in _PLIST_LEAF_CONVERTERS:
+            self.add_value(_PLIST_LEAF_CONVERTERS[tag](''.join(self.text)))
+
+    def character_data(self, data):
+        if not self.skip_depth:
+            self.text.append(data)
+
+
+def read_plist(plist_file, skipped_keys=PLIST_SKIPPED_KEYS):
     """
-    Extracts the tool name and the reports from a report directory
+    Reads a plist file with an incremental expat pull parser.
+    Values stored under any of skipped_keys are dropped while reading, without ever being built
     """
-    dir_name = os.path.basename(plist_result_dir)
-    tool_name = re.match("(.*?)_result.*", dir_name).group(1)
-    plist_files = [filepath.absolute() for filepath in pathlib.Path(plist_result_dir).glob('./*.plist')]
-    plist_reports = list(map(parse_plist_file, plist_files))
-    plist_reports_remove_empties = [rep for rep in plist_reports if len(rep[1]) > 0]
-    return plist_reports_remove_empties, tool_name
+    reader = _PlistReader(skipped_keys)
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = reader.start_element
+    parser.EndElementHandler = reader.end_element
+    parser.CharacterDataHandler = reader.character_data
+    with open(plist_file, 'rb') as plist:
+        parser.ParseFile(plist)
+    return reader.root
+
+
+def parse_plist_file_fast(plist_file) -> Tuple[Dict[int, str], List[CompactReport]]:
+    """
+    Fast path for parse_plist_file_compact, reading only the parts of the plist that compact reports hold.
+    Reports are in the same order as from parse_plist_file, so they can still load their full report.
+    Truncated or malformed plists are logged and give no reports
+    """
+    try:
+        plist = read_plist(plist_file)
+        if not plist:
+            return {}, []
+        files = dict(enumerate(plist.get('files', [])))
+        reports = []
+        for index, diagnostic in enumerate(plist.get('diagnostics', [])):
+            location = diagnostic['location']
+            reports.append(CompactReport(files[location['file']], location['line'], location['col'],
+                                         diagnostic.get('check_name', 'unknown'), diagnostic['description'],
+                                         str(plist_file), index))
+    except (expat.ExpatError, KeyError, IndexError) as e:
+        # Same as parse_plist_file, which skips files it cannot parse
+        logging.error("Failed to parse plist file %s: %s", plist_file, e)
+        return {}, []
+    return files, reports
+
+
+def benchmark_plist_parsers(plist_dir, repeat=3):
+    """
+    Times parse_plist_file_compact against parse_plist_file_fast on all plist files below plist_dir,
+    checking that both give the same reports. Returns the best time per parser in seconds
+    """
+    plist_files = list(pathlib.Path(plist_dir).glob('**/*.plist'))
+    timings = {}
+    results = {}
+    for parse_func in (parse_plist_file_compact, parse_plist_file_fast):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parsed = [parse_func(plist_file) for plist_file in plist_files]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[parse_func.__name__] = best
+        results[parse_func.__name__] = [(files, [repr(report) for report in reports]) for files, reports in parsed]
+    if results['parse_plist_file_compact'] != results['parse_plist_file_fast']:
+        raise ValueError("Fast plist parser disagrees with parse_plist_file on " + str(plist_dir))
+    for name, elapsed in timings.items():
+        print(f"{name}: {elapsed:.3f}s for {len(plist_files)} plist files")
+    return timings
 
 
-def collapse_reports_toolpair_list(reports_tool_list: List[Tuple[Report, str]]) -> List[Tuple[List[Report], str]]:
+DEFAULT_PARSE_CHUNKSIZE = 16
+
+
+def _parse_plist_file_cached(report_cache: ReportCache, parse_func, plist_file):
+    return report_cache.get_or_parse(plist_file, parse_func)
+
+
+def iter_parse_plist_files(plist_files, workers=1, chunksize=DEFAULT_PARSE_CHUNKSIZE,
+                           report_cache: ReportCache = None,
+                           compact=False) -> Iterator[Tuple[Dict[int, str], List[Report]]]:
     """
-    Given a list of (report, checktool) pairs, it returns the corresponding (List[Report], checktool) list
+    Lazily parses the given plist files, keeping the input order.
+    With more than one worker (None meaning one per core), parsing is fanned out over a process pool,
+    handing each worker chunksize files at a time.
+    If a report cache is given, only plist files missing from it are parsed.
+    If compact is set, CompactReport records are returned in place of full reports
     """
-    if not reports_tool_list:
-        return []
+    parse_func = parse_plist_file_fast if compact else parse_plist_file
+    if report_cache is not None:
+        parse_func = partial(_parse_plist_file_cached, report_cache, parse_func)
+    if workers is not None and workers <= 1:
+        yield from map(parse_func, plist_files)
     else:
-        current_tool = reports_tool_list[0][1]
-        tmp = list(map(lambda e: e[0],
-                       filter(lambda res_tool_pair: current_tool == res_tool_pair[1], reports_tool_list)))
-        tmp.sort(key=lambda r: r.line)  # Make sure reports are sorted by line
-        rest = list(filter(lambda res_tool_pair: current_tool != res_tool_pair[1], reports_tool_list))
-        return [(tmp, current_tool)] + collapse_reports_toolpair_list(rest)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from pool.map(parse_func, plist_files, chunksize=chunksize)
+    if report_cache is not None:
+        report_cache.evict()
 
 
-def get_duplicate_unique_list_pairs(report_tool_list: List[Tuple[Report, str]]) -> \
+def parse_plist_files(plist_files, workers=1, chunksize=DEFAULT_PARSE_CHUNKSIZE,
+                      report_cache: ReportCache = None, compact=False) -> List[Tuple[Dict[int, str], List[Report]]]:
+    return list(iter_parse_plist_files(plist_files, workers, chunksize, report_cache, compact))
+
+
+def get_tool_name(plist_result_dir) -> str:
+    dir_name = os.path.basename(plist_result_dir)
+    return re.match("(.*?)_result.*", dir_name).group(1)
+
+
+def get_plist_files(plist_result_dir) -> List[pathlib.Path]:
+    return [filepath.absolute() for filepath in pathlib.Path(plist_result_dir).glob('./*.plist')]
+
+
+def get_plist_reports_tool_pairs(plist_result_dirs, workers=1, chunksize=DEFAULT_PARSE_CHUNKSIZE,
+                                 report_cache: ReportCache = None, compact=False) -> \
+        List[Tuple[List[Tuple[Dict[int, str], List[Report]]], str]]:
+    """
+    Same as mapping get_plist_reports_tool_pair over the directories,
+    but the plist files of all directories share one pool of workers
+    """
+    plist_files_per_dir = [get_plist_files(d) for d in plist_result_dirs]
+    plist_reports = parse_plist_files(list(itertools.chain.from_iterable(plist_files_per_dir)),
+                                      workers, chunksize, report_cache, compact)
+    result = []
+    offset = 0
+    for plist_result_dir, plist_files in zip(plist_result_dirs, plist_files_per_dir):
+        dir_reports = plist_reports[offset:offset + len(plist_files)]
+        offset += len(plist_files)
+        plist_reports_remove_empties = [rep for rep in dir_reports if len(rep[1]) > 0]
+        result.append((plist_reports_remove_empties, get_tool_name(plist_result_dir)))
+    return result
+
+
+def get_plist_reports_tool_pair(plist_result_dir: str, workers=1, chunksize=DEFAULT_PARSE_CHUNKSIZE,
+                                report_cache: ReportCache = None, compact=False) -> \
+        Tuple[List[Tuple[Dict[int, str], List[Report]]], str]:
+    """
+    Extracts the tool name and the reports from a report directory
+    """
+    return get_plist_reports_tool_pairs([plist_result_dir], workers, chunksize, report_cache, compact)[0]
+
+
+def collapse_reports_toolpair_list(reports_tool_list: Iterable[Tuple[Report, str]]) -> List[Tuple[List[Report], str]]:
+    """
+    Given a list of (report, checktool) pairs, it returns the corresponding (List[Report], checktool) list.
+    Tools are listed in order of their first report, the reports of every tool are sorted by line
+    """
+    reports_per_tool = {}
+    for report, tool in reports_tool_list:
+        reports_per_tool.setdefault(tool, []).append(report)
+    for reports in reports_per_tool.values():
+        reports.sort(key=attrgetter('line'))  # Make sure reports are sorted by line
+    return [(reports, tool) for tool, reports in reports_per_tool.items()]
+
+
+def _build_line_column_index(report_tool_list: List[Tuple[Report, str]]) -> \
+        Dict[int, Tuple[List[int], Dict[int, List[int]]]]:
+    """
+    Buckets the positions of the reports by line and column.
+    Every line maps to its sorted list of columns and a column -> report positions lookup
+    """
+    index = {}
+    for pos, (report, _) in enumerate(report_tool_list):
+        columns, positions = index.setdefault(report.line, ([], {}))
+        if report.col not in positions:
+            bisect.insort(columns, report.col)
+            positions[report.col] = []
+        # Positions are appended in increasing order, so every bucket stays sorted
+        positions[report.col].append(pos)
+    return index
+
+
+def _pop_reports_in_range(index, line, col, col_distance, row_distance) -> List[int]:
+    """Removes and returns the positions of all indexed reports within the given line/column distance"""
+    found = []
+    for _line in range(line - row_distance, line + row_distance + 1):
+        bucket = index.get(_line)
+        if bucket is None:
+            continue
+        columns, positions = bucket
+        lo = bisect.bisect_left(columns, col - col_distance)
+        hi = bisect.bisect_right(columns, col + col_distance)
+        for _col in columns[lo:hi]:
+            found.extend(positions.pop(_col))
+        del columns[lo:hi]
+        if not columns:
+            del index[_line]
+    found.sort()
+    return found
+
+
+def _get_duplicate_unique_list_pairs_sweep(report_tool_list: List[Tuple[Report, str]], col_distance, row_distance) -> \
         Tuple[List[List[Tuple[Report, str]]], List[Tuple[Report, str]]]:
-    """Takes a list of reports and groups them as duplicated reports or as a list of unique reports"""
-    def split_list(__list, func, predicate_result):
-        predicate_is_true = [e for e in __list if func(e[0]) == predicate_result]
-        predicate_is_false = [e for e in __list if func(e[0]) != predicate_result]
-        return predicate_is_true, predicate_is_false
-
-    # Define inner recursive function that does the work
-    # TODO: May want to rewrite into loop, since appending to python lists is a mutable action anyways
-    # TODO: Some optimisation potential. Subsumed tools need not be checked against each other
-    #  and if there is only one tool left, we assume it's internally consistent and should not cause duplicates
-    def inner(_l: List[Tuple[Report, str]],
-              duplicates: List[List[Tuple[Report, str]]],
-              uniques: List[Tuple[Report, str]]):
-
-        if not _l:
-            return duplicates, uniques
-
-        # List unpacking
-        head, *tail = _l
-
-        match_head = partial(is_duplicate, head[0])
-        # Split tail based on duplicate status
-        # potential_duplicates = [e for e in tail if is_duplicate(head[0], e[0]) == DuplicateRelations.POTENTIAL_DUPLICATE]
-        # remainder = [e for e in tail if is_duplicate(head[0], e[0]) == DuplicateRelations.NO_DUPLICATE]
-        # subsumed_reports = [e for e in tail if is_duplicate(head[0], e[0]) == DuplicateRelations.NO_DUPLICATE]
-        potential_duplicates, __rest = split_list(tail, match_head, DuplicateRelations.POTENTIAL_DUPLICATE)
-        remainder, subsumed = split_list(__rest, match_head, DuplicateRelations.NO_DUPLICATE)
+    """Line/column index based matching, close to linear in the number of reports"""
+    index = _build_line_column_index(report_tool_list)
+    claimed = [False] * len(report_tool_list)
+    duplicates = []
+    uniques = []
+    for pos, head in enumerate(report_tool_list):
+        if claimed[pos]:
+            continue
+        potential_duplicates = []
+        subsumed = []
+        for other_pos in _pop_reports_in_range(index, head[0].line, head[0].col, col_distance, row_distance):
+            claimed[other_pos] = True
+            if other_pos == pos:
+                continue
+            other = report_tool_list[other_pos]
+            relation = is_duplicate(head[0], other[0], col_distance, row_distance)
+            if relation == DuplicateRelations.POTENTIAL_DUPLICATE:
+                potential_duplicates.append(other)
+            elif relation == DuplicateRelations.SUBSUMPTION:
+                subsumed.append(other)
 
         if len(subsumed) > 0:
             logging.info("head %s subsumes the following reports %s\n", str(head), str(subsumed))
-        # If we found duplicates, there are no unique findings, hence uniques is forwarded unchanged
+        # If we found duplicates, there are no unique findings
         if len(potential_duplicates) > 0:
             duplicates.append([head] + potential_duplicates)
         # Otherwise, head is a unique report
         else:
             uniques.append(head)
-        # Finally, we make the recursive call to keep processing
-        return inner(remainder,
-                     duplicates,
-                     uniques)
+    return duplicates, uniques
 
-    return inner(report_tool_list, list(), list())
 
+def _get_duplicate_unique_list_pairs_grouped(report_tool_list: List[Tuple[Report, str]]) -> \
+        Tuple[List[List[Tuple[Report, str]]], List[Tuple[Report, str]]]:
+    """
+    Matching for reports that have to be on the exact same line and column.
+    Being on the same position is an equivalence, so the first report of every position group claims the whole group.
+    Grouping is done as a NumPy sort on (line, col), with check name/description pairs interned as integers
+    """
+    count = len(report_tool_list)
+    lines = np.fromiter((report.line for report, _ in report_tool_list), dtype=np.int64, count=count)
+    cols = np.fromiter((report.col for report, _ in report_tool_list), dtype=np.int64, count=count)
+    interned = {}
+    checks = np.fromiter((interned.setdefault((report.check_name, report.description), len(interned))
+                          for report, _ in report_tool_list), dtype=np.int64, count=count)
+    # lexsort is stable, so every group is in list order and starts with the report claiming it
+    order = np.lexsort((cols, lines))
+    sorted_lines = lines[order]
+    sorted_cols = cols[order]
+    is_group_start = np.ones(count, dtype=bool)
+    is_group_start[1:] = (sorted_lines[1:] != sorted_lines[:-1]) | (sorted_cols[1:] != sorted_cols[:-1])
+    group_starts = np.flatnonzero(is_group_start)
+    group_sizes = np.diff(np.append(group_starts, count))
+    group_heads = order[group_starts]
+    same_check_as_head = checks[order] == checks[np.repeat(group_heads, group_sizes)]
+    # Everything NumPy had to do is done, the rest is only assembling the output lists
+    order = order.tolist()
+    same_check_as_head = same_check_as_head.tolist()
+    group_starts = group_starts.tolist()
+    group_sizes = group_sizes.tolist()
+    duplicates = []
+    uniques = []
+    # Visit the groups in the list order of their heads
+    for group in np.argsort(group_heads, kind="stable").tolist():
+        start = group_starts[group]
+        head = report_tool_list[order[start]]
+        if group_sizes[group] == 1:
+            uniques.append(head)
+            continue
+        members = range(start + 1, start + group_sizes[group])
+        potential_duplicates = [report_tool_list[order[i]] for i in members if not same_check_as_head[i]]
+        subsumed = [report_tool_list[order[i]] for i in members if same_check_as_head[i]]
 
-def get_reports_per_file(plist_result_directories):
+        if len(subsumed) > 0:
+            logging.info("head %s subsumes the following reports %s\n", str(head), str(subsumed))
+        if len(potential_duplicates) > 0:
+            duplicates.append([head] + potential_duplicates)
+        else:
+            uniques.append(head)
+    return duplicates, uniques
+
+
+# Below this, NumPy's per call overhead outweighs what it saves
+VECTORIZED_MATCHING_MIN_REPORTS = 64
+
+
+def get_duplicate_unique_list_pairs(report_tool_list: List[Tuple[Report, str]], col_distance=0, row_distance=0) -> \
+        Tuple[List[List[Tuple[Report, str]]], List[Tuple[Report, str]]]:
     """
-    Given a list of plist report directories
-    maps it to a file -> Reports per tool and file -> Duplicated/Unique reports tuple
+    Takes a list of reports and groups them as duplicated reports or as a list of unique reports.
+    Reports are visited in list order, each one claiming every not yet claimed report within
+    row_distance/col_distance of it.
+    Exact position matching on larger files is done with NumPy if it is available, the rest with a line/column sweep
     """
-    plist_reports_tool_map = list(map(get_plist_reports_tool_pair, plist_result_directories))
+    report_tool_list = list(report_tool_list)
+    if np is not None and col_distance == 0 and row_distance == 0 and \
+            len(report_tool_list) >= VECTORIZED_MATCHING_MIN_REPORTS:
+        return _get_duplicate_unique_list_pairs_grouped(report_tool_list)
+    return _get_duplicate_unique_list_pairs_sweep(report_tool_list, col_distance, row_distance)
+
+
+def compare_file_reports(report_tool_list: List[Tuple[Report, str]]) -> \
+        Tuple[List[Tuple[List[Report], str]], Tuple[List[List[Tuple[Report, str]]], List[Tuple[Report, str]]]]:
+    """Computes the per tool reports and the duplicate/unique split for the reports of a single file"""
+    return collapse_reports_toolpair_list(report_tool_list), get_duplicate_unique_list_pairs(report_tool_list)
+
+
+def group_reports_by_main_file(plist_reports_tool_map) -> Dict[str, Set[Tuple[Report, str]]]:
     filename_reports_key_val = {}
     for files_reports_list, tool_run in plist_reports_tool_map:
         # files_reports_list is a list of files, report list pairs
@@ -142,21 +438,184 @@ def get_reports_per_file(plist_result_directories):
                     filename_reports_key_val[report_main_file] = set()
                 # TODO: This causes many duplications due to several issues having the same "main" file
                 filename_reports_key_val[report_main_file].add((report, tool_run))
+    return filename_reports_key_val
+
+
+def get_reports_per_file(plist_result_directories, workers=1, chunksize=DEFAULT_PARSE_CHUNKSIZE,
+                         report_cache: ReportCache = None, compact=False):
+    """
+    Given a list of plist report directories
+    maps it to a file -> Reports per tool and file -> Duplicated/Unique reports tuple
+    """
+    plist_reports_tool_map = get_plist_reports_tool_pairs(plist_result_directories, workers, chunksize,
+                                                          report_cache, compact)
+    filename_reports_key_val = group_reports_by_main_file(plist_reports_tool_map)
+
+    collapsed_reports_tool_pair = {}
+    filename_reports_key_val_duplicates = {}
+    for filename, reports in filename_reports_key_val.items():
+        collapsed_reports_tool_pair[filename], filename_reports_key_val_duplicates[filename] = \
+            compare_file_reports(reports)
+    return collapsed_reports_tool_pair, filename_reports_key_val_duplicates
+
+
+def get_reports_fingerprint(report_tool_list: Iterable[Tuple[Report, str]], source_plists: Iterable = (),
+                            compact=False) -> str:
+    """
+    Fingerprint of everything the comparison of a file depends on, independent of report order.
+    Besides the reports, it covers the parse mode and the path, modification time and size of every plist
+    the reports came from, so stored reports never outlive (or refer to a different version of) their plist
+    """
+    entries = sorted((tool, report.line, report.col, report.check_name, report.description)
+                     for report, tool in report_tool_list)
+    sources = []
+    for plist_file in sorted(str(p) for p in source_plists):
+        stat = os.stat(plist_file)
+        sources.append((plist_file, stat.st_mtime_ns, stat.st_size))
+    return hashlib.sha1(repr(("compact" if compact else "full", sources, entries)).encode("utf-8")).hexdigest()
+
+
+def load_comparison_state(state_file) -> Dict[str, Tuple[str, List, Tuple]]:
+    """Returns the file -> (fingerprint, Reports per tool, Duplicated/Unique reports tuple) map of a previous run"""
+    if not os.path.exists(state_file):
+        return {}
+    try:
+        with open(state_file, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+        logging.warning("Ignoring unreadable comparison state %s: %s", state_file, e)
+        return {}
+
+
+def save_comparison_state(state_file, state):
+    tmp_state_file = f"{state_file}.tmp"
+    with open(tmp_state_file, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_state_file, state_file)
+
 
-    filename_reports_key_val_duplicates = dict(map(lambda e: (e[0],
-                                                              get_duplicate_unique_list_pairs(e[1])
-                                                              ),
-                                                   filename_reports_key_val.items()))
+def get_reports_per_file_incremental(plist_result_directories, state_file, workers=1,
+                                     chunksize=DEFAULT_PARSE_CHUNKSIZE, report_cache: ReportCache = None,
+                                     compact=False):
+    """
+    Same as get_reports_per_file, but only files whose reports changed since the run that wrote state_file
+    are compared again, the rest is taken over from the stored state. The state is updated afterwards
+    """
+    previous_state = load_comparison_state(state_file)
+    plist_files_tools = [(plist_file, get_tool_name(d))
+                         for d in plist_result_directories for plist_file in get_plist_files(d)]
+    parsed = iter_parse_plist_files([f for f, _ in plist_files_tools], workers, chunksize, report_cache, compact)
+    filename_reports_key_val = {}
+    filename_source_plists = {}
+    # parsed goes first, so it is run to its end (and its pool and cache cleaned up) before zip stops
+    for (_, reports), (plist_file, tool_run) in zip(parsed, plist_files_tools):
+        for report in reports:
+            filename_reports_key_val.setdefault(report.file_path, set()).add((report, tool_run))
+            filename_source_plists.setdefault(report.file_path, set()).add(plist_file)
 
-    collapsed_reports_tool_pair = dict(map(lambda e: (e[0], collapse_reports_toolpair_list(list(e[1]))),
-                                           filename_reports_key_val.items()))
+    state = {}
+    collapsed_reports_tool_pair = {}
+    filename_reports_key_val_duplicates = {}
+    for filename, reports in filename_reports_key_val.items():
+        fingerprint = get_reports_fingerprint(reports, filename_source_plists[filename], compact)
+        previous = previous_state.get(filename)
+        if previous is not None and previous[0] == fingerprint:
+            _, collapsed, duplicates_uniques = previous
+        else:
+            collapsed, duplicates_uniques = compare_file_reports(reports)
+        state[filename] = (fingerprint, collapsed, duplicates_uniques)
+        collapsed_reports_tool_pair[filename] = collapsed
+        filename_reports_key_val_duplicates[filename] = duplicates_uniques
+    recomputed = sum(1 for filename, entry in state.items()
+                     if filename not in previous_state or previous_state[filename][0] != entry[0])
+    logging.info("Incremental comparison recomputed %d of %d files", recomputed, len(state))
+    save_comparison_state(state_file, state)
     return collapsed_reports_tool_pair, filename_reports_key_val_duplicates
 
 
-def run_on_project_result(project_report_path):
+# Reports sorted in memory at a time before they are spilled to disk as a sorted run
+DEFAULT_SORT_RUN_REPORTS = 100000
+
+
+def _get_file_path(report_tool):
+    return str(report_tool[0].file_path)
+
+
+def _write_sorted_run(report_tool_list, run_path):
+    """Writes the reports sorted by main file, as one pickled (file, [(report, tool), ...]) record per file"""
+    report_tool_list.sort(key=_get_file_path)
+    with open(run_path, "wb") as run_file:
+        for file_path, group in itertools.groupby(report_tool_list, key=_get_file_path):
+            pickle.dump((file_path, list(group)), run_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _write_sorted_runs(plist_result_directories, tmp_dir, run_reports, workers, chunksize, report_cache,
+                       compact) -> List[str]:
+    """Parses all plist files, spilling every run_reports (report, tool) pairs to disk as a sorted run"""
+    plist_files_tools = [(plist_file, get_tool_name(d))
+                         for d in plist_result_directories for plist_file in get_plist_files(d)]
+    parsed = iter_parse_plist_files([f for f, _ in plist_files_tools], workers, chunksize, report_cache, compact)
+    run_paths = []
+    buffer = []
+    # parsed goes first, so it is run to its end (and its pool and cache cleaned up) before zip stops
+    for (_, reports), (_, tool_run) in zip(parsed, plist_files_tools):
+        buffer.extend((report, tool_run) for report in reports)
+        if len(buffer) >= run_reports:
+            run_paths.append(os.path.join(tmp_dir, f"run_{len(run_paths)}.pickle"))
+            _write_sorted_run(buffer, run_paths[-1])
+            buffer = []
+    if buffer:
+        run_paths.append(os.path.join(tmp_dir, f"run_{len(run_paths)}.pickle"))
+        _write_sorted_run(buffer, run_paths[-1])
+    return run_paths
+
+
+def _iter_sorted_run(run_path) -> Iterator[Tuple[str, List[Tuple[Report, str]]]]:
+    with open(run_path, "rb") as run_file:
+        while True:
+            try:
+                yield pickle.load(run_file)
+            except EOFError:
+                return
+
+
+def iter_reports_per_file(plist_result_directories, workers=1, chunksize=DEFAULT_PARSE_CHUNKSIZE,
+                          report_cache: ReportCache = None, compact=False,
+                          sort_run_reports=DEFAULT_SORT_RUN_REPORTS, sort_dir=None):
+    """
+    Streaming variant of get_reports_per_file, yielding
+    (file, Reports per tool, Duplicated/Unique reports tuple) one file at a time, in order of the file path.
+    Reports are external merge sorted by their main file: runs of sort_run_reports reports are sorted and
+    spilled to a temporary directory below sort_dir, then the runs are merged, one file at a time.
+    Memory use is bounded by sort_run_reports plus the reports of the largest file, not by the project size
+    """
+    with tempfile.TemporaryDirectory(prefix="report_runs_", dir=sort_dir) as tmp_dir:
+        run_paths = _write_sorted_runs(plist_result_directories, tmp_dir, sort_run_reports, workers, chunksize,
+                                       report_cache, compact)
+        merged = heapq.merge(*(_iter_sorted_run(run_path) for run_path in run_paths), key=itemgetter(0))
+        for filename, records in itertools.groupby(merged, key=itemgetter(0)):
+            reports = set()
+            for _, report_tool_list in records:
+                reports.update(report_tool_list)
+            collapsed, duplicates_uniques = compare_file_reports(reports)
+            yield filename, collapsed, duplicates_uniques
+
+
+def run_on_project_result(project_report_path, workers=1, chunksize=DEFAULT_PARSE_CHUNKSIZE, cache_dir=None,
+                          cache_size_bytes=DEFAULT_CACHE_SIZE_BYTES, compact=False, state_file=None):
+    """
+    If cache_dir is set, parsed plist files are cached there between runs.
+    If compact is set, the comparison works on CompactReport records, loading full reports only on access.
+    If state_file is set, only files whose reports changed since the last run with the same state file are compared
+    """
     result_directories = [filepath.absolute() for filepath in pathlib.Path(project_report_path).glob('./*results*')]
-    return get_reports_per_file(result_directories)
+    report_cache = ReportCache(cache_dir, cache_size_bytes) if cache_dir else None
+    if state_file:
+        return get_reports_per_file_incremental(result_directories, state_file, workers, chunksize,
+                                                report_cache, compact)
+    return get_reports_per_file(result_directories, workers, chunksize, report_cache, compact)
 
 
 if __name__ == "__main__":
-    run_on_project_result("./tests/plist")
+    # See benchmark_comparison.py for timing the comparison
+    run_on_project_result("./tests/plist", workers=None, cache_dir="./.report_cache", compact=True)
@@ -0,0 +1,170 @@
+import hashlib
+import mmap
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# Same language names as cloc, so counts can be used in place of cloc ones
+EXTENSION_LANGUAGES = {
+    '.c': 'C', '.ec': 'C', '.pgc': 'C',
+    '.cpp': 'C++', '.cc': 'C++', '.cxx': 'C++', '.c++': 'C++', '.C': 'C++', '.inl': 'C++', '.tcc': 'C++',
+    '.ipp': 'C++', '.pcc': 'C++',
+    '.h': 'C/C++ Header', '.hh': 'C/C++ Header', '.hpp': 'C/C++ Header', '.hxx': 'C/C++ Header',
+    '.H': 'C/C++ Header',
+    '.java': 'Java',
+    '.py': 'Python', '.pyw': 'Python',
+}
+# Directories cloc skips by default
+EXCLUDED_DIRECTORIES = frozenset(['.bzr', '.cvs', '.hg', '.git', '.svn', '.snapshot', '.config', 'CVS', 'RCS', 'SCCS'])
+# Smaller files are read in one go, mapping them costs more than it saves
+MMAP_MIN_SIZE = 256 * 1024
+DEFAULT_FILES_PER_TASK = 64
+
+# Comments are matched together with string literals, so comment markers within strings are left alone
+# Numbers are matched as well, so a C++14 digit separator as in 1'000 does not start a character literal
+C_TOKENS = re.compile(rb'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|(?<![0-9A-Za-z_])\.?\d(?:[eEpP][+-]|\'?[0-9A-Za-z_.])*'
+                      rb'|\'(?:\\.|[^\'\\\n])*\'', re.DOTALL)
+# A string prefix is only one if it does not end an identifier
+PYTHON_TOKENS = re.compile(rb'#[^\n]*|(?:(?<![0-9A-Za-z_])[rRbBuUfF]{1,2})?'
+                           rb'(?:"""(?:\\.|[^\\])*?"""|\'\'\'(?:\\.|[^\\])*?\'\'\')'
+                           rb'|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.DOTALL)
+BLANK_LINE = re.compile(rb'^[ \t\r\f\v]*$', re.MULTILINE)
+NEWLINE = re.compile(rb'\n')
+LANGUAGE_TOKENS = {'C': C_TOKENS, 'C++': C_TOKENS, 'C/C++ Header': C_TOKENS, 'Java': C_TOKENS,
+                   'Python': PYTHON_TOKENS}
+
+
+def get_language(path):
+    extension = os.path.splitext(path)[1]
+    return EXTENSION_LANGUAGES.get(extension) or EXTENSION_LANGUAGES.get(extension.lower())
+
+
+def _count_lines(content):
+    """Number of lines and of blank ones, a missing newline at the end still ending a line"""
+    if not len(content):
+        return 0, 0
+    ends_with_newline = content[-1:] == b"\n"
+    # mmap has no count(), the regex works on bytes and mmap alike
+    lines = len(NEWLINE.findall(content)) + (0 if ends_with_newline else 1)
+    # The empty "line" after a trailing newline matches as well
+    blank = len(BLANK_LINE.findall(content)) - (1 if ends_with_newline else 0)
+    return lines, blank
+
+
+def _strip_comments(content, tokens):
+    """Drops comments, and Python docstrings, but keeps the line structure and string literals"""
+    def replace(match):
+        token = match.group()
+        if token[:1] in b"/#":
+            return b"\n" * token.count(b"\n")
+        if token.endswith((b'"""', b"'''")):
+            # A triple quoted string starting a statement is a docstring, counted as comment like cloc does
+            line_start = content.rfind(b"\n", 0, match.start()) + 1
+            if not content[line_start:match.start()].strip():
+                return b"\n" * token.count(b"\n")
+        return token
+    return tokens.sub(replace, content)
+
+
+def count_content(content, language):
+    """(blank, comment, code) lines of source content. Lines with both code and a comment count as code"""
+    lines, blank = _count_lines(content)
+    stripped = _strip_comments(content, LANGUAGE_TOKENS[language])
+    stripped_lines, stripped_blank = _count_lines(stripped)
+    code = stripped_lines - stripped_blank
+    return blank, lines - blank - code, code
+
+
+def get_content_digest(content):
+    """Same as the git blob SHA of the content, so git checkouts can look up counts without reading files"""
+    digest = hashlib.sha1(b"blob %d\0" % len(content))
+    digest.update(content)
+    return digest.hexdigest()
+
+
+def count_file(path, language=None):
+    """(language, blank, comment, code, content digest) of a file, None if it is not in a known language"""
+    language = language or get_language(path)
+    if language is None:
+        return None
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size >= MMAP_MIN_SIZE:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                    return (language, *count_content(content, language), get_content_digest(content))
+            content = f.read()
+    except (OSError, ValueError):
+        return None
+    return (language, *count_content(content, language), get_content_digest(content))
+
+
+def find_source_files(top_folder, languages, dir_filter="", file_filter=""):
+    """Files below top_folder in the given languages, cloc style filters being regexes on directories and names"""
+    languages = set(languages)
+    dir_regex = re.compile(dir_filter) if dir_filter else None
+    file_regex = re.compile(file_filter) if file_filter else None
+    if os.path.isfile(top_folder):
+        return [top_folder] if get_language(top_folder) in languages else []
+    files = []
+    for root, dirs, filenames in os.walk(top_folder):
+        dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRECTORIES]
+        # Like cloc's --match-d, the filter is matched against the absolute path of every directory.
+        # A directory that does not match is still walked, as the path of one below it may match
+        if dir_regex and not dir_regex.search(os.path.abspath(root)):
+            continue
+        for filename in filenames:
+            if get_language(filename) in languages and (not file_regex or file_regex.search(filename)):
+                files.append(os.path.join(root, filename))
+    return files
+
+
+def _count_files(paths):
+    return [count_file(path) for path in paths]
+
+
+def iter_file_counts(paths, workers=None, files_per_task=DEFAULT_FILES_PER_TASK):
+    """
+    count_file of every path, in order, counted on a pool of workers (None for one per core, or for counting
+    in-process when already running in a worker process, e.g. of the repository filter pipeline)
+    """
+    tasks = [paths[i:i + files_per_task] for i in range(0, len(paths), files_per_task)]
+    if workers is None and multiprocessing.parent_process() is not None:
+        workers = 1
+    if workers == 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield from _count_files(task)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for results in pool.map(_count_files, tasks):
+            yield from results
+
+
+def sum_file_counts(file_counts):
+    """
+    Sums count_file results into [files, blank, comment, code] per language.
+    Like cloc, files with identical content are only counted once
+    """
+    totals = {}
+    seen = set()
+    for result in file_counts:
+        if result is None or (result[0], result[4]) in seen:
+            continue
+        seen.add((result[0], result[4]))
+        language, blank, comment, code, _ = result
+        counts = totals.setdefault(language, [0, 0, 0, 0])
+        counts[0] += 1
+        counts[1] += blank
+        counts[2] += comment
+        counts[3] += code
+    return totals
+
+
+def count_files(paths, workers=None, files_per_task=DEFAULT_FILES_PER_TASK):
+    """Per language [files, blank, comment, code] of paths"""
+    return sum_file_counts(iter_file_counts(paths, workers, files_per_task))
+
+
+def count_tree(top_folder, languages, dir_filter="", file_filter="", workers=None):
+    return count_files(find_source_files(top_folder, languages, dir_filter, file_filter), workers)
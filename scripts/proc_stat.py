@@ -0,0 +1,26 @@
+import os
+from collections import namedtuple
+
+CLOCK_TICKS_PER_SECOND = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE_BYTES = os.sysconf("SC_PAGE_SIZE")
+
+# cpu_seconds is the user and system time of the process, plus that of the children it waited for,
+# which are gone from /proc
+ProcessStat = namedtuple("ProcessStat", ["pid", "parent_pid", "session_id", "cpu_seconds", "rss_bytes"])
+
+
+def iter_process_stats():
+    """ProcessStat of every live process, from its /proc/<pid>/stat"""
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces and parentheses, the fields after it do not
+        fields = stat[stat.rindex(b")") + 2:].split()
+        yield ProcessStat(int(pid), int(fields[1]), int(fields[3]),
+                          sum(int(field) for field in fields[11:15]) / CLOCK_TICKS_PER_SECOND,
+                          int(fields[21]) * PAGE_SIZE_BYTES)
@@ -13,6 +13,9 @@ from codechecker_interface import *
 from testware_functions import *
 from framework_utils import *
 from compile_command_utils import *
+from analysis_scheduler import AnalysisScheduler, make_job
+from store_queue import StoreQueue
+from functools import partial
 logging.basicConfig(filename='PYTHON.log', filemode='w', format='%(asctime)s %(message)s')
 LOG = logging.getLogger("PYTHON")
 
@@ -24,12 +27,13 @@ parser = get_framework_args('python')
 def run_pylama_on_project(outdirpath, project_path, project_name):
     result_folder = generate_analysis_output_folderpath(outdirpath, "pylama")
     pylama_invocation = ["pylama", "--format", "pylint",
-                         "--force", "--report", f"{result_folder}/pylama_results"
-                                                "--abspath", project_path]
-    result = time_invocation_log('python', 'pylama', pylama_invocation)  # output folder
+                         "--force", "--report", f"{result_folder}/pylama_results",
+                         "--abspath", project_path]
+    with ExecutionContext(project_path) as context:
+        result = time_invocation_log('python', 'pylama', pylama_invocation, context)  # output folder
     if result.returncode == 0:
         # We use pylint output format, which framework can already parse
-        analysis_post_process(result_folder, "pylint", project_name)
+        analysis_post_process(result_folder, "pylint", project_name, source_root=project_path)
     else:
         LOG.error()
 
@@ -37,12 +41,13 @@ def run_pylama_on_project(outdirpath, project_path, project_name):
 def run_pyre_on_project(outdir_path, project_path, project_name):
     result_folder = generate_analysis_output_folderpath(outdir_path, "pyre")
     pyre_invocation = ["pyre", "--source-directory", project_path]
-    venv_dir = glob.glob(f"**/{PYTHON_VENV_BASE_NAME}", recursive=True)
+    venv_dir = glob.glob(f"{project_path}/**/{PYTHON_VENV_BASE_NAME}", recursive=True)
     # Include local virtual environment for module includes
     if venv_dir and len(venv_dir) == 1:
         pyre_invocation.extend(["--search-path", pathlib.Path(venv_dir[0]).absolute()])
     pyre_invocation.extend(["--output", "json", "--noninteractive", "check"])
-    result = time_invocation_log('python', 'pyre', pyre_invocation)
+    with ExecutionContext(project_path) as context:
+        result = time_invocation_log('python', 'pyre', pyre_invocation, context)
 
     if result.returncode == 0:
         analysis_post_process(result_folder, "pyre", project_name)
@@ -51,11 +56,40 @@ def run_pyre_on_project(outdir_path, project_path, project_name):
         LOG.error(result.stderr.decode('utf-8'))
 
 
+python_analyzer_mapping = {
+    'pylama': run_pylama_on_project,
+    'pyre': run_pyre_on_project
+}
+
+
+def get_analyzer_funcs(toolnames):
+    """Returns (tool name, runner) pairs for the requested tools"""
+    if 'all' in toolnames:
+        return list(python_analyzer_mapping.items())
+    else:
+        return [(t, python_analyzer_mapping[t]) for t in toolnames if t in python_analyzer_mapping]
+
+
 # Assumes that there is a file with compile commands somewhere in the project
-def run_analyzers_on_project(proj_path):
+def run_analyzers_on_project(proj_path, funcs=None):
     project_name = os.path.basename(proj_path)
-    run_pylama_on_project(proj_path, proj_path, project_name)
-    run_pyre_on_project(proj_path, proj_path, project_name)
+    for _, runner in funcs or python_analyzer_mapping.items():
+        runner(proj_path, proj_path, project_name)
+
+
+def log_job_result(job_result):
+    if not job_result.succeeded:
+        LOG.error(f"{job_result.job} failed: {job_result.error}")
+
+
+def run_analyzers_in_parallel(dirs, funcs, options):
+    """
+    Runs every (project, tool) pair as its own job, as many in parallel as options.jobs allows,
+    with the per job budgets of options
+    """
+    jobs = [make_job(options, d, tool, partial(runner, d, d, os.path.basename(d)))
+            for d in dirs for tool, runner in funcs]
+    return AnalysisScheduler(max_jobs=options.jobs or None).run(jobs, on_complete=log_job_result)
 
 
 if __name__ == "__main__":
@@ -63,14 +97,25 @@ if __name__ == "__main__":
     if not os.path.isdir(args.path):
         print(f"Invalid project path {args.path}.")
         exit(1)
-    os.chdir(args.path)
     # Run tools on all projects
     # 1) Loop through all directories in current working directory
     # 2) get their basename, will be needed for CodeChecker storing later
     # 3) invoke run_* on project
+    analyzer_funcs = get_analyzer_funcs(args.tools.split(";"))
     if not args.recursive:
-        run_analyzers_on_project(os.path.abspath(args.path))
+        dirs = [os.path.abspath(args.path)]
+    else:
+        dirs = [os.path.abspath(os.path.join(args.path, d)) for d in next(os.walk(args.path))[1]]
+    if args.jobs == 1:
+        # Results are stored in the background while the next analyses run
+        with StoreQueue() as store_queue:
+            set_store_queue(store_queue)
+            for d in dirs:
+                run_analyzers_on_project(d, analyzer_funcs)
+        set_store_queue(None)
+        failed_runs = store_queue.get_failed_runs()
+        if failed_runs:
+            print(f"Storing results failed for {', '.join(failed_runs)}")
+            exit(1)
     else:
-        dirs = next(os.walk(args.path))[1]
-        for d in dirs:
-            run_analyzers_on_project(os.path.abspath(d))
+        run_analyzers_in_parallel(dirs, analyzer_funcs, args)
@@ -0,0 +1,82 @@
+import hashlib
+import logging
+import os
+import pathlib
+import pickle
+import tempfile
+import zlib
+
+from lru_eviction import mark_used, evict_least_recently_used
+
+LOG = logging.getLogger("REPORT_CACHE")
+
+DEFAULT_CACHE_SIZE_BYTES = 512 * 1024 * 1024
+CACHE_ENTRY_SUFFIX = ".reports"
+
+
+class ReportCache:
+    """
+    On-disk cache of parsed plist files.
+    Entries are keyed on the plist path, its modification time and a hash of its content,
+    stored as compressed pickles and evicted least recently used first once the cache grows beyond max_size_bytes
+    """
+    def __init__(self, cache_dir, max_size_bytes=DEFAULT_CACHE_SIZE_BYTES):
+        self.cache_dir = str(pathlib.Path(cache_dir).absolute())
+        self.max_size_bytes = max_size_bytes
+        pathlib.Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def get_key(plist_path, variant=""):
+        """variant tells apart different parsed representations of the same plist"""
+        path = str(pathlib.Path(plist_path).absolute())
+        with open(path, "rb") as plist:
+            content_hash = hashlib.sha1(plist.read()).hexdigest()
+        mtime = os.stat(path).st_mtime_ns
+        return hashlib.sha1(f"{variant}\0{path}\0{mtime}\0{content_hash}".encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_ENTRY_SUFFIX)
+
+    def load(self, key):
+        """Returns the cached value for key, or None on a cache miss"""
+        entry = self._entry_path(key)
+        try:
+            with open(entry, "rb") as f:
+                value = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            LOG.warning("Dropping unreadable cache entry " + entry)
+            self._remove(entry)
+            return None
+        mark_used(entry)
+        return value
+
+    def store(self, key, value):
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        # Write to a temporary file first, so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._entry_path(key))
+
+    def get_or_parse(self, plist_path, parse_func):
+        key = self.get_key(plist_path, parse_func.__name__)
+        value = self.load(key)
+        if value is None:
+            value = parse_func(plist_path)
+            self.store(key, value)
+        return value
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits into max_size_bytes"""
+        entries = [(entry.path, entry.stat().st_size) for entry in os.scandir(self.cache_dir)
+                   if entry.name.endswith(CACHE_ENTRY_SUFFIX)]
+        evict_least_recently_used(entries, self.max_size_bytes, self._remove)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
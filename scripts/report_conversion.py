@@ -0,0 +1,272 @@
+import hashlib
+import json
+import logging
+import os
+import plistlib
+import re
+import xml.etree.ElementTree as ET
+
+from compact_report import CompactReport
+
+LOG = logging.getLogger("REPORT_CONVERSION")
+
+PYLINT_TEXT_LINE = re.compile(r"^(?P<path>.+?):(?P<line>\d+):(?:(?P<col>\d+):)? \[(?P<type>[^\]]+)\] (?P<message>.*)$")
+PYLAMA_CODE = re.compile(r"^(?P<code>[A-Z]+\d+) (?P<message>.*)$")
+CONVERTER_NAME = "spacomp"
+
+
+class ConvertedReport(CompactReport):
+    """
+    Report converted in-process from the native output of an analyzer.
+    Unlike other compact reports it has no source plist, so it keeps its bug path itself,
+    as (file path, line, column, message) events
+    """
+    __slots__ = ('events', 'category')
+
+    def __init__(self, file_path, line, col, check_name, description, events=None, category="unknown"):
+        super().__init__(file_path, line, col, check_name, description)
+        self.events = events or [(file_path, line, col, description)]
+        self.category = category
+
+    def __getstate__(self):
+        return super().__getstate__(), self.events, self.category
+
+    def __setstate__(self, state):
+        compact_state, self.events, self.category = state
+        super().__setstate__(compact_state)
+
+    def load(self):
+        return self
+
+    @property
+    def bug_path(self):
+        return [{'kind': 'event', 'file_path': file_path, 'line': line, 'col': col, 'message': message}
+                for file_path, line, col, message in self.events]
+
+    @property
+    def notes(self):
+        return []
+
+    @property
+    def macro_expansions(self):
+        return []
+
+
+def get_codechecker_report_hash_function():
+    """
+    Function computing CodeChecker's own context free hash of a ConvertedReport, the one report-converter puts
+    into the plists it writes, so stored reports keep their identity on the server whichever way they were
+    converted. None if the report-converter package of CodeChecker can not be imported
+    """
+    try:
+        from codechecker_report_converter.report import BugPathEvent, File, Report
+        from codechecker_report_converter.report.hash import HashType, get_report_hash
+    except ImportError:
+        return None
+
+    def report_hash(report):
+        files = {}
+
+        def get_file(file_path):
+            return files.setdefault(file_path, File(file_path))
+        events = [BugPathEvent(message, get_file(file_path), line, col)
+                  for file_path, line, col, message in report.events]
+        return get_report_hash(Report(get_file(report.file_path), report.line, report.col, report.description,
+                                      report.check_name, bug_path_events=events), HashType.CONTEXT_FREE)
+    return report_hash
+
+
+class ConvertedResult:
+    """The reports of one analyzer run, kept in memory until they are written for storage"""
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        self.reports = []
+
+    def add(self, file_path, line, col, check_name, description, events=None, category="unknown"):
+        self.reports.append(ConvertedReport(file_path, line, col, check_name, description, events, category))
+
+    def get_reports_per_file(self):
+        reports_per_file = {}
+        for report in self.reports:
+            reports_per_file.setdefault(report.file_path, []).append(report)
+        return reports_per_file
+
+    def write_plists(self, output_dir, report_hash):
+        """
+        Writes the reports as CodeChecker plist files, one per source file, as CodeChecker store expects them.
+        report_hash computes the issue hash of a report, see get_codechecker_report_hash_function
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        for file_path, reports in self.get_reports_per_file().items():
+            files = [file_path]
+            file_index = {file_path: 0}
+            diagnostics = []
+            for report in reports:
+                def location(event_file, line, col):
+                    if event_file not in file_index:
+                        file_index[event_file] = len(files)
+                        files.append(event_file)
+                    return {'line': line, 'col': col, 'file': file_index[event_file]}
+                path = [{'kind': 'event', 'depth': 0, 'location': location(*event[:3]), 'message': event[3],
+                         'extended_message': event[3]} for event in report.events]
+                diagnostics.append({'category': report.category, 'check_name': report.check_name,
+                                    'description': report.description, 'type': self.analyzer,
+                                    'issue_hash_content_of_line_in_context': report_hash(report),
+                                    'location': location(file_path, report.line, report.col), 'path': path})
+            plist_name = f"{os.path.basename(file_path)}_{hashlib.sha1(file_path.encode('utf-8')).hexdigest()[:8]}"
+            with open(os.path.join(output_dir, f"{plist_name}.plist"), "wb") as f:
+                plistlib.dump({'diagnostics': diagnostics, 'files': files,
+                               'metadata': {'analyzer': {'name': self.analyzer},
+                                            'generated_by': {'name': CONVERTER_NAME, 'version': '1'}}}, f)
+
+
+def _resolve(file_path, source_root):
+    return os.path.normpath(os.path.join(source_root, file_path)) if source_root else file_path
+
+
+def _strip_namespace(root):
+    for element in root.iter():
+        if isinstance(element.tag, str) and "}" in element.tag:
+            element.tag = element.tag.split("}", 1)[1]
+    return root
+
+
+def convert_cppcheck(output_path, source_root=None):
+    """Cppcheck --plist-output directory"""
+    result = ConvertedResult("cppcheck")
+    for plist_name in sorted(os.listdir(output_path)):
+        if not plist_name.endswith(".plist"):
+            continue
+        with open(os.path.join(output_path, plist_name), "rb") as f:
+            plist = plistlib.load(f)
+        files = [_resolve(f, source_root) for f in plist.get('files', [])]
+        for diagnostic in plist.get('diagnostics', []):
+            location = diagnostic['location']
+            events = [(files[e['location']['file']], e['location']['line'], e['location']['col'], e.get('message', ''))
+                      for e in diagnostic.get('path', []) if e.get('kind') == 'event']
+            result.add(files[location['file']], location['line'], location['col'],
+                       diagnostic.get('check_name') or diagnostic.get('type', 'cppcheck-unknown'),
+                       diagnostic['description'], events, diagnostic.get('category', 'unknown'))
+    return result
+
+
+def _find_infer_report(output_path):
+    for candidate in [output_path, os.path.join(output_path, "report.json"),
+                      os.path.join(output_path, "infer-out", "report.json")]:
+        if os.path.isfile(candidate):
+            return candidate
+    raise FileNotFoundError(f"No Infer report.json in {output_path}")
+
+
+def convert_infer(output_path, source_root=None):
+    """Infer results directory (or its report.json). Infer reports paths relative to where it was run"""
+    result = ConvertedResult("fbinfer")
+    with open(_find_infer_report(output_path), "r") as f:
+        issues = json.load(f)
+    for issue in issues:
+        file_path = _resolve(issue['file'], source_root)
+        col = max(issue.get('column', 0), 0)
+        events = [(_resolve(step['filename'], source_root), step['line_number'], max(step.get('column_number', 0), 0),
+                   step['description']) for step in issue.get('bug_trace', [])]
+        events.append((file_path, issue['line'], col, issue['qualifier']))
+        result.add(file_path, issue['line'], col, issue['bug_type'], issue['qualifier'], events,
+                   issue.get('severity', 'unknown').lower())
+    return result
+
+
+def convert_spotbugs(output_path, source_root=None):
+    """SpotBugs -xml:withMessages report"""
+    result = ConvertedResult("spotbugs")
+    root = ET.parse(output_path).getroot()
+    source_dirs = [e.text for e in root.iter("SrcDir") if e.text]
+
+    def find_source(sourcepath):
+        for source_dir in source_dirs:
+            if os.path.isfile(os.path.join(source_dir, sourcepath)):
+                return os.path.join(source_dir, sourcepath)
+        return _resolve(sourcepath, source_root)
+
+    for bug in root.iter("BugInstance"):
+        source_lines = [e for e in bug.iter("SourceLine") if e.get("start") and e.get("sourcepath")]
+        if not source_lines:
+            continue
+        primary = next((e for e in source_lines if e.get("primary") == "true"), source_lines[0])
+        message = bug.findtext("LongMessage") or bug.findtext("ShortMessage") or bug.get("type")
+        file_path = find_source(primary.get("sourcepath"))
+        events = [(find_source(e.get("sourcepath")), int(e.get("start")), 0, e.findtext("Message") or message)
+                  for e in source_lines if e is not primary]
+        events.append((file_path, int(primary.get("start")), 0, message))
+        result.add(file_path, int(primary.get("start")), 0, bug.get("type"), message, events,
+                   bug.get("category", "unknown").lower())
+    return result
+
+
+def convert_pmd(output_path, source_root=None):
+    """PMD xml report"""
+    result = ConvertedResult("pmd")
+    root = _strip_namespace(ET.parse(output_path).getroot())
+    for file_element in root.iter("file"):
+        file_path = _resolve(file_element.get("name"), source_root)
+        for violation in file_element.iter("violation"):
+            result.add(file_path, int(violation.get("beginline")), int(violation.get("begincolumn", 0)),
+                       violation.get("rule"), (violation.text or "").strip(),
+                       category=violation.get("ruleset", "unknown").lower())
+    return result
+
+
+def _convert_pylint_file(result, output_file, source_root):
+    with open(output_file, "r") as f:
+        content = f.read()
+    if content.lstrip().startswith("["):
+        # pylint -f json
+        for message in json.loads(content):
+            result.add(_resolve(message['path'], source_root), message['line'], message.get('column', 0),
+                       message.get('symbol') or message['message-id'], message['message'],
+                       category=message.get('type', 'unknown'))
+        return
+    for line in content.splitlines():
+        match = PYLINT_TEXT_LINE.match(line)
+        if not match:
+            continue
+        check_name, message = match.group("type"), match.group("message")
+        # pylama puts the code of the reporting linter in front of the message
+        code = PYLAMA_CODE.match(message)
+        if code:
+            check_name, message = code.group("code"), code.group("message")
+        result.add(_resolve(match.group("path"), source_root), int(match.group("line")), int(match.group("col") or 0),
+                   check_name, message)
+
+
+def convert_pylint(output_path, source_root=None):
+    """pylint (or pylama --format pylint) output file, or a directory of them"""
+    result = ConvertedResult("pylint")
+    if os.path.isdir(output_path):
+        output_files = [os.path.join(output_path, f) for f in sorted(os.listdir(output_path))
+                        if os.path.isfile(os.path.join(output_path, f))]
+    else:
+        output_files = [output_path]
+    for output_file in output_files:
+        _convert_pylint_file(result, output_file, source_root)
+    return result
+
+
+CONVERTERS = {
+    'cppcheck': convert_cppcheck,
+    'fbinfer': convert_infer,
+    'infer': convert_infer,
+    'spotbugs': convert_spotbugs,
+    'pmd': convert_pmd,
+    'pylint': convert_pylint,
+}
+
+
+def can_convert(analyzer):
+    return analyzer in CONVERTERS
+
+
+def convert_analyzer_output(output_path, analyzer, source_root=None):
+    """
+    Converts the native output of analyzer in-process into a ConvertedResult.
+    source_root is where relative paths in the output are resolved against
+    """
+    return CONVERTERS[analyzer](str(output_path), source_root)
@@ -0,0 +1,11 @@
+import sqlite3
+
+# Runners in other processes may be writing at the same time, so wait for their locks rather than fail
+DB_LOCK_TIMEOUT_SECONDS = 60
+
+
+def connect_database(db_path):
+    """Connection to the SQLite database at db_path, in WAL mode so readers do not block the writer"""
+    connection = sqlite3.connect(db_path, timeout=DB_LOCK_TIMEOUT_SECONDS)
+    connection.execute("PRAGMA journal_mode=WAL")
+    return connection
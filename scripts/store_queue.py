@@ -0,0 +1,118 @@
+import hashlib
+import logging
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from codechecker_interface import gen_store_command, CODECHECKER_SERVER_ADDRESS
+
+LOG = logging.getLogger("STORE_QUEUE")
+
+DEFAULT_STORE_WORKERS = int(os.getenv("SPACOMP_STORE_WORKERS", 2))
+DEFAULT_STORE_RETRIES = 3
+# Waiting time before the first retry, doubled for every further one
+DEFAULT_STORE_BACKOFF_SECONDS = 10
+
+
+def hash_result_path(result_path):
+    """Content hash of a result file or of all files below a result directory"""
+    digest = hashlib.sha1()
+    if os.path.isfile(result_path):
+        files = [result_path]
+    else:
+        files = sorted(os.path.join(root, f) for root, _, filenames in os.walk(result_path) for f in filenames)
+    for file in files:
+        digest.update(os.path.relpath(file, result_path).encode("utf-8"))
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class _StoreBatch:
+    """Result paths going to the same run, stored with a single CodeChecker store invocation"""
+    def __init__(self, store_project_name, store_server_product):
+        self.store_project_name = store_project_name
+        self.store_server_product = store_server_product
+        self.result_paths = []
+        self.future = None
+
+
+class StoreQueue:
+    """
+    Stores results to the CodeChecker server in the background, so analysis can go on while uploads run.
+    At most workers uploads run at once. Results for the same run that are queued at the same time are stored
+    together, results identical to one that was already submitted are skipped, and failed uploads are retried
+    with exponential backoff. Used as a context manager, leaving it waits until everything is stored
+    """
+    def __init__(self, workers=DEFAULT_STORE_WORKERS, retries=DEFAULT_STORE_RETRIES,
+                 backoff_seconds=DEFAULT_STORE_BACKOFF_SECONDS, server_address=CODECHECKER_SERVER_ADDRESS):
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.server_address = server_address
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="store")
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._submitted = {}
+        self._batches = []
+
+    def submit(self, result_path, store_project_name, store_server_product="Default"):
+        """Queues result_path for storing, returns a future of whether storing it succeeded"""
+        digest = hashlib.sha1(f"{store_project_name}\0{store_server_product}\0"
+                              f"{hash_result_path(result_path)}".encode("utf-8")).hexdigest()
+        with self._lock:
+            if digest in self._submitted:
+                LOG.info(f"Skipping {result_path}, identical results were already submitted for {store_project_name}")
+                return self._submitted[digest]
+            key = (store_project_name, store_server_product)
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = _StoreBatch(store_project_name, store_server_product)
+                self._pending[key] = batch
+                self._batches.append(batch)
+                batch.future = self._executor.submit(self._store_batch, batch)
+            batch.result_paths.append(str(result_path))
+            self._submitted[digest] = batch.future
+            return batch.future
+
+    def _store_batch(self, batch):
+        with self._lock:
+            # From here on, new results for the run go to a new batch
+            del self._pending[(batch.store_project_name, batch.store_server_product)]
+        command = gen_store_command(batch.result_paths, batch.store_project_name, batch.store_server_product,
+                                    self.server_address)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+            try:
+                res = subprocess.run(command, capture_output=True)
+            except OSError as e:
+                error = str(e)
+            else:
+                if res.returncode == 0:
+                    LOG.info(f"Stored {batch.result_paths} as {batch.store_project_name}")
+                    return True
+                error = res.stderr.decode('utf-8', errors='replace')
+            LOG.warning(f"Storing {batch.store_project_name} failed (attempt {attempt + 1}/{self.retries + 1}): "
+                        f"{error}")
+        LOG.error(f"Giving up storing {batch.result_paths} as {batch.store_project_name}")
+        return False
+
+    def drain(self):
+        """Waits for all queued results to be stored, returns (run name, success) per store invocation"""
+        with self._lock:
+            batches = list(self._batches)
+        return [(batch.store_project_name, batch.future.result()) for batch in batches]
+
+    def get_failed_runs(self):
+        """Waits for all queued results to be stored, returns the names of the runs that could not be stored"""
+        return sorted(set(name for name, stored in self.drain() if not stored))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.drain()
+        self._executor.shutdown()
@@ -0,0 +1,18 @@
+import importlib.util
+import os
+import sys
+import tempfile
+
+SCRIPTS_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_PATH)
+# Report parsing imports CodeChecker's codechecker_common, a minimal stand-in is used where it is not installed
+if importlib.util.find_spec("codechecker_common") is None:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs"))
+
+# The framework keeps its state next to the scripts by default, tests keep theirs apart
+STATE_DIR = tempfile.mkdtemp(prefix="spacomp_tests_")
+for variable, name in [("SPACOMP_LOC_CACHE", "loc_cache.db"), ("SPACOMP_METRICS_DB", "metrics.db"),
+                       ("SPACOMP_FILTER_STATS", "filter_stats.json"), ("SPACOMP_JOB_HISTORY", "job_durations.json"),
+                       ("SPACOMP_TU_HISTORY", "tu_durations.json"), ("SPACOMP_ANALYSIS_CACHE", "analysis_cache"),
+                       ("SPACOMP_LOG_DIR", "logs")]:
+    os.environ.setdefault(variable, os.path.join(STATE_DIR, name))
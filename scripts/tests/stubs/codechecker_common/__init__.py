@@ -0,0 +1,4 @@
+"""
+Minimal stand-in for the codechecker_common package of CodeChecker, put on the path by conftest.py when CodeChecker
+is not installed. It only covers what the scripts use: Report and parse_plist_file
+"""
@@ -0,0 +1,16 @@
+import plistlib
+from xml.parsers.expat import ExpatError
+
+from .report import Report
+
+
+def parse_plist_file(path, allow_plist_update=True):
+    """(files, reports) of a plist file, like codechecker_common.plist_parser. Unreadable files have no reports"""
+    try:
+        with open(path, 'rb') as plist_file:
+            plist = plistlib.load(plist_file)
+    except (OSError, ExpatError, plistlib.InvalidFileException, ValueError):
+        return {}, []
+    files = dict(enumerate(plist.get('files', [])))
+    reports = [Report(diagnostic, diagnostic.get('path', []), files) for diagnostic in plist.get('diagnostics', [])]
+    return files, reports
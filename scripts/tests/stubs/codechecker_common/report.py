@@ -0,0 +1,29 @@
+class Report:
+    """The parts of codechecker_common.report.Report the scripts use"""
+    def __init__(self, main, bugpath, files, metadata=None):
+        self.main = main
+        self.bug_path = bugpath
+        self.files = files
+        self.metadata = metadata
+        self.notes = main.get('notes', [])
+        self.macro_expansions = main.get('macro_expansions', [])
+
+    @property
+    def file_path(self):
+        return self.files[self.main['location']['file']]
+
+    @property
+    def line(self):
+        return self.main['location']['line']
+
+    @property
+    def col(self):
+        return self.main['location']['col']
+
+    @property
+    def check_name(self):
+        return self.main.get('check_name', 'unknown')
+
+    @property
+    def description(self):
+        return self.main['description']
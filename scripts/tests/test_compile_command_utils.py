@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("argh")
+from compile_command_utils import iter_compile_commands, CompileCommandsWriter, partition_compile_commands, \
+    is_testware_translation_unit
+
+CHUNK_SIZES = [1, 2, 3, 7, 64, None]
+COMPILE_COMMANDS = [
+    {"directory": "/src/project", "file": "main.cpp", "command": "g++ -c main.cpp -o main.o"},
+    {"directory": "/src/project/test", "file": "main_test.cpp",
+     "arguments": ["g++", "-DNAME=\"{x}\"", "-DLIST=[1,2]", "-c", "main_test.cpp"]},
+    {"directory": "/src/pro ject", "file": "escapes.c", "command": "cc -DQ=\\\"]\\\" -DB=\\\\ -c escapes.c",
+     "output": "tab\tnewline\nunicode é中😀"},
+    {"directory": "/src/project", "file": "nested.c", "arguments": ["cc", "-c", "nested.c"],
+     "extra": {"nested": [{"a": "}"}, {"b": "{"}], "empty": {}, "number": -1.5e3, "flag": True, "none": None}},
+]
+
+
+def write_database(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+    return str(path)
+
+
+def read_database(path, chunk_size):
+    if chunk_size is None:
+        return list(iter_compile_commands(path))
+    return list(iter_compile_commands(path, chunk_size=chunk_size))
+
+
+class TestIterCompileCommands:
+    @pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+    @pytest.mark.parametrize("dump", [
+        lambda entries: json.dumps(entries),
+        lambda entries: json.dumps(entries, indent=2),
+        lambda entries: json.dumps(entries, ensure_ascii=False, separators=(",", ":")),
+        lambda entries: " \r\n\t" + json.dumps(entries, indent="\t").replace(",\n", "\n ,\r\n") + "\n\n",
+    ])
+    def test_same_entries_as_json_load(self, tmp_path, chunk_size, dump):
+        path = write_database(tmp_path / "compile_commands.json", dump(COMPILE_COMMANDS))
+        with open(path, "r") as f:
+            expected = json.load(f)
+        assert read_database(path, chunk_size) == expected
+
+    @pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+    @pytest.mark.parametrize("text", ["[]", " [ ] ", "[\n]\n"])
+    def test_empty_database(self, tmp_path, chunk_size, text):
+        assert read_database(write_database(tmp_path / "compile_commands.json", text), chunk_size) == []
+
+    @pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+    def test_many_entries(self, tmp_path, chunk_size):
+        entries = [{"directory": f"/src/{i}", "file": f"{i}.c", "command": f"cc -c {i}.c"} for i in range(500)]
+        path = write_database(tmp_path / "compile_commands.json", json.dumps(entries, indent=1))
+        assert read_database(path, chunk_size) == entries
+
+    @pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+    @pytest.mark.parametrize("text", ['[{"file": "a.c"}', '[{"file": "a.c"}, {"file": ', '[{"file": "a.c', '['])
+    def test_truncated_database(self, tmp_path, chunk_size, text):
+        with pytest.raises(ValueError):
+            read_database(write_database(tmp_path / "compile_commands.json", text), chunk_size)
+
+    def test_not_a_database(self, tmp_path):
+        with pytest.raises(ValueError):
+            read_database(write_database(tmp_path / "compile_commands.json", '{"file": "a.c"}'), None)
+
+
+class TestCompileCommandsWriter:
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / "compile_commands.json")
+        with CompileCommandsWriter(path) as writer:
+            for entry in COMPILE_COMMANDS:
+                writer.write(entry)
+        assert writer.count == len(COMPILE_COMMANDS)
+        with open(path, "r") as f:
+            assert json.load(f) == COMPILE_COMMANDS
+
+    def test_no_entries(self, tmp_path):
+        path = str(tmp_path / "compile_commands.json")
+        with CompileCommandsWriter(path):
+            pass
+        with open(path, "r") as f:
+            assert json.load(f) == []
+
+    def test_partition(self, tmp_path):
+        path = write_database(tmp_path / "compile_commands.json", json.dumps(COMPILE_COMMANDS, indent=2))
+        matching_path, non_matching_path = str(tmp_path / "testware.json"), str(tmp_path / "production.json")
+        assert partition_compile_commands(path, is_testware_translation_unit, matching_path, non_matching_path) == \
+            (1, len(COMPILE_COMMANDS) - 1)
+        with open(matching_path, "r") as f:
+            assert json.load(f) == [e for e in COMPILE_COMMANDS if is_testware_translation_unit(e)]
+        with open(non_matching_path, "r") as f:
+            assert json.load(f) == [e for e in COMPILE_COMMANDS if not is_testware_translation_unit(e)]
@@ -0,0 +1,145 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("argh")
+from compile_command_utils import iter_compile_commands
+from compile_db_sharding import split_balanced, write_shards, merge_result_folders
+
+
+def write_files(folder, files):
+    for name, content in files.items():
+        path = os.path.join(folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+
+def read_files(folder):
+    files = {}
+    for root, _, filenames in os.walk(folder):
+        for filename in filenames:
+            with open(os.path.join(root, filename)) as f:
+                files[os.path.relpath(os.path.join(root, filename), folder)] = f.read()
+    return files
+
+
+class TestSplitBalanced:
+    def test_heaviest_entry_goes_to_lightest_shard(self):
+        assert split_balanced([5, 4, 3, 3, 3], 2) == [[0, 3], [1, 2, 4]]
+
+    @pytest.mark.parametrize("shard_count", [1, 2, 3, 7, 50])
+    def test_every_entry_in_one_shard(self, shard_count):
+        weights = [(i * 7919) % 101 + 1 for i in range(40)]
+        shards = split_balanced(weights, shard_count)
+        assert len(shards) == min(shard_count, len(weights))
+        assert sorted(index for shard in shards for index in shard) == list(range(len(weights)))
+        loads = [sum(weights[i] for i in shard) for shard in shards]
+        assert max(loads) - min(loads) <= max(weights)
+
+    def test_shard_count_bounds(self):
+        assert split_balanced([1, 2], 0) == [[1, 0]]
+        assert split_balanced([], 4) == [[]]
+
+
+class TestWriteShards:
+    def test_entries_split_over_shards(self, tmp_path):
+        entries = []
+        for i in range(10):
+            source = tmp_path / "src" / f"file_{i}.c"
+            source.parent.mkdir(exist_ok=True)
+            source.write_text("int a;\n" * (i + 1))
+            entries.append({"directory": str(source.parent), "file": source.name, "command": f"cc -c {source.name}"})
+        database = tmp_path / "compile_commands.json"
+        database.write_text(json.dumps(entries))
+        shard_paths = write_shards(str(database), 3, str(tmp_path / "out"))
+        assert shard_paths == [str(tmp_path / "out" / "shards" / f"shard_{i}" / "compile_commands.json")
+                               for i in range(3)]
+        shard_entries = [list(iter_compile_commands(shard_path)) for shard_path in shard_paths]
+        assert all(shard_entries)
+        assert sorted(entry["file"] for shard in shard_entries for entry in shard) == \
+            sorted(entry["file"] for entry in entries)
+        for shard in shard_entries:
+            # Entries keep their order of the original database
+            assert shard == [entry for entry in entries if entry in shard]
+
+
+class TestMergeResultFolders:
+    def test_same_named_plists_are_kept_apart(self, tmp_path):
+        shards = [str(tmp_path / f"shard_{i}") for i in range(3)]
+        write_files(shards[0], {"main.c_clangsa_1.plist": "0 main", "util.c_clangsa_2.plist": "0 util",
+                                "compiler_info.json": "0"})
+        write_files(shards[1], {"main.c_clangsa_1.plist": "1 main", "compiler_info.json": "1"})
+        write_files(shards[2], {"main.c_clangsa_1.plist": "2 main", "other.c_clangsa_3.plist": "2 other"})
+        result_folder = str(tmp_path / "results")
+        merge_result_folders(shards + [str(tmp_path / "missing_shard")], result_folder)
+        assert read_files(result_folder) == {
+            "main.c_clangsa_1.plist": "0 main", "shard1_main.c_clangsa_1.plist": "1 main",
+            "shard2_main.c_clangsa_1.plist": "2 main", "util.c_clangsa_2.plist": "0 util",
+            "other.c_clangsa_3.plist": "2 other", "compiler_info.json": "0"}
+
+    def test_results_already_in_result_folder_are_kept(self, tmp_path):
+        result_folder = str(tmp_path / "results")
+        write_files(result_folder, {"cached.c_clangsa_4.plist": "cached", "main.c_clangsa_1.plist": "cached main"})
+        write_files(str(tmp_path / "shard_0"), {"main.c_clangsa_1.plist": "0 main"})
+        merge_result_folders([str(tmp_path / "shard_0")], result_folder)
+        assert read_files(result_folder) == {"cached.c_clangsa_4.plist": "cached",
+                                             "main.c_clangsa_1.plist": "cached main",
+                                             "shard0_main.c_clangsa_1.plist": "0 main"}
+
+
+def make_metadata(shard_folder, result_source_files, action_num, begin, end, failed_sources):
+    return {"version": 2, "tools": [{
+        "name": "codechecker", "action_num": action_num, "skipped": 1, "output_path": shard_folder,
+        "timestamps": {"begin": begin, "end": end},
+        "result_source_files": {os.path.join(shard_folder, plist): source
+                                for plist, source in result_source_files.items()},
+        "analyzers": {"clangsa": {"checkers": {"core.NullDereference": True}, "analyzer_statistics": {
+            "failed": len(failed_sources), "failed_sources": failed_sources, "successful": action_num,
+            "version": "clang 14"}}}}]}
+
+
+class TestMergeCodeCheckerMetadata:
+    def test_failed_entries_of_every_shard_are_kept(self, tmp_path):
+        shards = [str(tmp_path / f"shard_{i}") for i in range(2)]
+        write_files(shards[0], {"failed/main.c_clangsa.zip": "0", "failed/util.c_clangsa.zip": "0 util"})
+        write_files(shards[1], {"failed/main.c_clangsa.zip": "1", "failed/other.c_clangsa.zip": "1 other"})
+        merge_result_folders(shards, str(tmp_path / "results"))
+        assert read_files(str(tmp_path / "results")) == {
+            "failed/main.c_clangsa.zip": "0", "failed/shard1_main.c_clangsa.zip": "1",
+            "failed/util.c_clangsa.zip": "0 util", "failed/other.c_clangsa.zip": "1 other"}
+
+    def test_metadata_is_merged(self, tmp_path):
+        shards = [str(tmp_path / f"shard_{i}") for i in range(2)]
+        result_folder = str(tmp_path / "results")
+        write_files(shards[0], {"main.c_clangsa_1.plist": "0", "metadata.json": json.dumps(make_metadata(
+            shards[0], {"main.c_clangsa_1.plist": "/src/main.c"}, 2, 100, 200, ["/src/a.c"]))})
+        write_files(shards[1], {"main.c_clangsa_1.plist": "1", "util.c_clangsa_2.plist": "1",
+                                "metadata.json": json.dumps(make_metadata(
+                                    shards[1], {"main.c_clangsa_1.plist": "/src/main.c",
+                                                "util.c_clangsa_2.plist": "/src/util.c"}, 3, 50, 150, []))})
+        merge_result_folders(shards, result_folder)
+        with open(os.path.join(result_folder, "metadata.json")) as f:
+            tool = json.load(f)["tools"][0]
+        assert tool["output_path"] == result_folder
+        assert tool["result_source_files"] == {
+            os.path.join(result_folder, "main.c_clangsa_1.plist"): "/src/main.c",
+            os.path.join(result_folder, "shard1_main.c_clangsa_1.plist"): "/src/main.c",
+            os.path.join(result_folder, "util.c_clangsa_2.plist"): "/src/util.c"}
+        assert set(tool["result_source_files"]) == \
+            {os.path.join(result_folder, name) for name in os.listdir(result_folder) if name.endswith(".plist")}
+        assert (tool["action_num"], tool["skipped"], tool["timestamps"]) == (5, 2, {"begin": 50, "end": 200})
+        assert tool["analyzers"]["clangsa"]["analyzer_statistics"] == {
+            "failed": 1, "failed_sources": ["/src/a.c"], "successful": 5, "version": "clang 14"}
+        assert tool["analyzers"]["clangsa"]["checkers"] == {"core.NullDereference": True}
+
+    def test_unmergeable_metadata_keeps_first(self, tmp_path):
+        shards = [str(tmp_path / f"shard_{i}") for i in range(3)]
+        write_files(shards[0], {"metadata.json": "not json"})
+        write_files(shards[1], {"metadata.json": json.dumps({"version": 1, "analyzers": ["clangsa"]})})
+        write_files(shards[2], {"metadata.json": json.dumps({"version": 1, "analyzers": ["clang-tidy"]})})
+        merge_result_folders(shards, str(tmp_path / "results"))
+        with open(str(tmp_path / "results" / "metadata.json")) as f:
+            assert json.load(f) == {"version": 1, "analyzers": ["clangsa"]}
@@ -0,0 +1,122 @@
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+import git_object_loc
+from git_object_loc import clone_without_checkout, list_tree, iter_blobs, count_git_tree
+from loc_cache import LoCCache
+from native_loc_counter import count_tree
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git is not available")
+
+LANGUAGES = ["C", "C++", "C/C++ Header", "Java", "Python"]
+SOURCES = {"src/main.c": b"#include <stdio.h>\n\n// comment\nint main() { return 0; }\n",
+           "src/copy.c": b"#include <stdio.h>\n\n// comment\nint main() { return 0; }\n",
+           "src/util.h": b"#pragma once\nint f();\n", "lib/lib.cpp": b"// c++\nint f() {\n  return 1;\n}\n",
+           "lib/test_lib.cpp": b"int g() { return 2; }\n", "app/Main.java": b"class Main {}\n",
+           "tool.py": b"# comment\nimport os\n", "readme.txt": b"not counted\n"}
+
+
+def git(*args, cwd=None):
+    return subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args], cwd=cwd,
+                          capture_output=True, check=True).stdout
+
+
+@pytest.fixture
+def repository(tmp_path):
+    """A checkout to clone from, serving partial clones like a hosted repository does"""
+    checkout = tmp_path / "checkout"
+    for name, content in SOURCES.items():
+        path = checkout / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    os.symlink("main.c", checkout / "src" / "link.c")
+    git("init", "-q", cwd=checkout)
+    git("config", "uploadpack.allowFilter", "true", cwd=checkout)
+    git("config", "uploadpack.allowAnySHA1InWant", "true", cwd=checkout)
+    git("add", ".", cwd=checkout)
+    git("commit", "-q", "-m", "sources", cwd=checkout)
+    return checkout
+
+
+@pytest.fixture
+def read_blobs(monkeypatch):
+    """Digests of the blobs read from the clone"""
+    read = []
+    original_iter_blobs = git_object_loc.iter_blobs
+
+    def recording_iter_blobs(repository_dir, digests):
+        read.extend(digests)
+        return original_iter_blobs(repository_dir, digests)
+    monkeypatch.setattr(git_object_loc, "iter_blobs", recording_iter_blobs)
+    return read
+
+
+def clone(repository, tmp_path):
+    clone_dir = str(tmp_path / "objects" / "project.git")
+    assert clone_without_checkout(f"file://{repository}", clone_dir)
+    return clone_dir
+
+
+class TestCloneWithoutCheckout:
+    def test_clone_has_no_blobs(self, repository, tmp_path):
+        clone_dir = clone(repository, tmp_path)
+        assert not os.path.exists(os.path.join(clone_dir, "src"))
+        missing = git("-C", clone_dir, "rev-list", "--objects", "--missing=print", "HEAD").decode("utf-8")
+        # Every distinct blob, the symbolic link's among them
+        assert sum(1 for line in missing.splitlines() if line.startswith("?")) == 8
+        # An existing clone is reused
+        assert clone_without_checkout(f"file://{repository}", clone_dir)
+
+    def test_failed_clone(self, tmp_path):
+        assert not clone_without_checkout(f"file://{tmp_path}/missing", str(tmp_path / "objects" / "missing.git"))
+
+
+class TestCountGitTree:
+    def test_list_tree_leaves_out_symbolic_links(self, repository, tmp_path):
+        paths = [path for path, _ in list_tree(clone(repository, tmp_path))]
+        assert sorted(paths) == sorted(SOURCES)
+
+    def test_same_counts_as_checkout(self, repository, tmp_path):
+        clone_dir = clone(repository, tmp_path)
+        # The checkout counts the symbolic link like any other file
+        os.remove(repository / "src" / "link.c")
+        assert count_git_tree(clone_dir, LANGUAGES) == count_tree(str(repository), LANGUAGES, workers=1)
+
+    def test_filters(self, repository, tmp_path):
+        clone_dir = clone(repository, tmp_path)
+        assert count_git_tree(clone_dir, ["C++"], dir_filter="lib$") == {"C++": [2, 0, 1, 4]}
+        assert count_git_tree(clone_dir, ["C++"], file_filter="^test_") == {"C++": [1, 0, 0, 1]}
+        assert count_git_tree(clone_dir, ["C"], dir_filter="app") == {}
+
+    def test_dir_filter_matches_absolute_path(self, repository, tmp_path, monkeypatch):
+        clone_dir = clone(repository, tmp_path)
+        monkeypatch.chdir(tmp_path)
+        dir_filter = f"^{re.escape(clone_dir)}/lib$"
+        assert count_git_tree(os.path.relpath(clone_dir), ["C++"], dir_filter=dir_filter) == {"C++": [2, 0, 1, 4]}
+
+    def test_identical_blobs_are_read_once(self, repository, tmp_path, read_blobs):
+        count_git_tree(clone(repository, tmp_path), ["C"])
+        assert len(read_blobs) == 1
+
+    def test_cached_blobs_are_not_read(self, repository, tmp_path, read_blobs):
+        clone_dir = clone(repository, tmp_path)
+        cache = LoCCache(tmp_path / "loc.db")
+        expected = count_git_tree(clone_dir, LANGUAGES, loc_cache=cache)
+        assert len(read_blobs) == 6
+        read_blobs.clear()
+        assert count_git_tree(clone_dir, LANGUAGES, loc_cache=cache) == expected
+        assert read_blobs == []
+
+    def test_checkout_counts_fill_the_cache(self, repository, tmp_path, read_blobs):
+        cache = LoCCache(tmp_path / "loc.db")
+        cache.count_tree(str(repository), LANGUAGES, workers=1)
+        count_git_tree(clone(repository, tmp_path), LANGUAGES, loc_cache=cache)
+        assert read_blobs == []
+
+    def test_missing_blob_is_skipped(self, repository, tmp_path):
+        digest = dict(list_tree(str(repository)))["tool.py"]
+        assert list(iter_blobs(str(repository), ["0" * 40, digest])) == [(digest, SOURCES["tool.py"])]
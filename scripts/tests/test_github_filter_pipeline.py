@@ -0,0 +1,156 @@
+import json
+import os
+import subprocess
+import threading
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("github")
+pytest.importorskip("dotenv")
+pytest.importorskip("argh")
+import github_api_utils
+from line_of_code_counter import ProjectSize
+
+# Languages per repository, as the stand-in GitHub API reports them
+REPOSITORY_LANGUAGES = {
+    "spacomp/active_c": {"C": 2 * 1024 * 1024},
+    "spacomp/stale_c": {"C": 2 * 1024 * 1024},
+    "spacomp/tiny_python": {"Python": 1024},
+    "spacomp/active_java": {"Java": 3 * 1024 * 1024},
+}
+
+
+class StandInGitHub(BaseHTTPRequestHandler):
+    """Answers the languages requests of the filters like the GitHub API would"""
+    requesting_threads = set()
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 4 and parts[0] == "repos" and parts[3] == "languages":
+            body = json.dumps(REPOSITORY_LANGUAGES.get(f"{parts[1]}/{parts[2]}", {})).encode("utf-8")
+            self.send_response(200)
+        else:
+            body = b'{"message": "Not Found"}'
+            self.send_response(404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+class StandInRepository:
+    """The attributes of a PyGithub Repository the filters read"""
+    def __init__(self, full_name, clone_url, pushed_at):
+        self.full_name = full_name
+        self.clone_url = clone_url
+        self.default_branch = "main"
+        self.pushed_at = pushed_at
+
+
+@pytest.fixture
+def github_api(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInGitHub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(github_api_utils, "GITHUB_API_URL", f"http://127.0.0.1:{server.server_port}")
+    yield
+    server.shutdown()
+    server.server_close()
+
+
+def make_git_repository(path, code_lines):
+    os.makedirs(path)
+    with open(os.path.join(path, "main.c"), "w") as f:
+        f.write("int x;\n" * code_lines)
+    for command in [["init", "-q", "-b", "main"], ["add", "main.c"],
+                    ["-c", "user.name=test", "-c", "user.email=test@example.com", "commit", "-q", "-m", "init"]]:
+        subprocess.run(["git", "-C", path, *command], check=True)
+    return f"file://{path}"
+
+
+class TestFilterPipeline:
+
+    def test_thread_github_clients(self, github_api):
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(github_api_utils.get_thread_github_client()))
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert clients[0] is not clients[1]
+        assert github_api_utils.get_thread_github_client() is github_api_utils.get_thread_github_client()
+
+    def test_apply_filters_log_filtering(self, github_api, tmp_path):
+        now = datetime.today()
+        repositories = [
+            StandInRepository("spacomp/active_c", make_git_repository(str(tmp_path / "active_c"), 20), now),
+            StandInRepository("spacomp/stale_c", make_git_repository(str(tmp_path / "stale_c"), 20),
+                              now - timedelta(days=1000)),
+            StandInRepository("spacomp/tiny_python", make_git_repository(str(tmp_path / "tiny_python"), 20), now),
+            StandInRepository("spacomp/active_java", make_git_repository(str(tmp_path / "active_java"), 2000), now),
+        ]
+        work_dir = str(github_api_utils.get_filter_data_path(tmp_path))
+        filters = [
+            (partial(github_api_utils.filter_on_languages, github_api_utils.general_lang_sizes), "languages"),
+            (partial(github_api_utils.filter_on_activity, 365), "activity"),
+            (partial(github_api_utils.filter_on_project_loc_size, ["C"], [ProjectSize.Tiny], work_dir=work_dir),
+             "loc size"),
+        ]
+        result = github_api_utils.apply_filters_log_filtering(repositories, filters, "filtered.xml", tmp_path,
+                                                              reorder=False,
+                                                              stats_file=str(tmp_path / "filter_stats.json"))
+        assert [[r.full_name for r in stage] for stage in result] == [
+            ["spacomp/active_c", "spacomp/stale_c", "spacomp/active_java"],
+            ["spacomp/active_c", "spacomp/active_java"],
+            ["spacomp/active_c"],
+        ]
+        log = ET.parse(github_api_utils.get_filter_data_path(tmp_path) / "filtered.xml").getroot()
+        assert [(f.get("note"), f.get("evaluated"), f.get("amount")) for f in log] == \
+            [("languages", "4", "3"), ("activity", "3", "2"), ("loc size", "2", "1")]
+
+    def test_reordered_log_follows_execution_order(self, github_api, tmp_path):
+        now = datetime.today()
+        repositories = [StandInRepository("spacomp/active_c", "", now),
+                        StandInRepository("spacomp/stale_c", "", now - timedelta(days=1000)),
+                        StandInRepository("spacomp/tiny_python", "", now)]
+        filters = [(partial(github_api_utils.filter_on_languages, github_api_utils.general_lang_sizes), "languages"),
+                   (partial(github_api_utils.filter_on_activity, 365), "activity")]
+        stats_file = tmp_path / "filter_stats.json"
+        stats_file.write_text(json.dumps({github_api_utils.get_filter_key(filters[0][0]): {"seconds": 1.0},
+                                          github_api_utils.get_filter_key(filters[1][0]): {"seconds": 0.001}}))
+        result = github_api_utils.apply_filters_log_filtering(repositories, filters, "filtered.xml", tmp_path,
+                                                              stats_file=str(stats_file))
+        assert [[r.full_name for r in stage] for stage in result] == \
+            [["spacomp/active_c", "spacomp/tiny_python"], ["spacomp/active_c"]]
+        log = ET.parse(github_api_utils.get_filter_data_path(tmp_path) / "filtered.xml").getroot()
+        # The stale repository was never run through the languages filter, so it is not counted there
+        assert [(f.get("note"), f.get("evaluated"), f.get("amount")) for f in log] == \
+            [("activity", "3", "2"), ("languages", "2", "1")]
+
+    def test_filter_errors_are_raised(self, github_api):
+        def failing_filter(repository):
+            raise RuntimeError(f"API rate limit exceeded for {repository.full_name}")
+        repositories = [StandInRepository("spacomp/active_c", "", datetime.today())]
+        filters = [partial(github_api_utils.filter_on_languages, github_api_utils.general_lang_sizes), failing_filter]
+        with pytest.raises(RuntimeError):
+            github_api_utils.run_filter_pipeline(repositories, filters)
+
+    def test_testware_filter_runs_after_checkout(self, monkeypatch):
+        monkeypatch.setattr(github_api_utils, "COUNT_FROM_GIT_OBJECTS", False)
+        testware = partial(github_api_utils.filter_on_testware_language, ["C"])
+        loc_size = partial(github_api_utils.filter_on_project_loc_size, ["C"], [ProjectSize.Tiny])
+        filters = [loc_size, testware]
+        stats = {github_api_utils.get_filter_key(testware): {"seconds": 0.001, "selectivity": 0.0},
+                 github_api_utils.get_filter_key(loc_size): {"seconds": 100.0, "selectivity": 0.9}}
+        assert github_api_utils.order_filters(filters, stats) == [0, 1]
+        assert github_api_utils.order_filters([testware, loc_size], stats) == [1, 0]
+        monkeypatch.setattr(github_api_utils, "COUNT_FROM_GIT_OBJECTS", True)
+        assert github_api_utils.order_filters(filters, stats) == [1, 0]
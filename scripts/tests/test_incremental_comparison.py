@@ -0,0 +1,124 @@
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip("dotenv")
+import my_plist_parser
+from compact_report import CompactReport
+from my_plist_parser import run_on_project_result, parse_plist_file_fast, get_plist_files
+
+PLIST_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plist")
+
+
+def report_key(report, tool):
+    return tool, report.file_path, report.line, report.col, report.check_name, report.description
+
+
+def summarize(result, grouping=True):
+    """
+    Comparison result with reports replaced by their fields, independent of report and group order.
+    Which reports end up in the duplicate groups depends on the order of the reports, so without grouping
+    only the reports per tool are kept
+    """
+    collapsed_reports_tool_pair, filename_reports_key_val_duplicates = result
+    summary = {}
+    for filename, (duplicates, uniques) in filename_reports_key_val_duplicates.items():
+        collapsed = sorted((tool, sorted(report_key(r, tool) for r in reports))
+                           for reports, tool in collapsed_reports_tool_pair[filename])
+        groups = sorted(sorted(report_key(*report_tool) for report_tool in group) for group in duplicates)
+        summary[filename] = (collapsed, groups, sorted(report_key(*report_tool) for report_tool in uniques)) \
+            if grouping else collapsed
+    return summary
+
+
+@pytest.fixture
+def project(tmp_path):
+    shutil.copytree(PLIST_FIXTURES, tmp_path / "project")
+    return tmp_path / "project"
+
+
+@pytest.fixture
+def compared_files(monkeypatch):
+    """Main files compare_file_reports is called for"""
+    compared = []
+    compare_file_reports = my_plist_parser.compare_file_reports
+
+    def compare(reports):
+        compared.append(next(iter(reports))[0].file_path)
+        return compare_file_reports(reports)
+    monkeypatch.setattr(my_plist_parser, "compare_file_reports", compare)
+    return compared
+
+
+def get_plist_main_files(plist_file):
+    return {report.file_path for report in parse_plist_file_fast(plist_file)[1]}
+
+
+class TestIncrementalComparison:
+    def test_unchanged_files_are_taken_from_state(self, project, tmp_path, compared_files):
+        state_file = str(tmp_path / "state.pickle")
+        expected = summarize(run_on_project_result(str(project), compact=True), grouping=False)
+        compared_files.clear()
+        first = summarize(run_on_project_result(str(project), compact=True, state_file=state_file))
+        assert {filename: collapsed for filename, (collapsed, _, _) in first.items()} == expected
+        assert len(compared_files) == len(expected)
+        compared_files.clear()
+        assert summarize(run_on_project_result(str(project), compact=True, state_file=state_file)) == first
+        assert compared_files == []
+
+    def test_removed_plist_recomputes_its_files(self, project, tmp_path, compared_files):
+        state_file = str(tmp_path / "state.pickle")
+        run_on_project_result(str(project), compact=True, state_file=state_file)
+        plist_files = sorted(get_plist_files(str(project / "cppcheck_results_2021_04_15_16_19_55")))
+        removed = max(plist_files, key=lambda plist_file: len(get_plist_main_files(plist_file)))
+        removed_main_files = get_plist_main_files(removed)
+        os.remove(removed)
+        compared_files.clear()
+        result = run_on_project_result(str(project), compact=True, state_file=state_file)
+        # Files that only had reports in the removed plist are gone from the result
+        assert compared_files and set(compared_files) == removed_main_files & set(result[0])
+        assert summarize(result, grouping=False) == \
+            summarize(run_on_project_result(str(project), compact=True), grouping=False)
+        assert set(my_plist_parser.load_comparison_state(state_file)) == set(result[0])
+
+    def test_unreadable_state_is_ignored(self, project, tmp_path):
+        state_file = tmp_path / "state.pickle"
+        state_file.write_bytes(b"not a pickle")
+        result = run_on_project_result(str(project), compact=True, state_file=str(state_file))
+        assert summarize(result, grouping=False) == \
+            summarize(run_on_project_result(str(project), compact=True), grouping=False)
+        assert set(my_plist_parser.load_comparison_state(str(state_file))) == set(result[0])
+
+
+class TestIncrementalComparisonSources:
+    def test_rewritten_plist_recomputes_its_files(self, project, tmp_path, compared_files):
+        state_file = str(tmp_path / "state.pickle")
+        run_on_project_result(str(project), compact=True, state_file=state_file)
+        rewritten = sorted(get_plist_files(str(project / "cppcheck_results_2021_04_15_16_19_55")))[0]
+        stat = os.stat(rewritten)
+        os.utime(rewritten, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        compared_files.clear()
+        run_on_project_result(str(project), compact=True, state_file=state_file)
+        assert set(compared_files) == get_plist_main_files(rewritten)
+
+    def test_renamed_result_folder_recomputes_everything(self, project, tmp_path, compared_files):
+        state_file = str(tmp_path / "state.pickle")
+        run_on_project_result(str(project), compact=True, state_file=state_file)
+        for result_folder in os.listdir(project):
+            os.rename(project / result_folder, project / f"{result_folder}_renamed")
+        compared_files.clear()
+        collapsed, _ = run_on_project_result(str(project), compact=True, state_file=state_file)
+        assert len(compared_files) == len(collapsed)
+        for reports, _ in collapsed[compared_files[0]]:
+            assert all(os.path.exists(report.source) for report in reports)
+
+    def test_parse_mode_change_recomputes_everything(self, project, tmp_path, compared_files):
+        state_file = str(tmp_path / "state.pickle")
+        run_on_project_result(str(project), compact=True, state_file=state_file)
+        compared_files.clear()
+        collapsed, _ = run_on_project_result(str(project), compact=False, state_file=state_file)
+        assert len(compared_files) == len(collapsed)
+        assert not any(isinstance(report, CompactReport)
+                       for reports_tool_pairs in collapsed.values() for reports, _ in reports_tool_pairs
+                       for report in reports)
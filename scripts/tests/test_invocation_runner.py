@@ -0,0 +1,54 @@
+import asyncio
+import os
+import subprocess
+import time
+
+import pytest
+
+import invocation_runner
+from invocation_runner import run_invocation
+from framework_utils import ExecutionContext, time_invocation_log
+
+
+@pytest.fixture
+def short_drain(monkeypatch):
+    monkeypatch.setattr(invocation_runner, "OUTPUT_DRAIN_SECONDS", 0.2)
+
+
+class TestRunInvocation:
+    def test_output_and_exit_code(self):
+        result = asyncio.run(run_invocation(["sh", "-c", "echo out; echo err >&2; exit 3"]))
+        assert (result.returncode, result.stdout, result.stderr) == (3, b"out\n", b"err\n")
+        assert result.resource_usage.wall_seconds >= 0
+
+    def test_process_left_holding_the_pipes_is_killed(self, short_drain):
+        start = time.monotonic()
+        result = asyncio.run(run_invocation(["sh", "-c", "sleep 30 & echo started"], timeout=60))
+        assert (result.returncode, result.stdout) == (0, b"started\n")
+        assert time.monotonic() - start < 10
+
+    def test_daemon_left_holding_the_pipes_is_not_waited_for(self, short_drain):
+        start = time.monotonic()
+        result = asyncio.run(run_invocation(["sh", "-c", "setsid sleep 30 & echo started"], timeout=60))
+        assert (result.returncode, result.stdout) == (0, b"started\n")
+        assert time.monotonic() - start < 10
+
+    def test_timeout(self, short_drain):
+        with pytest.raises(subprocess.TimeoutExpired):
+            asyncio.run(run_invocation(["sleep", "30"], timeout=0.2))
+
+
+class TestTimeInvocationLog:
+    def test_output_log_in_context_log_dir(self, tmp_path):
+        with ExecutionContext(tmp_path, log_dir=tmp_path / "logs") as context:
+            result = time_invocation_log("c_cpp", "echo", ["echo", "logged"], context)
+        assert result.returncode == 0
+        for handler in invocation_runner.get_output_logger("c_cpp", "echo", context.log_dir).handlers:
+            handler.flush()
+        with open(os.path.join(tmp_path, "logs", "c_cpp_echo_output.log")) as f:
+            assert "[stdout] logged" in f.read()
+
+    def test_blocking_call_with_running_event_loop(self, tmp_path):
+        async def caller():
+            return time_invocation_log("c_cpp", "echo", ["echo", "nested"], ExecutionContext(tmp_path))
+        assert asyncio.run(caller()).stdout == b"nested\n"
@@ -0,0 +1,93 @@
+import shutil
+import subprocess
+
+import pytest
+
+import loc_cache
+from loc_cache import LoCCache
+from native_loc_counter import count_file, count_tree
+
+SOURCES = {"src/main.c": b"#include <stdio.h>\n\n// comment\nint main() { return 0; }\n",
+           "src/util.h": b"#pragma once\nint f();\n", "src/lib.cpp": b"// c++\nint f() {\n  return 1;\n}\n",
+           "tool.py": b"# comment\nimport os\n", "readme.txt": b"not counted\n"}
+
+
+def make_tree(root, files=SOURCES):
+    for name, content in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    return [str(root / name) for name in files if not name.endswith(".txt")]
+
+
+def git(*args, cwd):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args], cwd=cwd,
+                   capture_output=True, check=True)
+
+
+@pytest.fixture
+def counted_paths(monkeypatch):
+    """Paths the cache had to read and count"""
+    counted = []
+    iter_file_counts = loc_cache.iter_file_counts
+
+    def count(paths, workers=None):
+        counted.extend(paths)
+        return iter_file_counts(paths, 1)
+    monkeypatch.setattr(loc_cache, "iter_file_counts", count)
+    return counted
+
+
+class TestLoCCache:
+    def test_same_counts_as_counting(self, tmp_path, counted_paths):
+        paths = make_tree(tmp_path / "project")
+        cache = LoCCache(tmp_path / "loc.db")
+        assert cache.get_file_counts(paths) == [count_file(path) for path in paths]
+        assert counted_paths == paths
+        counted_paths.clear()
+        assert cache.get_file_counts(paths) == [count_file(path) for path in paths]
+        assert counted_paths == []
+
+    def test_changed_file_is_counted_again(self, tmp_path, counted_paths):
+        paths = make_tree(tmp_path / "project")
+        cache = LoCCache(tmp_path / "loc.db")
+        cache.get_file_counts(paths)
+        with open(paths[0], "ab") as f:
+            f.write(b"int added;\n")
+        counted_paths.clear()
+        assert cache.get_file_counts(paths) == [count_file(path) for path in paths]
+        assert counted_paths == [paths[0]]
+
+    def test_missing_file(self, tmp_path):
+        paths = make_tree(tmp_path / "project") + [str(tmp_path / "project" / "missing.c")]
+        assert LoCCache(tmp_path / "loc.db").get_file_counts(paths)[-1] is None
+
+    def test_count_tree_and_clear(self, tmp_path, counted_paths):
+        make_tree(tmp_path / "project")
+        cache = LoCCache(tmp_path / "loc.db")
+        languages = ["C", "C++", "C/C++ Header", "Python"]
+        expected = count_tree(str(tmp_path / "project"), languages, workers=1)
+        assert cache.count_tree(str(tmp_path / "project"), languages) == expected
+        assert cache.count_tree(str(tmp_path / "project"), languages) == expected
+        assert len(counted_paths) == 4
+        cache.clear()
+        assert cache.count_tree(str(tmp_path / "project"), languages) == expected
+        assert len(counted_paths) == 8
+
+    @pytest.mark.skipif(shutil.which("git") is None, reason="git is not available")
+    def test_git_checkout_content_is_looked_up_without_reading(self, tmp_path, counted_paths):
+        paths = make_tree(tmp_path / "project")
+        git("init", "-q", cwd=tmp_path / "project")
+        git("add", ".", cwd=tmp_path / "project")
+        git("commit", "-q", "-m", "sources", cwd=tmp_path / "project")
+        cache = LoCCache(tmp_path / "loc.db")
+        # Another copy of the same content fills the cache
+        cache.get_file_counts(make_tree(tmp_path / "copy"))
+        with open(paths[1], "ab") as f:
+            f.write(b"int modified();\n")
+        counted_paths.clear()
+        counts = cache.get_file_counts(paths, top_folder=str(tmp_path / "project"))
+        assert counts == [count_file(path) for path in paths]
+        # Only the file that differs from the git index is read
+        assert counted_paths == [paths[1]]
+
@@ -0,0 +1,124 @@
+import re
+import shutil
+import subprocess
+
+import pytest
+
+import native_loc_counter
+from native_loc_counter import count_content, count_file, count_files, count_tree, iter_file_counts, PYTHON_TOKENS
+
+C_SOURCE = b"""#include <stdio.h>
+
+// comment
+/* multi
+   line */
+int main() { /* inline */ return 0; }
+const char *s = "// not a comment";
+"""
+PYTHON_SOURCE = b'''"""Module docstring
+second line"""
+import os
+
+# comment
+x = "# not a comment"  # trailing
+def f():
+    \'\'\'doc\'\'\'
+    return 1
+'''
+# Neither the digit separators nor the u8 prefix start a character literal that would hide the comment
+CPP_SEPARATORS_SOURCE = b"""int a = 1'000; /* it's
+   a comment */
+char c = u8'a'; double d = 0x1'0p-1'0; // it's
+"""
+# (blank, comment, code) lines as cloc counts them
+EXPECTED_COUNTS = [
+    (C_SOURCE, "C", (1, 3, 3)),
+    (PYTHON_SOURCE, "Python", (1, 4, 4)),
+    (b"int a;", "C", (0, 0, 1)),
+    (b"int a;\r\n\r\n  \t\r\n", "C", (2, 0, 1)),
+    (b"", "C", (0, 0, 0)),
+    (b"/* a */ int a; /* b\n*/\n", "Java", (0, 1, 1)),
+    (CPP_SEPARATORS_SOURCE, "C++", (0, 1, 2)),
+    (b"def f():\n    rb\"\"\"raw\n    doc\"\"\"\n    return 1\n", "Python", (0, 2, 2)),
+]
+
+
+def make_tree(root):
+    """A small project with sources in every counted language, a copied file and a directory cloc skips"""
+    files = {"src/main.c": C_SOURCE, "src/copy.c": C_SOURCE, "src/util.h": b"#pragma once\nint f();\n",
+             "src/lib.cpp": b"// c++\nint f() {\n  return 1;\n}\n",
+             "src/separators.cpp": CPP_SEPARATORS_SOURCE, "app/Main.java": b"class Main {}\n",
+             "scripts/tool.py": PYTHON_SOURCE, "docs/readme.txt": b"not counted\n", ".git/hook.py": PYTHON_SOURCE}
+    files.update({f"many/file_{i}.c": b"int a%d;\n" % i * (i + 1) for i in range(10)})
+    for name, content in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    return sorted(str(root / name) for name in files)
+
+
+class TestCountContent:
+    @pytest.mark.parametrize("content,language,expected", EXPECTED_COUNTS)
+    def test_counts(self, content, language, expected):
+        assert count_content(content, language) == expected
+
+    @pytest.mark.parametrize("content,language,expected", EXPECTED_COUNTS)
+    def test_mapped_file(self, tmp_path, monkeypatch, content, language, expected):
+        path = tmp_path / ("source.py" if language == "Python" else "source.c")
+        path.write_bytes(content)
+        read = count_file(str(path), language)
+        monkeypatch.setattr(native_loc_counter, "MMAP_MIN_SIZE", 1)
+        assert count_file(str(path), language) == read
+        assert read[1:4] == expected
+
+    def test_string_prefix_does_not_end_an_identifier(self):
+        assert PYTHON_TOKENS.search(b'elif"""doc""": pass').group() == b'"""doc"""'
+        assert PYTHON_TOKENS.search(b'x = rb"""doc"""').group() == b'rb"""doc"""'
+
+    @pytest.mark.skipif(shutil.which("git") is None, reason="git is not available")
+    def test_digest_is_git_blob_sha(self, tmp_path):
+        path = tmp_path / "main.c"
+        path.write_bytes(C_SOURCE)
+        git_sha = subprocess.run(["git", "hash-object", str(path)], capture_output=True, check=True).stdout
+        assert count_file(str(path))[4] == git_sha.decode("utf-8").strip()
+
+
+class TestCountFiles:
+    def test_same_counts_across_task_boundaries(self, tmp_path):
+        paths = make_tree(tmp_path)
+        expected = [count_file(path) for path in paths]
+        for workers in [1, 2]:
+            for files_per_task in [1, 3, len(paths) - 1, len(paths), native_loc_counter.DEFAULT_FILES_PER_TASK]:
+                assert list(iter_file_counts(paths, workers, files_per_task)) == expected
+
+    def test_identical_files_count_once(self, tmp_path):
+        counts = count_files([str(p) for p in make_tree(tmp_path) if p.endswith(".c")], workers=1)
+        assert counts == {"C": [11, 1, 3, 3 + 55]}
+
+    def test_tree(self, tmp_path):
+        make_tree(tmp_path)
+        counts = count_tree(str(tmp_path), ["C", "C++", "C/C++ Header", "Java", "Python"], workers=1)
+        assert counts == {"C": [11, 1, 3, 58], "C++": [2, 0, 2, 5], "C/C++ Header": [1, 0, 0, 2],
+                          "Java": [1, 0, 0, 1], "Python": [1, 1, 4, 4]}
+        assert count_tree(str(tmp_path), ["C"], dir_filter="many", workers=1) == {"C": [10, 0, 0, 55]}
+        assert count_tree(str(tmp_path), ["C"], file_filter=r"file_[0-4]\.c", workers=1) == {"C": [5, 0, 0, 15]}
+
+    def test_dir_filter_matches_absolute_path(self, tmp_path, monkeypatch):
+        make_tree(tmp_path)
+        monkeypatch.chdir(tmp_path)
+        dir_filter = f"^{re.escape(str(tmp_path))}/(many|app)$"
+        assert count_tree(".", ["C", "Java"], dir_filter=dir_filter, workers=1) == {"C": [10, 0, 0, 55],
+                                                                                  "Java": [1, 0, 0, 1]}
+
+    @pytest.mark.skipif(shutil.which("cloc") is None, reason="cloc is not available")
+    def test_same_counts_as_cloc(self, tmp_path):
+        pytest.importorskip("dotenv")
+        pytest.importorskip("argh")
+        from line_of_code_counter import LoCData
+        make_tree(tmp_path)
+        languages = ["C", "C++", "C/C++ Header", "Java", "Python"]
+        cloc_res = subprocess.run(["cloc", f"--include-lang={','.join(languages)}", "--xml", "--quiet",
+                                   str(tmp_path)], capture_output=True, check=True)
+        cloc_data = LoCData.make_from_string(cloc_res.stdout.decode("utf-8").strip(), str(tmp_path))
+        native_data = LoCData.make_from_counts(count_tree(str(tmp_path), languages, workers=1), str(tmp_path))
+        assert native_data.lang_data == cloc_data.lang_data
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from report_cache import ReportCache
+
+parsed_paths = []
+
+
+def parse(plist_path):
+    parsed_paths.append(plist_path)
+    with open(plist_path, "rb") as f:
+        return {"content": f.read(), "reports": list(range(100))}
+
+
+@pytest.fixture(autouse=True)
+def clear_parsed_paths():
+    parsed_paths.clear()
+
+
+def write_plist(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+
+def set_mtime(path, seconds_ago):
+    mtime = os.stat(path).st_mtime - seconds_ago
+    os.utime(path, (mtime, mtime))
+
+
+class TestReportCache:
+    def test_parsed_once(self, tmp_path):
+        plist = write_plist(tmp_path / "a.plist", b"a")
+        cache = ReportCache(tmp_path / "cache")
+        assert cache.get_or_parse(plist, parse) == parse(plist)
+        parsed_paths.clear()
+        assert cache.get_or_parse(plist, parse) == parse(plist)
+        assert ReportCache(tmp_path / "cache").get_or_parse(plist, parse)["content"] == b"a"
+        assert parsed_paths == [plist]
+
+    def test_changed_plist_is_parsed_again(self, tmp_path):
+        plist = write_plist(tmp_path / "a.plist", b"a")
+        cache = ReportCache(tmp_path / "cache")
+        cache.get_or_parse(plist, parse)
+        write_plist(tmp_path / "a.plist", b"b")
+        assert cache.get_or_parse(plist, parse)["content"] == b"b"
+        # Same content, but written again
+        set_mtime(plist, 10)
+        cache.get_or_parse(plist, parse)
+        assert parsed_paths == [plist] * 3
+
+    def test_same_content_at_other_path_is_parsed(self, tmp_path):
+        cache = ReportCache(tmp_path / "cache")
+        cache.get_or_parse(write_plist(tmp_path / "a.plist", b"a"), parse)
+        cache.get_or_parse(write_plist(tmp_path / "b.plist", b"a"), parse)
+        assert len(parsed_paths) == 2
+
+    def test_unreadable_entry_is_dropped(self, tmp_path):
+        plist = write_plist(tmp_path / "a.plist", b"a")
+        cache = ReportCache(tmp_path / "cache")
+        cache.get_or_parse(plist, parse)
+        [entry] = os.listdir(tmp_path / "cache")
+        (tmp_path / "cache" / entry).write_bytes(b"truncated")
+        assert cache.get_or_parse(plist, parse)["content"] == b"a"
+        assert len(parsed_paths) == 2
+        assert os.listdir(tmp_path / "cache") == [entry]
+
+    def test_least_recently_used_entries_are_evicted(self, tmp_path):
+        plists = [write_plist(tmp_path / f"{i}.plist", os.urandom(1000)) for i in range(5)]
+        cache = ReportCache(tmp_path / "cache")
+        entries = []
+        for seconds_ago, plist in zip([50, 40, 30, 20, 10], plists):
+            cache.get_or_parse(plist, parse)
+            [entry] = set(os.listdir(tmp_path / "cache")) - set(entries)
+            entries.append(entry)
+            set_mtime(tmp_path / "cache" / entry, seconds_ago)
+        # Room for the two largest entries
+        cache.max_size_bytes = sum(sorted(os.stat(tmp_path / "cache" / entry).st_size for entry in entries)[-2:])
+        # Using the oldest entry makes it the most recently used one
+        cache.get_or_parse(plists[0], parse)
+        cache.evict()
+        assert sorted(os.listdir(tmp_path / "cache")) == sorted([entries[0], entries[4]])
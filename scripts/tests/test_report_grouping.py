@@ -0,0 +1,167 @@
+import os
+import random
+from functools import partial
+
+import pytest
+
+pytest.importorskip("dotenv")
+import my_plist_parser
+from my_plist_parser import DuplicateRelations, is_duplicate, collapse_reports_toolpair_list, \
+    get_duplicate_unique_list_pairs, _get_duplicate_unique_list_pairs_sweep, _get_duplicate_unique_list_pairs_grouped, \
+    get_plist_reports_tool_pair, VECTORIZED_MATCHING_MIN_REPORTS
+
+PLIST_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plist")
+PLIST_RESULT_DIRS = sorted(os.path.join(PLIST_FIXTURES, d) for d in os.listdir(PLIST_FIXTURES))
+DISTANCES = [(0, 0), (1, 0), (0, 1), (2, 3)]
+
+
+class FakeReport:
+    """The report fields the matching looks at, hashed by identity like CodeChecker's reports"""
+    __slots__ = ("file_path", "line", "col", "check_name", "description")
+
+    def __init__(self, file_path, line, col, check_name, description):
+        self.file_path = file_path
+        self.line = line
+        self.col = col
+        self.check_name = check_name
+        self.description = description
+
+
+def reference_duplicate_unique_list_pairs(report_tool_list, col_distance=0, row_distance=0):
+    """The recursive matching get_duplicate_unique_list_pairs replaced, with the distances passed on"""
+    def split_list(__list, func, predicate_result):
+        predicate_is_true = [e for e in __list if func(e[0]) == predicate_result]
+        predicate_is_false = [e for e in __list if func(e[0]) != predicate_result]
+        return predicate_is_true, predicate_is_false
+
+    def inner(_l, duplicates, uniques):
+        if not _l:
+            return duplicates, uniques
+        head, *tail = _l
+        match_head = partial(is_duplicate, head[0], col_distance=col_distance, row_distance=row_distance)
+        potential_duplicates, __rest = split_list(tail, match_head, DuplicateRelations.POTENTIAL_DUPLICATE)
+        remainder, subsumed = split_list(__rest, match_head, DuplicateRelations.NO_DUPLICATE)
+        if len(potential_duplicates) > 0:
+            duplicates.append([head] + potential_duplicates)
+        else:
+            uniques.append(head)
+        return inner(remainder, duplicates, uniques)
+
+    return inner(report_tool_list, list(), list())
+
+
+def reference_collapse_reports_toolpair_list(reports_tool_list):
+    """The recursive grouping by tool collapse_reports_toolpair_list replaced"""
+    if not reports_tool_list:
+        return []
+    current_tool = reports_tool_list[0][1]
+    tmp = list(map(lambda e: e[0], filter(lambda res_tool_pair: current_tool == res_tool_pair[1], reports_tool_list)))
+    tmp.sort(key=lambda r: r.line)
+    rest = list(filter(lambda res_tool_pair: current_tool != res_tool_pair[1], reports_tool_list))
+    return [(tmp, current_tool)] + reference_collapse_reports_toolpair_list(rest)
+
+
+def get_fixture_reports_per_file():
+    """The (report, tool) lists of every file the plist fixtures have reports for, all tools together"""
+    reports_per_file = {}
+    for plist_result_dir in PLIST_RESULT_DIRS:
+        plist_reports, tool_name = get_plist_reports_tool_pair(plist_result_dir)
+        for _, reports in plist_reports:
+            for report in reports:
+                reports_per_file.setdefault(report.file_path, []).append((report, tool_name))
+    return reports_per_file
+
+
+def make_reports(count, seed, lines=20, cols=4):
+    """Reports of several tools crowded on few positions, so most of them match one another"""
+    rng = random.Random(seed)
+    checks = [("core.NullDereference", "Null dereference"), ("deadcode.DeadStores", "Dead store"),
+              ("nullPointer", "Null dereference")]
+    return [(FakeReport("main.cpp", rng.randint(1, lines), rng.randint(1, cols), *rng.choice(checks)),
+             rng.choice(["clangsa", "clang-tidy", "cppcheck"])) for _ in range(count)]
+
+
+class TestSweepMatching:
+    def test_fixtures_match_reference(self):
+        reports_per_file = get_fixture_reports_per_file()
+        assert reports_per_file
+        for filename, report_tool_list in reports_per_file.items():
+            for col_distance, row_distance in DISTANCES:
+                assert _get_duplicate_unique_list_pairs_sweep(report_tool_list, col_distance, row_distance) == \
+                    reference_duplicate_unique_list_pairs(report_tool_list, col_distance, row_distance), filename
+
+    def test_fixtures_public_matching(self):
+        for filename, report_tool_list in get_fixture_reports_per_file().items():
+            assert get_duplicate_unique_list_pairs(report_tool_list) == \
+                reference_duplicate_unique_list_pairs(report_tool_list), filename
+
+    @pytest.mark.parametrize("count", [0, 1, 2, 10, 100, 300])
+    @pytest.mark.parametrize("col_distance,row_distance", DISTANCES)
+    def test_crowded_reports_match_reference(self, count, col_distance, row_distance):
+        for seed in range(5):
+            report_tool_list = make_reports(count, seed)
+            assert _get_duplicate_unique_list_pairs_sweep(report_tool_list, col_distance, row_distance) == \
+                reference_duplicate_unique_list_pairs(report_tool_list, col_distance, row_distance)
+
+    def test_distance_boundaries(self):
+        head = (FakeReport("main.cpp", 10, 5, "a", "A"), "clangsa")
+        report_tool_list = [head, (FakeReport("main.cpp", 12, 5, "b", "B"), "cppcheck"),
+                            (FakeReport("main.cpp", 10, 8, "b", "B"), "cppcheck"),
+                            (FakeReport("main.cpp", 11, 6, "a", "A"), "clang-tidy")]
+        for col_distance, row_distance in [(0, 0), (1, 1), (2, 2), (3, 2), (3, 1)]:
+            assert _get_duplicate_unique_list_pairs_sweep(report_tool_list, col_distance, row_distance) == \
+                reference_duplicate_unique_list_pairs(report_tool_list, col_distance, row_distance)
+
+
+class TestGroupedMatching:
+    @pytest.fixture(autouse=True)
+    def numpy(self):
+        pytest.importorskip("numpy")
+
+    def test_fixtures_match_reference(self):
+        for filename, report_tool_list in get_fixture_reports_per_file().items():
+            assert _get_duplicate_unique_list_pairs_grouped(report_tool_list) == \
+                reference_duplicate_unique_list_pairs(report_tool_list), filename
+
+    @pytest.mark.parametrize("count", [1, 2, VECTORIZED_MATCHING_MIN_REPORTS - 1, VECTORIZED_MATCHING_MIN_REPORTS,
+                                       VECTORIZED_MATCHING_MIN_REPORTS + 1, 500])
+    def test_crowded_reports_match_reference(self, count):
+        for seed in range(5):
+            report_tool_list = make_reports(count, seed)
+            expected = reference_duplicate_unique_list_pairs(report_tool_list)
+            assert _get_duplicate_unique_list_pairs_grouped(report_tool_list) == expected
+            assert get_duplicate_unique_list_pairs(report_tool_list) == expected
+
+    def test_large_positions(self):
+        report_tool_list = make_reports(VECTORIZED_MATCHING_MIN_REPORTS * 2, 0, lines=2 ** 40, cols=2)
+        report_tool_list += report_tool_list[::3]
+        assert _get_duplicate_unique_list_pairs_grouped(report_tool_list) == \
+            reference_duplicate_unique_list_pairs(report_tool_list)
+
+    def test_same_result_without_numpy(self, monkeypatch):
+        report_tool_list = make_reports(VECTORIZED_MATCHING_MIN_REPORTS * 4, 1)
+        with_numpy = get_duplicate_unique_list_pairs(report_tool_list)
+        monkeypatch.setattr(my_plist_parser, "np", None)
+        assert get_duplicate_unique_list_pairs(report_tool_list) == with_numpy
+
+
+class TestCollapseReports:
+    def test_fixtures_match_reference(self):
+        for filename, report_tool_list in get_fixture_reports_per_file().items():
+            assert collapse_reports_toolpair_list(report_tool_list) == \
+                reference_collapse_reports_toolpair_list(report_tool_list), filename
+
+    @pytest.mark.parametrize("count", [0, 1, 2, 100, 1000])
+    def test_reports_match_reference(self, count):
+        for seed in range(5):
+            report_tool_list = make_reports(count, seed)
+            assert collapse_reports_toolpair_list(report_tool_list) == \
+                reference_collapse_reports_toolpair_list(report_tool_list)
+
+    def test_accepts_iterables(self):
+        report_tool_list = make_reports(50, 0)
+        report_tool_set = set(report_tool_list)
+        assert collapse_reports_toolpair_list(report_tool_set) == \
+            reference_collapse_reports_toolpair_list(list(report_tool_set))
+        assert collapse_reports_toolpair_list(iter(report_tool_list)) == \
+            reference_collapse_reports_toolpair_list(report_tool_list)
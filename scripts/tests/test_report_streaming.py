@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+pytest.importorskip("dotenv")
+import my_plist_parser
+from my_plist_parser import iter_reports_per_file, get_reports_per_file
+from report_cache import ReportCache
+
+PLIST_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plist")
+PLIST_RESULT_DIRS = sorted(os.path.join(PLIST_FIXTURES, d) for d in os.listdir(PLIST_FIXTURES))
+
+
+def summarize_collapsed(reports_tool_pairs):
+    """Reports per tool with reports replaced by their fields, independent of report order"""
+    return sorted((tool, sorted((r.file_path, r.line, r.col, r.check_name, r.description) for r in reports))
+                  for reports, tool in reports_tool_pairs)
+
+
+@pytest.fixture(scope="module")
+def expected():
+    collapsed_reports_tool_pair, _ = get_reports_per_file(PLIST_RESULT_DIRS, compact=True)
+    return {filename: summarize_collapsed(collapsed) for filename, collapsed in collapsed_reports_tool_pair.items()}
+
+
+@pytest.fixture
+def written_runs(monkeypatch):
+    """Number of reports of every sorted run spilled to disk"""
+    runs = []
+    write_sorted_run = my_plist_parser._write_sorted_run
+
+    def write(report_tool_list, run_path):
+        runs.append(len(report_tool_list))
+        write_sorted_run(report_tool_list, run_path)
+    monkeypatch.setattr(my_plist_parser, "_write_sorted_run", write)
+    return runs
+
+
+class TestIterReportsPerFile:
+    @pytest.mark.parametrize("sort_run_reports", [1, 50, 1000, my_plist_parser.DEFAULT_SORT_RUN_REPORTS])
+    def test_same_files_as_get_reports_per_file(self, tmp_path, expected, written_runs, sort_run_reports):
+        streamed = list(iter_reports_per_file(PLIST_RESULT_DIRS, compact=True, sort_run_reports=sort_run_reports,
+                                              sort_dir=str(tmp_path)))
+        filenames = [filename for filename, _, _ in streamed]
+        assert filenames == sorted(expected)
+        for filename, collapsed, (duplicates, uniques) in streamed:
+            # Which reports end up in the duplicate groups depends on the report order, the reports per tool do not
+            assert summarize_collapsed(collapsed) == expected[filename], filename
+            assert sum(len(group) for group in duplicates) + len(uniques) <= sum(len(r) for r, _ in collapsed)
+        # Runs are spilled once they reach sort_run_reports, after the plist file that filled them
+        largest_plist_reports = max(len(my_plist_parser.parse_plist_file_fast(plist)[1])
+                                    for d in PLIST_RESULT_DIRS for plist in my_plist_parser.get_plist_files(d))
+        assert all(reports >= sort_run_reports for reports in written_runs[:-1])
+        assert max(written_runs) < sort_run_reports + largest_plist_reports
+
+    def test_runs_are_removed(self, tmp_path):
+        streamed = iter_reports_per_file(PLIST_RESULT_DIRS, compact=True, sort_run_reports=100, sort_dir=str(tmp_path))
+        next(streamed)
+        assert len(os.listdir(tmp_path)) == 1
+        list(streamed)
+        assert os.listdir(tmp_path) == []
+
+    def test_no_reports(self, tmp_path):
+        assert list(iter_reports_per_file([str(tmp_path / "empty_results")], sort_dir=str(tmp_path))) == []
+
+
+class TestIterReportsPerFileCache:
+    def test_report_cache_is_evicted(self, tmp_path, monkeypatch):
+        evicted = []
+        monkeypatch.setattr(ReportCache, "evict", lambda cache: evicted.append(cache))
+        report_cache = ReportCache(tmp_path / "cache")
+        list(iter_reports_per_file(PLIST_RESULT_DIRS, compact=True, report_cache=report_cache,
+                                   sort_dir=str(tmp_path)))
+        assert evicted == [report_cache]
@@ -0,0 +1,92 @@
+import os
+import stat
+
+import pytest
+
+pytest.importorskip("dotenv")
+import codechecker_interface
+import store_queue
+from store_queue import StoreQueue
+
+# Stands in for CodeChecker: logs every store invocation, fails the first STORE_FAILURES ones
+# and holds the "blocker" run until STORE_RELEASE exists, so results can be queued behind it
+FAKE_CODECHECKER = """#!/bin/sh
+case "$*" in *"--name blocker "*) while [ ! -e "$STORE_RELEASE" ]; do sleep 0.01; done;; esac
+echo "$*" >> "$STORE_LOG"
+[ "$(wc -l < "$STORE_LOG")" -gt "$STORE_FAILURES" ] || { echo "server unavailable" >&2; exit 1; }
+"""
+
+
+@pytest.fixture
+def store_log(tmp_path, monkeypatch):
+    script = tmp_path / "CodeChecker"
+    script.write_text(FAKE_CODECHECKER)
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(codechecker_interface, "CODECHECKER_MAINSCRIPT_PATH", str(script))
+    monkeypatch.setenv("STORE_LOG", str(tmp_path / "store.log"))
+    monkeypatch.setenv("STORE_RELEASE", str(tmp_path / "release"))
+    monkeypatch.setenv("STORE_FAILURES", "0")
+    return tmp_path / "store.log"
+
+
+def read_invocations(store_log):
+    if not store_log.exists():
+        return []
+    with open(store_log) as f:
+        return [line.split() for line in f.read().splitlines()]
+
+
+def make_result(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    return str(path)
+
+
+class TestStoreQueue:
+    def test_results_of_a_run_queued_together_are_stored_together(self, tmp_path, store_log):
+        a1, a2 = make_result(tmp_path / "a1.plist", "a1"), make_result(tmp_path / "a2.plist", "a2")
+        b, blocker = make_result(tmp_path / "b.plist", "b"), make_result(tmp_path / "blocker.plist", "blocker")
+        with StoreQueue(workers=1) as queue:
+            queue.submit(blocker, "blocker")
+            futures = [queue.submit(a1, "run_a"), queue.submit(b, "run_a", "Other"), queue.submit(a2, "run_a")]
+            (tmp_path / "release").touch()
+            assert queue.drain() == [("blocker", True), ("run_a", True), ("run_a", True)]
+        assert futures[0] is futures[2] and futures[0] is not futures[1]
+        invocations = read_invocations(store_log)
+        assert invocations[1] == ["store", a1, a2, "--name", "run_a", "--url", "localhost:8001/Default"]
+        assert invocations[2] == ["store", b, "--name", "run_a", "--url", "localhost:8001/Other"]
+
+    def test_identical_results_are_stored_once(self, tmp_path, store_log):
+        first = make_result(tmp_path / "first" / "report.plist", "same")
+        copy = make_result(tmp_path / "copy" / "report.plist", "same")
+        with StoreQueue() as queue:
+            future = queue.submit(os.path.dirname(first), "run")
+            assert queue.submit(os.path.dirname(copy), "run") is future
+            assert future.result()
+            queue.submit(os.path.dirname(copy), "other_run").result()
+            queue.submit(make_result(tmp_path / "changed" / "report.plist", "changed"), "run").result()
+        assert [invocation[3] for invocation in read_invocations(store_log)] == ["run", "other_run", "run"]
+
+    def test_failed_store_is_retried_with_backoff(self, tmp_path, store_log, monkeypatch):
+        sleeps = []
+        monkeypatch.setattr(store_queue.time, "sleep", sleeps.append)
+        monkeypatch.setenv("STORE_FAILURES", "2")
+        with StoreQueue(retries=3, backoff_seconds=5) as queue:
+            assert queue.submit(make_result(tmp_path / "a.plist", "a"), "run").result()
+            assert queue.get_failed_runs() == []
+        assert len(read_invocations(store_log)) == 3
+        assert sleeps == [5, 10]
+
+    def test_runs_failing_every_attempt_are_reported(self, tmp_path, store_log, monkeypatch):
+        monkeypatch.setenv("STORE_FAILURES", "100")
+        with StoreQueue(retries=2, backoff_seconds=0) as queue:
+            queue.submit(make_result(tmp_path / "a.plist", "a"), "run_b")
+            queue.submit(make_result(tmp_path / "b.plist", "b"), "run_a")
+            assert queue.get_failed_runs() == ["run_a", "run_b"]
+        assert len(read_invocations(store_log)) == 6
+
+    def test_missing_binary_counts_as_failure(self, tmp_path, store_log, monkeypatch):
+        monkeypatch.setattr(codechecker_interface, "CODECHECKER_MAINSCRIPT_PATH", str(tmp_path / "missing"))
+        with StoreQueue(retries=1, backoff_seconds=0) as queue:
+            assert not queue.submit(make_result(tmp_path / "a.plist", "a"), "run").result()
+            assert queue.get_failed_runs() == ["run"]